@@ -228,10 +228,37 @@ SESSION_COOKIE_AGE = 3600  # 1 hour
 # Stock Market API Configuration
 STOCK_API_SETTINGS = {
     'TIINGO_API_TOKEN': config('TIINGO_API_TOKEN', default=''),
+    'TIINGO_BASE_URL': config('TIINGO_BASE_URL', default='https://api.tiingo.com'),
     'ALPHA_VANTAGE_API_KEY': config('ALPHA_VANTAGE_API_KEY', default=''),
     'FINNHUB_API_KEY': config('FINNHUB_API_KEY', default=''),
-    'CACHE_TIMEOUT': 300,  # 5 minutes
-    'MAX_REQUESTS_PER_MINUTE': 60,
+    'CACHE_TIMEOUT': 300,  # 5 minutes; quotes and history are fresh for this long
+    'CACHE_HARD_TIMEOUT': 1800,  # Stale entries are served (and refreshed in the background) until this age
+    'FUNDAMENTALS_CACHE_TIMEOUT': 86400,  # Company metadata changes rarely; keep it for a day
+    'MAX_REQUESTS_PER_MINUTE': 60,  # Token-bucket budget per provider
+    'PROVIDER_TIMEOUT': 5,  # Seconds per upstream HTTP call
+    'CIRCUIT_BREAKER_FAILURES': 5,  # Consecutive failures before a provider is skipped
+    'CIRCUIT_BREAKER_RESET_TIMEOUT': 30,  # Seconds before a skipped provider is retried
+    'NEGATIVE_CACHE_TIMEOUT': 60,  # Seconds to remember symbols that failed to load
+    'QUOTE_CACHE_ALIAS': 'quotes',  # Shared L2 cache for quotes
+    'QUOTE_CACHE_VERSION': 2,  # Bump to invalidate every cached quote
+    'L1_CACHE_MAX_ENTRIES': 1024,  # In-process LRU size
+    'L1_CACHE_TIMEOUT': 5,  # Max seconds a worker serves its own copy of a shared entry
+    'BAR_STORE_DIR': BASE_DIR / 'data' / 'bars',  # Persistent OHLCV history files
+    'SINGLE_FLIGHT_LOCK_DIR': BASE_DIR / 'cache' / 'locks',  # Per-key lock files coalescing quote loads across worker processes
+    'PRICE_FLUSH_INTERVAL': 2,  # Seconds between write-behind flushes of changed quotes (0 writes through)
+    'PRICE_FLUSH_MAX_PENDING': 500,  # Flush early once this many rows are buffered
+    'INDICATOR_CACHE_TIMEOUT': 86400,  # Indicator series are extended incrementally as bars arrive
+    'ORDER_FILL_WORKERS': 1,  # Threads executing triggered limit/stop orders (0 fills on the quote thread)
+    'AUTOCOMPLETE_MAX_AGE': 300,  # Seconds before the typeahead index is rebuilt in the background
+    'STREAM_POLL_INTERVAL': 1,  # Seconds between the price broadcaster's checks for changed quotes
+    'STREAM_HEARTBEAT': 15,  # Seconds between keep-alive comments on idle price streams
+    'STREAM_MAX_AGE': 300,  # Seconds before a price stream is closed and the browser reconnects
+    'MAX_CONCURRENT_REQUESTS': 8,  # Thread pool size for batched quote fetches
+    'ASYNC_MAX_CONCURRENT_REQUESTS': 100,  # Open connections per event loop for async Tiingo fetches
+    'EMAIL_OUTBOX_INTERVAL': 5,  # Seconds between outbox sends by the in-process worker (None: only send_outbox)
+    'EMAIL_OUTBOX_BATCH_SIZE': 100,  # Emails sent per SMTP connection
+    'EMAIL_OUTBOX_MAX_ATTEMPTS': 5,  # Tries before an email is marked FAILED
+    'EMAIL_OUTBOX_RETRY_DELAY': 30,  # Seconds before the first retry; doubles on each further attempt
 }
 
 # Cache Configuration
@@ -239,7 +266,18 @@ CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    # Shared by every worker process on the host (L2 of the quote cache)
+    'quotes': {
+        'BACKEND': 'stocks.cache_backends.QuoteFileCache',
+        'LOCATION': BASE_DIR / 'cache' / 'quotes',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+            'CULL_FREQUENCY': 4,  # Drop a quarter of the entries when full
+            'CULL_INTERVAL': 60,  # Seconds between directory scans for culling (FileBasedCache scans on every set)
+        },
+    },
 }
 
 # Rate Limiting
@@ -1,9 +1,11 @@
 from django.contrib import admin
 
 # Register your models here.
-from  .models import Stocks , UserInfo ,  UserStock
+from  .models import Stocks , UserInfo ,  UserStock , Order , EmailOutbox
 
 
 admin.site.register(Stocks)
 admin.site.register(UserInfo)
-admin.site.register(UserStock)
\ No newline at end of file
+admin.site.register(UserStock)
+admin.site.register(Order)
+admin.site.register(EmailOutbox)
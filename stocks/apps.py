@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class StocksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stocks'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # Subscribes the order book to quote updates
+        from . import orders  # noqa: F401
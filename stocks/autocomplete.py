@@ -0,0 +1,340 @@
+"""
+In-process typeahead index over stock tickers and names.
+
+A prefix trie answers "starts with" lookups on the ticker and on every word
+of the normalized company name; each trie node keeps its best few matches
+precomputed, so a lookup is one walk down the trie. Multi-word queries start
+from the rarest term and check the other terms against each candidate's own
+words, since the capped trie lists of common prefixes can't be intersected.
+When prefixes don't fill the result list, a symmetric-delete index over the
+same keys adds typo-tolerant matches.
+
+The index is built from one query on first use, extended in place when a
+stock is saved (see signals.py), and rebuilt in the background once it is
+older than AUTOCOMPLETE_MAX_AGE so rows added by other processes show up.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Max
+
+from .models import Stocks
+
+logger = logging.getLogger(__name__)
+
+# Legal-form words that add noise to name matching
+NAME_STOPWORDS = {'inc', 'corp', 'corporation', 'co', 'company', 'ltd', 'plc', 'llc', 'lp', 'sa', 'ag', 'nv', 'the'}
+
+
+def normalize_name(name: str) -> List[str]:
+    """Lowercase a company name and split it into searchable words"""
+    words = re.findall(r'[a-z0-9]+', name.lower())
+    return [word for word in words if word not in NAME_STOPWORDS] or words
+
+
+def levenshtein(a: str, b: str) -> int:
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+class PrefixTrie:
+    """
+    Trie flattened into a dict from every prefix to the ``top_k`` best-ranked
+    ids below it, so a lookup is a single dict probe.
+    """
+
+    def __init__(self, top_k: int = 20):
+        self.top_k = top_k
+        self.nodes: Dict[str, List[Tuple[Tuple, int]]] = {}
+
+    def insert(self, key: str, item_id: int, rank: Tuple):
+        entry = (rank, item_id)
+        for end in range(1, len(key) + 1):
+            top = self.nodes.setdefault(key[:end], [])
+            if len(top) >= self.top_k and entry >= top[-1]:
+                continue
+            if any(existing_id == item_id for _, existing_id in top):
+                continue
+            bisect.insort(top, entry)
+            del top[self.top_k:]
+
+    def bulk_load(self, entries):
+        """Build from (key, item_id, rank) tuples; much faster than repeated insert()"""
+        nodes = {}
+        for key, item_id, rank in entries:
+            entry = (rank, item_id)
+            for end in range(1, len(key) + 1):
+                nodes.setdefault(key[:end], []).append(entry)
+        for prefix, top in nodes.items():
+            top.sort()
+            # An id can reach a prefix through several keys; keep its best rank
+            seen = set()
+            nodes[prefix] = [entry for entry in top if not (entry[1] in seen or seen.add(entry[1]))][:self.top_k]
+        self.nodes = nodes
+
+    def lookup(self, prefix: str) -> List[int]:
+        return [item_id for _, item_id in self.nodes.get(prefix, ())]
+
+    def discard(self, prefix: str, item_id: int) -> bool:
+        """Drop ``item_id`` from the prefix's list; True if the list was full and may now be missing ids"""
+        top = self.nodes.get(prefix)
+        if not top or all(existing_id != item_id for _, existing_id in top):
+            return False
+        full = len(top) >= self.top_k
+        top[:] = [entry for entry in top if entry[1] != item_id]
+        if not top:
+            del self.nodes[prefix]
+        return full
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    """Every string reachable from ``word`` by deleting up to ``distance`` characters"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+class DeletionIndex:
+    """
+    Symmetric-delete index for edit-distance lookups.
+
+    Each key is stored under every variant obtained by deleting up to
+    ``max_distance`` characters; a query looks up its own delete variants and
+    verifies the few candidates with a real edit distance. Unlike a BK-tree,
+    lookup cost doesn't grow with the number of keys.
+    """
+
+    def __init__(self, max_distance: int = 2):
+        self.max_distance = max_distance
+        self.variants: Dict[str, Set[str]] = {}
+
+    def add(self, word: str):
+        for variant in _deletes(word, self.max_distance):
+            self.variants.setdefault(variant, set()).add(word)
+
+    def search(self, word: str, max_distance: int) -> List[Tuple[int, str]]:
+        candidates = set()
+        for variant in _deletes(word, min(max_distance, self.max_distance)):
+            candidates |= self.variants.get(variant, set())
+        results = []
+        for candidate in candidates:
+            distance = levenshtein(word, candidate)
+            if distance <= max_distance:
+                results.append((distance, candidate))
+        return sorted(results)
+
+
+class AutocompleteIndex:
+    """Ticker/name suggestions answered entirely from memory"""
+
+    def __init__(self, max_age: Optional[float] = 300, top_k: int = 20):
+        self.max_age = max_age
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._rebuilding = False
+        self._built_at = None
+        self._signature_at_build = None
+        self._reset()
+
+    def _reset(self):
+        self.items: Dict[int, Tuple[str, str]] = {}
+        self.trie = PrefixTrie(self.top_k)
+        self.fuzzy = DeletionIndex()
+        self.words: Dict[str, Set[int]] = {}
+        self.sorted_keys: List[str] = []
+
+    def _load(self):
+        return list(Stocks.objects.filter(is_active=True).values_list('id', 'ticker', 'name'))
+
+    def _signature(self):
+        return Stocks.objects.filter(is_active=True).aggregate(count=Count('id'), last_id=Max('id'))
+
+    def build(self):
+        """(Re)build the whole index from the database"""
+        signature = self._signature()
+        rows = self._load()
+        fresh = AutocompleteIndex(self.max_age, self.top_k)
+        trie_entries = []
+        for item_id, ticker, name in rows:
+            trie_entries.extend(fresh._add(item_id, ticker, name, index_prefixes=False))
+        fresh.trie.bulk_load(trie_entries)
+        fresh.sorted_keys = sorted(fresh.words)
+
+        with self._lock:
+            self.items, self.trie, self.fuzzy, self.words = fresh.items, fresh.trie, fresh.fuzzy, fresh.words
+            self.sorted_keys = fresh.sorted_keys
+            self._signature_at_build = signature
+            self._built_at = time.monotonic()
+        logger.info(f"Built autocomplete index over {len(rows)} stocks")
+
+    def add(self, item_id: int, ticker: str, name: str):
+        """Add or update one stock in place"""
+        if self._built_at is None:
+            return  # Picked up by the lazy first build
+        with self._lock:
+            current = self.items.get(item_id)
+            if current == (ticker, name):
+                return
+            if current is not None:
+                # Renamed: old keys would linger in the trie, so rebuild soon
+                self._built_at = 0
+            self._add(item_id, ticker, name)
+
+    def remove(self, item_id: int):
+        with self._lock:
+            if item_id not in self.items:
+                return
+            keys = self._keys(item_id)
+            del self.items[item_id]
+            for key in keys:
+                ids = self.words.get(key)
+                if ids is None:
+                    continue
+                ids.discard(item_id)
+                if not ids:
+                    del self.words[key]
+                    position = bisect.bisect_left(self.sorted_keys, key)
+                    if position < len(self.sorted_keys) and self.sorted_keys[position] == key:
+                        del self.sorted_keys[position]
+
+            for prefix in {key[:end] for key in keys for end in range(1, len(key) + 1)}:
+                if self.trie.discard(prefix, item_id):
+                    # A full list dropped an entry: the next-best id was cut off by the cap, refill it
+                    ranked = sorted((self._rank(other, prefix), other) for other in self._prefix_ids(prefix))
+                    if ranked:
+                        self.trie.nodes[prefix] = ranked[:self.top_k]
+
+    def _add(self, item_id: int, ticker: str, name: str, index_prefixes: bool = True):
+        ticker_key = ticker.lower()
+        words = normalize_name(name)
+        self.items[item_id] = (ticker, name)
+
+        # Tickers before name words, shorter tickers first ("A", "AA", "AAPL")
+        entries = [(ticker_key, item_id, (0, len(ticker_key), ticker_key))]
+        entries += [(word, item_id, (1, position, len(words), ticker_key)) for position, word in enumerate(words)]
+        if index_prefixes:
+            for key, entry_id, rank in entries:
+                self.trie.insert(key, entry_id, rank)
+
+        for key in [ticker_key] + words:
+            if key not in self.words:
+                self.fuzzy.add(key)
+                if index_prefixes:
+                    bisect.insort(self.sorted_keys, key)
+            self.words.setdefault(key, set()).add(item_id)
+        return entries
+
+    def _keys(self, item_id: int) -> List[str]:
+        ticker, name = self.items[item_id]
+        return [ticker.lower()] + normalize_name(name)
+
+    def _matches(self, item_id: int, terms: List[str]) -> bool:
+        """Whether every term prefixes the item's ticker or one of its name words"""
+        if item_id not in self.items:
+            return False
+        keys = self._keys(item_id)
+        return all(any(key.startswith(term) for key in keys) for term in terms)
+
+    def _rank(self, item_id: int, term: str) -> Tuple:
+        """The trie rank of the item's best key starting with ``term``"""
+        ticker_key, *words = self._keys(item_id)
+        if ticker_key.startswith(term):
+            return (0, len(ticker_key), ticker_key)
+        position = next(position for position, word in enumerate(words) if word.startswith(term))
+        return (1, position, len(words), ticker_key)
+
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        """Every id with a key starting with ``prefix``; unlike the trie, not capped at top_k"""
+        ids = set()
+        for position in range(bisect.bisect_left(self.sorted_keys, prefix), len(self.sorted_keys)):
+            key = self.sorted_keys[position]
+            if not key.startswith(prefix):
+                break
+            ids |= self.words[key]
+        return ids
+
+    def _ensure_built(self):
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self.build()
+        elif self.max_age is not None and time.monotonic() - self._built_at > self.max_age:
+            with self._rebuild_lock:
+                if self._rebuilding:
+                    return
+                self._rebuilding = True
+            threading.Thread(target=self._background_build, daemon=True).start()
+
+    def _background_build(self):
+        try:
+            # Only pay for a rebuild when rows were added or removed elsewhere
+            if self._built_at == 0 or self._signature() != self._signature_at_build:
+                self.build()
+            else:
+                self._built_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Autocomplete rebuild failed: {str(e)}")
+        finally:
+            with self._rebuild_lock:
+                self._rebuilding = False
+            close_old_connections()
+
+    def suggest(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` {'symbol', 'name'} suggestions, best first"""
+        self._ensure_built()
+        terms = re.findall(r'[a-z0-9]+', query.lower())
+        if not terms:
+            return []
+
+        # Every term must prefix-match the ticker or a name word
+        if len(terms) == 1:
+            matches = self.trie.lookup(terms[0])
+        else:
+            # A trie list shorter than top_k holds every match for its prefix,
+            # so the shortest such list is the rarest term's complete set.
+            # When every term is common, scan the keys under the longest one.
+            complete = [ids for ids in map(self.trie.lookup, terms) if len(ids) < self.top_k]
+            if complete:
+                matches = min(complete, key=len)
+            else:
+                rarest = max(terms, key=len)
+                candidates = [item_id for item_id in self._prefix_ids(rarest) if self._matches(item_id, terms)]
+                matches = sorted(candidates, key=lambda item_id: self._rank(item_id, rarest))
+        results = [item_id for item_id in matches if self._matches(item_id, terms)]
+
+        if len(results) < limit and len(terms[-1]) >= 4:
+            max_distance = 1 if len(terms[-1]) <= 5 else 2
+            seen = set(results)
+            for _, word in self.fuzzy.search(terms[-1], max_distance):
+                for item_id in sorted(self.words.get(word, ())):
+                    # The earlier terms still have to match as prefixes
+                    if item_id not in seen and self._matches(item_id, terms[:-1]):
+                        seen.add(item_id)
+                        results.append(item_id)
+
+        return [
+            {'symbol': self.items[item_id][0], 'name': self.items[item_id][1]}
+            for item_id in results[:limit]
+        ]
+
+
+autocomplete_index = AutocompleteIndex(
+    max_age=getattr(settings, 'STOCK_API_SETTINGS', {}).get('AUTOCOMPLETE_MAX_AGE', 300),
+)
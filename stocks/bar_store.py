@@ -0,0 +1,165 @@
+"""
+Persistent OHLCV bar store backing StockDataService.get_stock_history.
+
+Bars for each (interval, symbol) live in one flat binary file of fixed-size
+records sorted by timestamp, so refreshes only append the missing tail and a
+date-range read is a binary search plus a slice of a memory-mapped file. A
+small JSON sidecar records how far back the series has been downloaded.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+BAR_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+FRAME_COLUMNS = {'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume'}
+
+
+class BarStore:
+    """Append-only, memory-mapped OHLCV files per symbol and interval"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    def _path(self, symbol: str, interval: str) -> Path:
+        return self.root / interval / f"{symbol.upper()}.bin"
+
+    def _meta_path(self, symbol: str, interval: str) -> Path:
+        return self.root / interval / f"{symbol.upper()}.json"
+
+    def _locked(self, path: Path):
+        return _FileLock(path.with_suffix('.lock'), self._lock)
+
+    def read(self, symbol: str, interval: str = '1d', start: Optional[int] = None,
+             end: Optional[int] = None) -> np.ndarray:
+        """Return bars with start <= ts < end (epoch seconds) as a memory-mapped slice"""
+        path = self._path(symbol, interval)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return np.empty(0, dtype=BAR_DTYPE)
+
+        count = size // BAR_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=BAR_DTYPE)
+
+        bars = np.memmap(path, dtype=BAR_DTYPE, mode='r', shape=(count,))
+        lo = int(np.searchsorted(bars['ts'], start, side='left')) if start is not None else 0
+        hi = int(np.searchsorted(bars['ts'], end, side='left')) if end is not None else count
+        return bars[lo:hi]
+
+    def tail(self, symbol: str, interval: str = '1d', count: int = 1) -> np.ndarray:
+        """Return the last ``count`` bars"""
+        bars = self.read(symbol, interval)
+        return bars[-count:] if count else bars[:0]
+
+    def last_timestamp(self, symbol: str, interval: str = '1d') -> Optional[int]:
+        bars = self.tail(symbol, interval)
+        return int(bars['ts'][0]) if len(bars) else None
+
+    def covered_from(self, symbol: str, interval: str = '1d') -> Optional[int]:
+        """Earliest timestamp the stored series has been downloaded from"""
+        try:
+            with open(self._meta_path(symbol, interval)) as f:
+                return json.load(f).get('start')
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write(self, symbol: str, interval: str, bars: np.ndarray, start: int):
+        """Replace the stored series, e.g. after backfilling an older range"""
+        path = self._path(symbol, interval)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        bars = np.sort(np.asarray(bars, dtype=BAR_DTYPE), order='ts')
+
+        with self._locked(path):
+            tmp_path = path.with_suffix('.tmp')
+            bars.tofile(tmp_path)
+            os.replace(tmp_path, path)
+            with open(self._meta_path(symbol, interval), 'w') as f:
+                json.dump({'start': int(start)}, f)
+
+    def append(self, symbol: str, interval: str, bars: np.ndarray) -> int:
+        """
+        Append bars newer than the stored tail and return how many were added.
+
+        A bar with the same timestamp as the last stored one replaces it, so a
+        partially formed bar (today's daily bar) is updated in place.
+        """
+        path = self._path(symbol, interval)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        bars = np.sort(np.asarray(bars, dtype=BAR_DTYPE), order='ts')
+
+        with self._locked(path):
+            last_ts = self.last_timestamp(symbol, interval)
+            with open(path, 'r+b' if path.exists() else 'wb') as f:
+                if last_ts is not None:
+                    bars = bars[bars['ts'] >= last_ts]
+                    if len(bars) and bars['ts'][0] == last_ts:
+                        f.seek(-BAR_DTYPE.itemsize, os.SEEK_END)
+                        f.write(bars[:1].tobytes())
+                        bars = bars[1:]
+                f.seek(0, os.SEEK_END)
+                f.write(bars.tobytes())
+        return len(bars)
+
+    @staticmethod
+    def from_frame(frame: pd.DataFrame) -> np.ndarray:
+        """Convert a yfinance history frame into bar records"""
+        frame = frame.dropna(subset=['Close'])
+        index = pd.DatetimeIndex(frame.index)
+        if index.tz is None:
+            index = index.tz_localize('UTC')
+
+        bars = np.empty(len(frame), dtype=BAR_DTYPE)
+        bars['ts'] = ((index.tz_convert('UTC') - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(dtype='i8')
+        for field, column in FRAME_COLUMNS.items():
+            bars[field] = frame[column].to_numpy(dtype='f8') if column in frame else 0.0
+        return bars
+
+    @staticmethod
+    def to_frame(bars: np.ndarray) -> pd.DataFrame:
+        """Convert bar records into a frame shaped like yfinance history"""
+        index = pd.DatetimeIndex(pd.to_datetime(bars['ts'], unit='s', utc=True), name='Date')
+        return pd.DataFrame({column: np.asarray(bars[field]) for field, column in FRAME_COLUMNS.items()},
+                            index=index)
+
+
+class _FileLock:
+    """Exclusive lock across threads and, where fcntl exists, processes"""
+
+    def __init__(self, path: Path, thread_lock: threading.Lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self.handle = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self.handle = open(self.path, 'a')
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+        self.thread_lock.release()
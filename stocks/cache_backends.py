@@ -0,0 +1,31 @@
+"""
+Cache backends for the shared quote cache.
+
+Django's FileBasedCache culls on every set(): it lists the whole cache
+directory to count the entries, so each quote write (and there is one per
+quote fetched) costs O(number of cached files). QuoteFileCache counts at
+most once per CULL_INTERVAL seconds per process instead; between culls the
+directory can only outgrow MAX_ENTRIES by the writes made in that interval.
+"""
+import threading
+import time
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class QuoteFileCache(FileBasedCache):
+    """FileBasedCache with time-throttled culling"""
+
+    def __init__(self, dir, params):
+        options = dict(params.get('OPTIONS') or {})
+        self.cull_interval = float(options.pop('CULL_INTERVAL', 60))
+        super().__init__(dir, {**params, 'OPTIONS': options})
+        self._cull_lock = threading.Lock()
+        self._next_cull = 0.0
+
+    def _cull(self):
+        with self._cull_lock:
+            now = time.monotonic()
+            if now < self._next_cull:
+                return
+            self._next_cull = now + self.cull_interval
+        super()._cull()
@@ -6,6 +6,12 @@ from django.db import connection
 from django.core.cache import cache
 from django.utils import timezone
 from stocks.models import Stocks
+from stocks.orders import order_manager
+from stocks.outbox import email_outbox
+from stocks.persistence import price_persister
+from stocks.streaming import price_broadcaster
+from stocks.services import stock_service
+from stocks.ws import market_data_hub
 import logging
 
 logger = logging.getLogger(__name__)
@@ -52,6 +58,36 @@ def health_check(request):
     except Exception as e:
         health_status['checks']['cache'] = f'unavailable: {str(e)}'
     
+    # Quote cache miss / coalescing statistics
+    try:
+        health_status['checks']['quote_cache'] = stock_service.get_cache_stats()
+    except Exception as e:
+        health_status['checks']['quote_cache'] = f'unavailable: {str(e)}'
+    
+    # Upstream data provider health
+    try:
+        provider_stats = stock_service.get_provider_stats()
+        health_status['checks']['providers'] = provider_stats
+        if any(stats['state'] != 'closed' for stats in provider_stats.values()) and health_status['status'] == 'healthy':
+            health_status['status'] = 'degraded'
+    except Exception as e:
+        health_status['checks']['providers'] = f'unavailable: {str(e)}'
+    
+    # Write-behind price persistence backlog
+    health_status['checks']['price_writes'] = price_persister.get_stats()
+    
+    # Resting limit/stop orders and fills
+    health_status['checks']['orders'] = order_manager.get_stats()
+    
+    # Connected price stream clients
+    health_status['checks']['price_stream'] = price_broadcaster.get_stats()
+    
+    # WebSocket market-data hub connections
+    health_status['checks']['ws_hub'] = market_data_hub.get_stats()
+    
+    # Outgoing email throughput and retries
+    health_status['checks']['email_outbox'] = email_outbox.get_stats()
+    
     # Return appropriate HTTP status
     if health_status['status'] == 'unhealthy':
         return JsonResponse(health_status, status=503)
@@ -0,0 +1,269 @@
+"""
+Vectorized technical indicators computed over stored price history.
+
+Every indicator works on whole NumPy/pandas series, never per-row Python
+loops. Results are cached per (symbol, interval, indicator, params) together
+with a small "anchor" state taken just before the last bar, so when new bars
+arrive only the bars after the anchor are computed and appended. Anchoring
+before the last bar also lets a partially formed bar be corrected.
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .quote_cache import quote_cache
+from .services import bar_store, stock_service
+
+
+def _seeded_ewm(values: np.ndarray, alpha: float, seed: Optional[float]) -> np.ndarray:
+    """Recursive EMA of ``values`` continuing from ``seed`` (or starting fresh)"""
+    if seed is None:
+        return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    series = pd.Series(np.concatenate(([seed], values)))
+    return series.ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+
+def _rolling_tail(closes: np.ndarray, count: int, window: int, fn) -> np.ndarray:
+    """Apply a rolling computation to the last ``count`` bars using only the bars it needs"""
+    lookback = closes[-(count + window):]
+    return fn(pd.Series(lookback)).to_numpy()[-count:]
+
+
+class Indicator:
+    """
+    Base class for an incrementally updatable indicator.
+
+    ``compute`` runs over a full close series. ``update`` receives the full
+    series plus the anchor state and returns outputs for the last ``count``
+    bars only. Both return (outputs, anchor_state), where the anchor state
+    describes the indicator just before the final bar.
+    """
+
+    name = ''
+    defaults: Dict[str, Any] = {}
+    outputs: List[str] = []
+
+    def __init__(self, **params):
+        self.params = {key: type(default)(params.get(key, default)) for key, default in self.defaults.items()}
+        if any(value <= 0 for value in self.params.values()):
+            raise ValueError(f"{self.name} parameters must be positive")
+
+    def compute(self, closes: np.ndarray):
+        return self.update(closes, None, len(closes))
+
+    def update(self, closes: np.ndarray, state: Optional[Dict[str, Any]], count: int):
+        raise NotImplementedError
+
+
+class SMA(Indicator):
+    name = 'sma'
+    defaults = {'window': 20}
+    outputs = ['sma']
+
+    def update(self, closes, state, count):
+        window = self.params['window']
+        values = _rolling_tail(closes, count, window, lambda s: s.rolling(window).mean())
+        return {'sma': values}, {}
+
+
+class EMA(Indicator):
+    name = 'ema'
+    defaults = {'span': 20}
+    outputs = ['ema']
+
+    def update(self, closes, state, count):
+        alpha = 2.0 / (self.params['span'] + 1)
+        values = _seeded_ewm(closes[-count:], alpha, state and state['ema'])
+        anchor = values[-2] if count > 1 else (state and state['ema'])
+        return {'ema': values}, {'ema': anchor}
+
+
+class RSI(Indicator):
+    """Relative strength index with Wilder smoothing"""
+
+    name = 'rsi'
+    defaults = {'period': 14}
+    outputs = ['rsi']
+
+    def update(self, closes, state, count):
+        alpha = 1.0 / self.params['period']
+        segment = closes[-(count + 1):] if len(closes) > count else np.concatenate(([closes[0]], closes))
+        deltas = np.diff(segment)
+        gains = _seeded_ewm(np.clip(deltas, 0, None), alpha, state and state['gain'])
+        losses = _seeded_ewm(np.clip(-deltas, 0, None), alpha, state and state['loss'])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.where(losses == 0, 100.0, 100.0 - 100.0 / (1.0 + gains / losses))
+        if state is None:
+            # Not enough history for a meaningful value yet
+            values[:self.params['period']] = np.nan
+
+        anchor = {'gain': gains[-2], 'loss': losses[-2]} if count > 1 else state
+        return {'rsi': values}, anchor
+
+
+class MACD(Indicator):
+    name = 'macd'
+    defaults = {'fast': 12, 'slow': 26, 'signal': 9}
+    outputs = ['macd', 'signal', 'histogram']
+
+    def update(self, closes, state, count):
+        segment = closes[-count:]
+        fast = _seeded_ewm(segment, 2.0 / (self.params['fast'] + 1), state and state['fast'])
+        slow = _seeded_ewm(segment, 2.0 / (self.params['slow'] + 1), state and state['slow'])
+        macd = fast - slow
+        signal = _seeded_ewm(macd, 2.0 / (self.params['signal'] + 1), state and state['signal'])
+
+        anchor = {'fast': fast[-2], 'slow': slow[-2], 'signal': signal[-2]} if count > 1 else state
+        return {'macd': macd, 'signal': signal, 'histogram': macd - signal}, anchor
+
+
+class BollingerBands(Indicator):
+    name = 'bollinger'
+    defaults = {'window': 20, 'num_std': 2.0}
+    outputs = ['middle', 'upper', 'lower']
+
+    def update(self, closes, state, count):
+        window = self.params['window']
+        middle = _rolling_tail(closes, count, window, lambda s: s.rolling(window).mean())
+        std = _rolling_tail(closes, count, window, lambda s: s.rolling(window).std(ddof=0))
+        width = self.params['num_std'] * std
+        return {'middle': middle, 'upper': middle + width, 'lower': middle - width}, {}
+
+
+class Volatility(Indicator):
+    """Rolling standard deviation of log returns, annualized"""
+
+    name = 'volatility'
+    defaults = {'window': 20, 'periods_per_year': 252}
+    outputs = ['volatility']
+
+    def update(self, closes, state, count):
+        window = self.params['window']
+        scale = np.sqrt(self.params['periods_per_year'])
+
+        def rolling_volatility(series):
+            return np.log(series).diff().rolling(window).std() * scale
+
+        values = _rolling_tail(closes, count, window + 1, rolling_volatility)
+        return {'volatility': values}, {}
+
+
+class MaxDrawdown(Indicator):
+    name = 'max_drawdown'
+    defaults = {}
+    outputs = ['drawdown', 'max_drawdown']
+
+    def update(self, closes, state, count):
+        segment = closes[-count:]
+        peak = state['peak'] if state else -np.inf
+        worst = state['max_drawdown'] if state else 0.0
+
+        peaks = np.maximum.accumulate(np.concatenate(([peak], segment)))[1:]
+        drawdown = segment / peaks - 1.0
+        max_drawdown = np.minimum.accumulate(np.concatenate(([worst], drawdown)))[1:]
+
+        anchor = {'peak': peaks[-2], 'max_drawdown': max_drawdown[-2]} if count > 1 else state
+        return {'drawdown': drawdown, 'max_drawdown': max_drawdown}, anchor
+
+
+INDICATORS = {cls.name: cls for cls in (SMA, EMA, RSI, MACD, BollingerBands, Volatility, MaxDrawdown)}
+
+
+class IndicatorService:
+    """Compute and incrementally maintain indicators for stored price history"""
+
+    def __init__(self, stock_service, bar_store, cache_timeout: int = 86400):
+        self.stock_service = stock_service
+        self.bar_store = bar_store
+        self.cache_timeout = cache_timeout
+
+    def get_indicators(self, symbol: str, requested: Dict[str, Dict[str, Any]],
+                       period: str = '1y', interval: str = '1d') -> Optional[Dict[str, Any]]:
+        """
+        Return {'timestamps', 'indicators'} for several indicators over one period.
+
+        ``requested`` maps indicator names to their parameters. Raises KeyError
+        for unknown indicators and ValueError for bad parameters.
+        """
+        symbol = symbol.upper()
+        indicators = [INDICATORS[name](**(params or {})) for name, params in requested.items()]
+
+        # Makes sure the store covers the period and is being kept up to date
+        history = self.stock_service.get_stock_history(symbol, period=period, interval=interval)
+        if history is None or history.empty:
+            return None
+        period_start = int((history.index[0] - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1))
+
+        cached = quote_cache.get_many([self._cache_key(symbol, interval, indicator) for indicator in indicators])
+        reads = {}
+        results = {}
+        timestamps = np.empty(0, dtype='i8')
+        for indicator in indicators:
+            key = self._cache_key(symbol, interval, indicator)
+            entry = cached.get(key)
+            series_start = entry['ts'][0] if entry and entry['ts'][0] <= period_start else period_start
+            if series_start not in reads:
+                bars = self.bar_store.read(symbol, interval, start=series_start)
+                reads[series_start] = (np.array(bars['ts']), np.array(bars['close']))
+
+            ts, closes = reads[series_start]
+            series = self._series(indicator, entry, ts, closes)
+            if series is not entry:
+                quote_cache.set(key, series, self.cache_timeout)
+
+            start = int(np.searchsorted(series['ts'], period_start))
+            results[indicator.name] = {
+                'params': indicator.params,
+                'values': {output: values[start:] for output, values in series['values'].items()},
+            }
+            timestamps = series['ts'][start:]
+
+        return {'timestamps': timestamps, 'indicators': results}
+
+    @staticmethod
+    def _cache_key(symbol: str, interval: str, indicator: Indicator) -> str:
+        params = ','.join(f"{key}={value}" for key, value in sorted(indicator.params.items()))
+        return f"indicator_{symbol}_{interval}_{indicator.name}_{params}"
+
+    def _series(self, indicator, entry, ts, closes):
+        """Reuse, extend or rebuild a cached series for the current bars"""
+        if entry and entry['ts'][0] == ts[0]:
+            if entry['last'] == (ts[-1], closes[-1]):
+                return entry
+
+            # Only safe to extend if the bar the state was anchored on is unchanged
+            anchor_ts, anchor_close = entry['anchor']
+            anchor = int(np.searchsorted(ts, anchor_ts))
+            if entry['state'] is not None and anchor < len(ts) - 1 and \
+                    ts[anchor] == anchor_ts and closes[anchor] == anchor_close:
+                keep = int(np.searchsorted(entry['ts'], anchor_ts)) + 1
+                values, state = indicator.update(closes, entry['state'], len(ts) - keep)
+                values = {
+                    output: np.concatenate((entry['values'][output][:keep], values[output]))
+                    for output in indicator.outputs
+                }
+                return self._entry(ts, closes, values, state)
+
+        values, state = indicator.compute(closes)
+        return self._entry(ts, closes, values, state)
+
+    @staticmethod
+    def _entry(ts, closes, values, state):
+        anchor = (ts[-2], closes[-2]) if len(ts) > 1 else (None, None)
+        return {
+            'ts': ts,
+            'values': values,
+            'state': state if len(ts) > 1 else None,
+            'anchor': anchor,
+            'last': (ts[-1], closes[-1]),
+        }
+
+
+indicator_service = IndicatorService(
+    stock_service,
+    bar_store,
+    cache_timeout=getattr(settings, 'STOCK_API_SETTINGS', {}).get('INDICATOR_CACHE_TIMEOUT', 86400),
+)
@@ -0,0 +1,79 @@
+"""
+Django management command that measures order book matching cost.
+
+Fills an in-memory OrderBook with resting limit and stop orders spread
+around each symbol's price, then replays a random walk of price ticks and
+reports the time spent matching per tick. Nothing touches the database.
+"""
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from stocks.orders import OrderBook
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-tick matching time of the in-memory limit/stop order book'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=100000,
+            help='Number of resting orders',
+        )
+        parser.add_argument(
+            '--symbols',
+            type=int,
+            default=100,
+            help='Number of symbols the orders are spread over',
+        )
+        parser.add_argument(
+            '--ticks',
+            type=int,
+            default=100000,
+            help='Number of price ticks to replay',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed for a reproducible run',
+        )
+
+    def handle(self, *args, **options):
+        """Main command handler"""
+        if min(options['orders'], options['symbols'], options['ticks']) < 1:
+            raise CommandError("--orders, --symbols and --ticks must all be positive")
+
+        rng = random.Random(options['seed'])
+        prices = {f'SYM{i}': 100.0 for i in range(options['symbols'])}
+        symbols = list(prices)
+
+        book = OrderBook()
+        started = time.perf_counter()
+        for order_id in range(options['orders']):
+            symbol = rng.choice(symbols)
+            # Triggers within +/-20% of the price, so a random walk keeps crossing some
+            book.add(order_id, symbol, round(prices[symbol] * rng.uniform(0.8, 1.2), 2), rng.random() < 0.5)
+        load_seconds = time.perf_counter() - started
+        self.stdout.write(f"Loaded {len(book)} orders in {load_seconds:.2f}s")
+
+        timings = []
+        triggered = 0
+        for _ in range(options['ticks']):
+            symbol = rng.choice(symbols)
+            prices[symbol] = round(prices[symbol] * (1 + rng.gauss(0, 0.002)), 2)
+            started = time.perf_counter()
+            triggered += len(book.crossed(symbol, prices[symbol]))
+            timings.append(time.perf_counter() - started)
+
+        timings = sorted(seconds * 1e6 for seconds in timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            f"{len(timings)} ticks, {triggered} orders triggered, {len(book)} still resting"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Matching per tick: mean={statistics.fmean(timings):.1f}us "
+            f"median={statistics.median(timings):.1f}us p99={p99:.1f}us max={timings[-1]:.1f}us"
+        ))
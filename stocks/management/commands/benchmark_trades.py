@@ -0,0 +1,187 @@
+"""
+Django management command that load-tests the trade execution path.
+
+Creates throwaway traders and stocks, fires a random mix of buy and sell
+orders at trade_service from several threads, reports the sustained
+orders/sec and latency, then replays the recorded transactions to verify that
+every position is exactly what the history says it should be.
+"""
+import random
+import statistics
+import threading
+import time
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from stocks.management.commands.rebuild_positions import Command as RebuildPositions
+from stocks.models import Stocks, Transaction, UserStock
+from stocks.trading import TradeError, trade_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+BENCH_USER_PREFIX = 'bench_trader_'
+BENCH_TICKER_PREFIX = 'ZZBENCH'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent trade execution and verify positions stay consistent'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--orders',
+            type=int,
+            default=2000,
+            help='Total number of orders to submit',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='Number of concurrent order threads',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=10,
+            help='Number of benchmark traders',
+        )
+        parser.add_argument(
+            '--stocks',
+            type=int,
+            default=3,
+            help='Number of benchmark stocks; fewer stocks means more contention per position',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed for a reproducible order mix',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the benchmark users, stocks and trades afterwards',
+        )
+
+    def handle(self, *args, **options):
+        """Main command handler"""
+        if min(options['orders'], options['threads'], options['users'], options['stocks']) < 1:
+            raise CommandError("--orders, --threads, --users and --stocks must all be positive")
+
+        self.cleanup()
+        users, stocks = self.setup(options['users'], options['stocks'])
+        rng = random.Random(options['seed'])
+        orders = [
+            (rng.choice(users), rng.choice(stocks), 'BUY' if rng.random() < 0.6 else 'SELL', rng.randint(1, 10))
+            for _ in range(options['orders'])
+        ]
+
+        try:
+            results, elapsed = self.run(orders, options['threads'])
+            self.summarize(results, elapsed, options['threads'])
+            mismatches = self.verify(users)
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+        if mismatches:
+            raise CommandError(f"{mismatches} positions differ from their transaction history")
+        self.stdout.write(self.style.SUCCESS("All positions match their transaction history"))
+
+    def setup(self, user_count, stock_count):
+        users = [
+            User.objects.create_user(f'{BENCH_USER_PREFIX}{i}', f'{BENCH_USER_PREFIX}{i}@example.com')
+            for i in range(user_count)
+        ]
+        stocks = [
+            Stocks.objects.create(
+                ticker=f'{BENCH_TICKER_PREFIX}{i}',
+                name=f'Benchmark Stock {i}',
+                curr_price=Decimal('100.00') + i,
+                is_active=False,
+            )
+            for i in range(stock_count)
+        ]
+        return users, stocks
+
+    def cleanup(self):
+        # Positions and transactions go with the users
+        User.objects.filter(username__startswith=BENCH_USER_PREFIX).delete()
+        Stocks.objects.filter(ticker__startswith=BENCH_TICKER_PREFIX).delete()
+
+    def run(self, orders, thread_count):
+        """Execute the orders across ``thread_count`` threads; return (results, seconds)"""
+        results = []
+        lock = threading.Lock()
+
+        def worker(chunk):
+            local = []
+            try:
+                for user, stock, side, quantity in chunk:
+                    started = time.perf_counter()
+                    try:
+                        if side == 'BUY':
+                            trade_service.buy(user, stock, quantity)
+                        else:
+                            trade_service.sell(user, stock, quantity)
+                        outcome = 'filled'
+                    except TradeError:
+                        outcome = 'rejected'
+                    except Exception as e:
+                        logger.error(f"Benchmark order failed: {str(e)}")
+                        outcome = 'error'
+                    local.append((outcome, time.perf_counter() - started))
+            finally:
+                with lock:
+                    results.extend(local)
+                if threading.current_thread() is not threading.main_thread():
+                    connection.close()
+
+        chunks = [orders[i::thread_count] for i in range(thread_count)]
+        started = time.perf_counter()
+        if thread_count == 1:
+            worker(chunks[0])
+        else:
+            threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return results, time.perf_counter() - started
+
+    def summarize(self, results, elapsed, thread_count):
+        counts = {outcome: 0 for outcome in ('filled', 'rejected', 'error')}
+        for outcome, _ in results:
+            counts[outcome] += 1
+        latencies = sorted(seconds * 1000 for _, seconds in results)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+        self.stdout.write(
+            f"{len(results)} orders on {thread_count} threads in {elapsed:.2f}s: "
+            f"{len(results) / elapsed:.0f} orders/sec"
+        )
+        self.stdout.write(
+            f"filled={counts['filled']} rejected={counts['rejected']} errors={counts['error']} "
+            f"latency median={statistics.median(latencies):.1f}ms p95={p95:.1f}ms"
+        )
+
+    def verify(self, users):
+        """Replay each trader's transactions and count positions that disagree"""
+        rebuild = RebuildPositions(stdout=self.stdout, stderr=self.stderr)
+        transactions = Transaction.objects.filter(user__in=users).order_by('user_id', 'date', 'id')
+        expected = rebuild.replay(transactions)
+        current = {
+            (position.user_id, position.stock.ticker): position
+            for position in UserStock.objects.filter(user__in=users).select_related('stock')
+        }
+
+        mismatches = 0
+        for key in set(expected) | set(current):
+            position, rebuilt = current.get(key), expected.get(key)
+            if position is None or rebuilt is None or rebuild.differs(position, rebuilt):
+                rebuild.report(key, position, rebuilt)
+                mismatches += 1
+        self.stdout.write(f"Verified {len(current)} positions against {transactions.count()} transactions")
+        return mismatches
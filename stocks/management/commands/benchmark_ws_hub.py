@@ -0,0 +1,178 @@
+"""
+Django management command that load-tests the WebSocket market-data hub.
+
+Connects many in-process clients straight to the hub's ASGI callable (no
+network, no login), subscribes each to a few random symbols, and drives a
+fake price feed thread at a fixed rate. A fraction of the clients are slow
+to accept frames, so coalescing under backpressure shows up in the
+delivered/offered ratio. Nothing touches the database.
+"""
+import asyncio
+import json
+import random
+import resource
+import statistics
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from stocks.streaming import PriceBroadcaster
+from stocks.ws import MarketDataHub
+
+
+class Command(BaseCommand):
+    help = 'Benchmark fan-out of the WebSocket market-data hub with many concurrent subscribers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clients',
+            type=int,
+            default=10000,
+            help='Number of concurrent WebSocket clients',
+        )
+        parser.add_argument(
+            '--symbols',
+            type=int,
+            default=500,
+            help='Number of symbols in the fake feed',
+        )
+        parser.add_argument(
+            '--per-client',
+            type=int,
+            default=10,
+            help='Symbols each client subscribes to',
+        )
+        parser.add_argument(
+            '--rate',
+            type=int,
+            default=2000,
+            help='Price updates per second published by the fake feed',
+        )
+        parser.add_argument(
+            '--seconds',
+            type=float,
+            default=10,
+            help='How long to run the feed',
+        )
+        parser.add_argument(
+            '--slow-fraction',
+            type=float,
+            default=0.1,
+            help='Fraction of clients that take --slow-delay to accept each frame',
+        )
+        parser.add_argument(
+            '--slow-delay',
+            type=float,
+            default=0.5,
+            help='Seconds a slow client takes per frame',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed for a reproducible run',
+        )
+
+    def handle(self, *args, **options):
+        """Main command handler"""
+        if min(options['clients'], options['symbols'], options['per_client'], options['rate']) < 1:
+            raise CommandError("--clients, --symbols, --per-client and --rate must all be positive")
+        if options['per_client'] > options['symbols']:
+            raise CommandError("--per-client cannot exceed --symbols")
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        rng = random.Random(options['seed'])
+        symbols = [f'SYM{i}' for i in range(options['symbols'])]
+        hub = MarketDataHub(PriceBroadcaster(poll_interval=0), require_login=False,
+                            max_symbols=options['per_client'], load_quotes=lambda missing: [])
+
+        latencies = []
+        delivered = {'frames': 0, 'quotes': 0}
+        watchers = dict.fromkeys(symbols, 0)
+
+        def client_send(slow):
+            async def send(message):
+                if message['type'] != 'websocket.send':
+                    return
+                received = time.perf_counter()
+                data = json.loads(message['text'])['data']
+                delivered['frames'] += 1
+                delivered['quotes'] += len(data)
+                stamps = [fields['t'] for fields in data.values() if fields.get('t')]
+                if stamps:
+                    latencies.append(received - max(stamps))
+                if slow:
+                    await asyncio.sleep(options['slow_delay'])
+            return send
+
+        started = time.perf_counter()
+        inboxes, connections = [], []
+        for _ in range(options['clients']):
+            inbox = asyncio.Queue()
+            chosen = rng.sample(symbols, options['per_client'])
+            for symbol in chosen:
+                watchers[symbol] += 1
+            inbox.put_nowait({'type': 'websocket.connect'})
+            inbox.put_nowait({'type': 'websocket.receive', 'text': json.dumps({'action': 'subscribe', 'symbols': chosen})})
+            slow = rng.random() < options['slow_fraction']
+            connections.append(asyncio.ensure_future(hub({'type': 'websocket'}, inbox.get, client_send(slow))))
+            inboxes.append(inbox)
+        while hub.broadcaster.get_stats()['subscribers'] < options['clients'] or any(inbox.qsize() for inbox in inboxes):
+            await asyncio.sleep(0.05)
+        self.stdout.write(f"Connected {options['clients']} clients in {time.perf_counter() - started:.2f}s")
+
+        offered = {'quotes': 0}
+        stop = threading.Event()
+
+        def feed():
+            prices = {symbol: 100.0 for symbol in symbols}
+            interval = 1 / options['rate']
+            next_tick = time.perf_counter()
+            while not stop.is_set():
+                symbol = rng.choice(symbols)
+                prices[symbol] = round(prices[symbol] * (1 + rng.gauss(0, 0.002)), 2)
+                hub.broadcaster.publish([{
+                    'symbol': symbol, 'current_price': prices[symbol], 'previous_close': 100.0,
+                    'day_change': round(prices[symbol] - 100.0, 2), 'day_change_percent': None,
+                    'volume': None, 'last_updated': time.perf_counter(),
+                }])
+                offered['quotes'] += watchers[symbol]
+                next_tick += interval
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+        # Only count what the feed causes, not the subscribe snapshots
+        delivered.update(frames=0, quotes=0)
+        latencies.clear()
+        feeder = threading.Thread(target=feed, name='fake-price-feed', daemon=True)
+        started = time.perf_counter()
+        feeder.start()
+        await asyncio.sleep(options['seconds'])
+        stop.set()
+        await asyncio.to_thread(feeder.join)
+        elapsed = time.perf_counter() - started
+
+        for inbox in inboxes:
+            inbox.put_nowait({'type': 'websocket.disconnect'})
+        await asyncio.gather(*connections)
+
+        published = hub.broadcaster.get_stats()['published']
+        self.stdout.write(
+            f"Feed published {published} quotes ({published / elapsed:.0f}/s) "
+            f"for {offered['quotes']} client-symbol updates"
+        )
+        self.stdout.write(
+            f"Delivered {delivered['frames']} frames ({delivered['frames'] / elapsed:.0f}/s) carrying "
+            f"{delivered['quotes']} quotes; coalesced {max(0, offered['quotes'] - delivered['quotes'])} "
+            f"({delivered['quotes'] / max(1, offered['quotes']):.0%} delivered)"
+        )
+        if latencies:
+            latencies = sorted(seconds * 1000 for seconds in latencies)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(self.style.SUCCESS(
+                f"Feed-to-send latency: mean={statistics.fmean(latencies):.1f}ms "
+                f"median={statistics.median(latencies):.1f}ms p99={p99:.1f}ms max={latencies[-1]:.1f}ms"
+            ))
+        # ru_maxrss is in kilobytes on Linux
+        self.stdout.write(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
@@ -0,0 +1,129 @@
+"""
+Django management command that rebuilds the materialized position ledger.
+
+Buy and sell update UserStock incrementally; this replays the full
+Transaction history with the same average-cost rules to verify (--check) or
+repair the stored quantities, cost basis and realized P&L.
+"""
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from stocks.models import Stocks, Transaction, UserStock
+import logging
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FIELDS = ['purchase_quantity', 'purchase_price', 'cost_basis', 'realized_pnl']
+
+
+class Command(BaseCommand):
+    help = 'Rebuild user positions (quantity, cost basis, realized P&L) from transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=str,
+            default=None,
+            help='Only rebuild positions for this username',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Report positions that differ from the history without changing them',
+        )
+
+    def handle(self, *args, **options):
+        """Main command handler"""
+        transactions = Transaction.objects.order_by('user_id', 'date', 'id')
+        positions = UserStock.objects.select_related('stock')
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user: {options['user']}")
+            transactions = transactions.filter(user=user)
+            positions = positions.filter(user=user)
+
+        expected = self.replay(transactions)
+        current = {(position.user_id, position.stock.ticker): position for position in positions}
+
+        to_create = []
+        to_update = []
+        for key, rebuilt in expected.items():
+            position = current.get(key)
+            if position is None:
+                to_create.append(rebuilt)
+                self.report(key, None, rebuilt)
+            elif self.differs(position, rebuilt):
+                self.report(key, position, rebuilt)
+                for field in LEDGER_FIELDS:
+                    setattr(position, field, getattr(rebuilt, field))
+                to_update.append(position)
+
+        # Positions with no history behind them are closed out
+        for key, position in current.items():
+            if key not in expected and (position.purchase_quantity or position.cost_basis or position.realized_pnl):
+                self.report(key, position, None)
+                position.purchase_quantity = 0
+                position.cost_basis = Decimal('0')
+                position.realized_pnl = Decimal('0')
+                to_update.append(position)
+
+        mismatches = len(to_create) + len(to_update)
+        if options['check']:
+            if mismatches:
+                raise CommandError(f"{mismatches} positions differ from transaction history")
+            self.stdout.write(self.style.SUCCESS(f"All {len(current)} positions match transaction history"))
+            return
+
+        with transaction.atomic():
+            UserStock.objects.bulk_create(to_create)
+            UserStock.objects.bulk_update(to_update, LEDGER_FIELDS)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt positions: {len(to_create)} created, {len(to_update)} corrected")
+        )
+
+    def replay(self, transactions):
+        """Apply every trade in order and return {(user_id, ticker): unsaved UserStock}"""
+        ledger = {}
+        stocks = {}
+        for trade in transactions.iterator():
+            key = (trade.user_id, trade.stock_symbol)
+            position = ledger.get(key)
+            if position is None:
+                if trade.stock_symbol not in stocks:
+                    stocks[trade.stock_symbol] = Stocks.objects.filter(ticker=trade.stock_symbol).first()
+                if stocks[trade.stock_symbol] is None:
+                    logger.warning(f"Skipping trade {trade.id}: unknown stock {trade.stock_symbol}")
+                    continue
+                position = ledger[key] = UserStock(
+                    user_id=trade.user_id,
+                    stock=stocks[trade.stock_symbol],
+                    purchase_price=trade.price,
+                    purchase_quantity=0,
+                )
+
+            if trade.type == 'BUY':
+                position.apply_buy(trade.quantity, trade.price)
+            elif trade.type == 'SELL':
+                quantity = min(trade.quantity, position.purchase_quantity)
+                if quantity < trade.quantity:
+                    logger.warning(f"Trade {trade.id} sells {trade.quantity} of {trade.stock_symbol} "
+                                   f"but only {position.purchase_quantity} were held")
+                if quantity:
+                    position.apply_sell(quantity, trade.price)
+        return ledger
+
+    @staticmethod
+    def differs(position, rebuilt):
+        return any(getattr(position, field) != getattr(rebuilt, field) for field in LEDGER_FIELDS)
+
+    def report(self, key, position, rebuilt):
+        user_id, symbol = key
+        stored = 'missing' if position is None else \
+            f"qty={position.purchase_quantity} cost={position.cost_basis} realized={position.realized_pnl}"
+        replayed = 'none' if rebuilt is None else \
+            f"qty={rebuilt.purchase_quantity} cost={rebuilt.cost_basis} realized={rebuilt.realized_pnl}"
+        self.stdout.write(f"user {user_id} {symbol}: stored {stored}, history {replayed}")
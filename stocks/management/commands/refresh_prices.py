@@ -0,0 +1,113 @@
+"""
+Django management command that keeps stored stock quotes current.
+
+Request handlers read prices from the database (or the quote cache) and never
+call the upstream providers inline; this command is the only place that does,
+on a fixed schedule.
+
+It is also the process that triggers limit and stop orders: the order
+manager listens to the quotes fetched here and nowhere else.
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from stocks.models import Stocks
+from stocks.orders import order_manager
+from stocks.persistence import price_persister
+from stocks.services import stock_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Periodically refresh stock prices, volume and market cap from the data providers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--symbols',
+            nargs='+',
+            type=str,
+            help='Only refresh these stock symbols (e.g., AAPL MSFT GOOGL)',
+            default=None
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=60,
+            help='Seconds to wait between refresh passes',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single refresh pass and exit',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Number of symbols fetched per batched provider call',
+        )
+        parser.add_argument(
+            '--max-workers',
+            type=int,
+            default=None,
+            help='Concurrency limit for provider metadata lookups',
+        )
+
+    def handle(self, *args, **options):
+        """Main command handler"""
+        interval = max(1, options['interval'])
+        stock_service.add_quote_listener(order_manager.on_quotes)
+
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    updated, failed = self.refresh(options)
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f'[{timezone.now():%Y-%m-%d %H:%M:%S}] Refreshed {updated} stocks, '
+                        f'{failed} failed in {elapsed:.2f}s'
+                    )
+                except Exception as e:
+                    logger.error(f'Price refresh pass failed: {str(e)}')
+                    self.stdout.write(self.style.ERROR(f'Refresh pass failed: {str(e)}'))
+
+                if options['once']:
+                    break
+
+                time.sleep(max(0, interval - (time.monotonic() - started)))
+        finally:
+            stock_service.remove_quote_listener(order_manager.on_quotes)
+
+    def refresh(self, options):
+        """Run one refresh pass and return (updated, failed) counts"""
+        queryset = Stocks.objects.filter(is_active=True)
+        if options['symbols']:
+            queryset = queryset.filter(ticker__in=[symbol.upper() for symbol in options['symbols']])
+
+        stocks = list(queryset.order_by('ticker'))
+        batch_size = max(1, options['batch_size'])
+        updated = 0
+        failed = 0
+
+        for i in range(0, len(stocks), batch_size):
+            batch = stocks[i:i + batch_size]
+            quotes = stock_service.get_multiple_stocks(
+                [stock.ticker for stock in batch],
+                max_workers=options['max_workers'],
+                force_refresh=True,
+            )
+
+            for stock in batch:
+                stock_data = quotes.get(stock.ticker)
+                if not stock_data:
+                    failed += 1
+                    continue
+                if price_persister.record(stock, stock_data):
+                    updated += 1
+
+            # One write transaction per batch; unchanged quotes were never queued
+            price_persister.flush()
+
+        return updated, failed
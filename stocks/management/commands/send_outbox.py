@@ -0,0 +1,70 @@
+"""
+Django management command that sends queued outbox emails.
+
+Web processes drain the outbox on a background thread, but messages still
+pending after a restart (or retries coming due while no trades happen) are
+only picked up by that thread after its next enqueue. Running this command
+on a schedule, or with --loop, guarantees they go out.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from stocks.models import EmailOutbox
+from stocks.outbox import email_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send due emails from the outbox in batches over one SMTP connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Messages sent per connection (default: EMAIL_OUTBOX_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Stop after trying this many messages',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep draining the outbox instead of exiting when it is empty',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=5,
+            help='Seconds to wait between passes with --loop',
+        )
+
+    def handle(self, *args, **options):
+        """Main command handler"""
+        if options['batch_size'] is not None:
+            if options['batch_size'] < 1:
+                raise CommandError("--batch-size must be positive")
+            email_outbox.batch_size = options['batch_size']
+
+        while True:
+            before = email_outbox.get_stats()
+            started = time.monotonic()
+            tried = email_outbox.drain(options['limit'])
+            elapsed = time.monotonic() - started
+            after = email_outbox.get_stats()
+
+            if tried:
+                sent = after['sent'] - before['sent']
+                self.stdout.write(self.style.SUCCESS(
+                    f"Sent {sent} of {tried} messages in {elapsed:.2f}s ({sent / elapsed:.1f} msg/s); "
+                    f"{after['retried'] - before['retried']} to retry, {after['failed'] - before['failed']} failed"
+                ))
+            if not options['loop']:
+                if not tried:
+                    self.stdout.write("No messages due")
+                pending = EmailOutbox.objects.filter(status='PENDING').count()
+                if pending:
+                    self.stdout.write(f"{pending} messages still pending (retries not yet due)")
+                return
+            time.sleep(max(1, options['interval']))
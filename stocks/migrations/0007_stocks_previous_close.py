@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0006_alter_stocks_options_alter_transaction_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stocks',
+            name='previous_close',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Previous session closing price', max_digits=10, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:37
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_cost_basis(apps, schema_editor):
+    # Exact history is rebuilt by `manage.py rebuild_positions`; until then the
+    # stored average price is the best available cost basis
+    UserStock = apps.get_model('stocks', 'UserStock')
+    UserStock.objects.update(cost_basis=F('purchase_price') * F('purchase_quantity'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0007_stocks_previous_close'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstock',
+            name='cost_basis',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), help_text='Total cost of the shares currently held', max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='userstock',
+            name='realized_pnl',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), help_text='Profit or loss locked in by sales', max_digits=14),
+        ),
+        migrations.RunPython(backfill_cost_basis, migrations.RunPython.noop),
+    ]
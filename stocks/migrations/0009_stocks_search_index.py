@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# External-content FTS5 index over the searchable Stocks columns. Triggers keep
+# it in sync; the update trigger only fires for the indexed columns, so price
+# refreshes never touch the index.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS stocks_stocks_fts USING fts5(
+        ticker, name, sector, industry, description,
+        content='stocks_stocks', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stocks_stocks_fts_ai AFTER INSERT ON stocks_stocks BEGIN
+        INSERT INTO stocks_stocks_fts(rowid, ticker, name, sector, industry, description)
+        VALUES (new.id, new.ticker, new.name, new.sector, new.industry, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stocks_stocks_fts_ad AFTER DELETE ON stocks_stocks BEGIN
+        INSERT INTO stocks_stocks_fts(stocks_stocks_fts, rowid, ticker, name, sector, industry, description)
+        VALUES ('delete', old.id, old.ticker, old.name, old.sector, old.industry, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS stocks_stocks_fts_au
+    AFTER UPDATE OF ticker, name, sector, industry, description ON stocks_stocks BEGIN
+        INSERT INTO stocks_stocks_fts(stocks_stocks_fts, rowid, ticker, name, sector, industry, description)
+        VALUES ('delete', old.id, old.ticker, old.name, old.sector, old.industry, old.description);
+        INSERT INTO stocks_stocks_fts(rowid, ticker, name, sector, industry, description)
+        VALUES (new.id, new.ticker, new.name, new.sector, new.industry, new.description);
+    END
+    """,
+    "INSERT INTO stocks_stocks_fts(stocks_stocks_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS stocks_stocks_fts_au",
+    "DROP TRIGGER IF EXISTS stocks_stocks_fts_ad",
+    "DROP TRIGGER IF EXISTS stocks_stocks_fts_ai",
+    "DROP TABLE IF EXISTS stocks_stocks_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # Other databases fall back to icontains search in stocks/search.py
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0008_userstock_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(CREATE_SQL), _run(DROP_SQL)),
+    ]
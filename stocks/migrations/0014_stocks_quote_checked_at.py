@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0013_order_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stocks',
+            name='quote_checked_at',
+            field=models.DateTimeField(blank=True, help_text='Last refresh that found the quote unchanged', null=True),
+        ),
+    ]
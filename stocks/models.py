@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
@@ -37,14 +38,74 @@ class Stocks(models.Model):
         validators=[MinValueValidator(Decimal('0.01'))],
         help_text="Current stock price"
     )
+    previous_close = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        help_text="Previous session closing price"
+    )
     market_cap = models.BigIntegerField(null=True, blank=True, help_text="Market capitalization")
     sector = models.CharField(max_length=100, blank=True, default='', help_text="Stock sector")
     industry = models.CharField(max_length=100, blank=True, default='', help_text="Stock industry")
     volume = models.BigIntegerField(default=0, help_text="Trading volume")
     last_updated = models.DateTimeField(auto_now=True)
+    quote_checked_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Last refresh that found the quote unchanged"
+    )
     created_at = models.DateTimeField(auto_now_add=True, null=True)
     is_active = models.BooleanField(default=True, help_text="Is stock actively traded")
 
+    @property
+    def day_change(self):
+        if self.previous_close:
+            return self.curr_price - self.previous_close
+        return Decimal('0')
+    
+    @property
+    def day_change_percent(self):
+        if self.previous_close:
+            return (self.day_change / self.previous_close) * 100
+        return Decimal('0')
+    
+    def apply_quote(self, stock_data):
+        """Copy a provider quote onto the row and return the names of the fields that changed"""
+        values = {
+            'curr_price': Decimal(str(stock_data['current_price'])).quantize(Decimal('0.01')),
+            'previous_close': (Decimal(str(stock_data['previous_close'])).quantize(Decimal('0.01'))
+                               if stock_data.get('previous_close') else self.previous_close),
+            'volume': stock_data.get('volume') or self.volume,
+            'market_cap': stock_data.get('market_cap') or self.market_cap,
+        }
+        changed = [field for field, value in values.items() if getattr(self, field) != value]
+        for field in changed:
+            setattr(self, field, values[field])
+        return changed
+    
+    def quote_payload(self):
+        """Serialize the stored quote for the JSON price APIs and the price stream"""
+        return {
+            'symbol': self.ticker,
+            'current_price': float(self.curr_price),
+            'previous_close': float(self.previous_close or self.curr_price),
+            'day_change': float(self.day_change),
+            'day_change_percent': float(self.day_change_percent),
+            'volume': self.volume,
+            'market_cap': self.market_cap or 0,
+            'last_updated': self.last_updated.isoformat() if self.last_updated else None,
+            'age_seconds': self.quote_age_seconds,
+        }
+    
+    @property
+    def quote_age_seconds(self):
+        """Seconds since the stored quote was last refreshed, whether or not it changed"""
+        refreshed = max(filter(None, [self.last_updated, self.quote_checked_at]), default=None)
+        if not refreshed:
+            return None
+        return max(0, int((timezone.now() - refreshed).total_seconds()))
+
     def __str__(self):
         return f"{self.ticker} - {self.name}"
     
@@ -56,6 +117,8 @@ class Stocks(models.Model):
 
 # Fk is many to one
 
+CENT = Decimal('0.01')
+
 class UserStock(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     stock = models.ForeignKey(Stocks, on_delete=models.CASCADE)
@@ -69,16 +132,44 @@ class UserStock(models.Model):
         validators=[MinValueValidator(1)],
         help_text="Number of shares owned"
     )
+    cost_basis = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0'),
+        help_text="Total cost of the shares currently held"
+    )
+    realized_pnl = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0'),
+        help_text="Profit or loss locked in by sales"
+    )
     created_at = models.DateTimeField(auto_now_add=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, null=True)
     
+    def apply_buy(self, quantity, price):
+        """Add shares to the position at ``price`` (average cost method)"""
+        self.cost_basis = (self.cost_basis or Decimal('0')) + (price * quantity).quantize(CENT)
+        self.purchase_quantity = (self.purchase_quantity or 0) + quantity
+        self.purchase_price = (self.cost_basis / self.purchase_quantity).quantize(CENT)
+    
+    def apply_sell(self, quantity, price):
+        """Remove shares at ``price``, moving their gain or loss into realized P&L"""
+        if quantity > self.purchase_quantity:
+            raise ValueError(f"Cannot sell {quantity} shares of a {self.purchase_quantity} share position")
+        
+        cost = (self.cost_basis * quantity / self.purchase_quantity).quantize(CENT)
+        self.realized_pnl += (price * quantity).quantize(CENT) - cost
+        self.cost_basis -= cost
+        self.purchase_quantity -= quantity
+    
     @property
     def current_value(self):
         return self.stock.curr_price * self.purchase_quantity
     
     @property
     def invested_value(self):
-        return self.purchase_price * self.purchase_quantity
+        return self.cost_basis
     
     @property
     def gain_loss(self):
@@ -129,9 +220,98 @@ class Transaction(models.Model):
     
     class Meta:
         ordering = ['-date']
+        indexes = [
+            # Keyset pagination of a user's history walks (date, id) newest first
+            models.Index(fields=['user', '-date', '-id'], name='transaction_user_date_idx'),
+        ]
         verbose_name = "Transaction"
         verbose_name_plural = "Transactions"
 
+class Order(models.Model):
+    """A pending limit or stop order; the open ones are mirrored in the in-memory order book"""
+    SIDES = [
+        ('BUY', 'Buy'),
+        ('SELL', 'Sell'),
+    ]
+    ORDER_TYPES = [
+        ('LIMIT', 'Limit'),
+        ('STOP', 'Stop'),
+    ]
+    STATUSES = [
+        ('OPEN', 'Open'),
+        ('FILLED', 'Filled'),
+        ('CANCELLED', 'Cancelled'),
+        ('REJECTED', 'Rejected'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    stock = models.ForeignKey(Stocks, on_delete=models.CASCADE)
+    side = models.CharField(max_length=4, choices=SIDES)
+    order_type = models.CharField(max_length=5, choices=ORDER_TYPES)
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    trigger_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        validators=[MinValueValidator(Decimal('0.01'))],
+        help_text="Limit price, or the price that activates a stop"
+    )
+    status = models.CharField(max_length=9, choices=STATUSES, default='OPEN')
+    fill_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    status_reason = models.CharField(max_length=200, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def triggers_below(self):
+        """True when the order fires as the price falls to the trigger (buy limit, sell stop)"""
+        return (self.side == 'BUY') == (self.order_type == 'LIMIT')
+    
+    def __str__(self):
+        return f"{self.side} {self.order_type} {self.quantity} {self.stock.ticker} @ {self.trigger_price} ({self.status})"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Recovery loads every open order; users list their own
+            models.Index(fields=['status'], name='order_status_idx'),
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+            # The price process syncs orders changed by web workers
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ]
+        verbose_name = "Order"
+        verbose_name_plural = "Orders"
+
+class EmailOutbox(models.Model):
+    """An outgoing email, written in the same transaction as the event it reports"""
+    STATUSES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    status = models.CharField(max_length=7, choices=STATUSES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text="Not sent before this time (retry backoff, or a sender's claim)")
+    claim_token = models.CharField(max_length=32, blank=True, default='')
+    last_error = models.CharField(max_length=200, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.subject} -> {self.recipient} ({self.status})"
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # The sender scans for due pending messages
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+        verbose_name = "Email Outbox Message"
+        verbose_name_plural = "Email Outbox"
+
 class Watchlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     stock_symbol = models.CharField(max_length=10)
@@ -0,0 +1,294 @@
+"""
+Limit and stop orders.
+
+Open orders live in the Order table for recovery and in an in-memory
+OrderBook for matching. Each symbol keeps two heaps keyed by trigger price,
+then arrival sequence (price-time priority):
+
+* orders that fire when the price falls to their trigger (buy limits, sell
+  stops), highest trigger first;
+* orders that fire when the price rises to their trigger (sell limits, buy
+  stops), lowest trigger first.
+
+A price tick only has to look at the top of each heap, so a tick that
+crosses nothing is O(1) and one that crosses k orders is O(k log n),
+however many orders are resting. Cancelled orders are dropped lazily when
+they reach the top of a heap.
+
+The refresh_prices command subscribes OrderManager to StockDataService quote
+updates, and the manager executes the crossed orders through trade_service at
+the tick price. Only that process matches: web workers also fetch quotes
+(stale-while-revalidate, ?live=1) but must not sync the book or fill orders
+on request threads. Orders are placed and cancelled by web workers, so before
+matching each batch of quotes the manager picks up every order changed in the
+database since its last sync.
+"""
+import heapq
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Order
+from .trading import TradeError, trade_service
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+
+# Orders committed slightly after their updated_at (or stamped by another
+# process with a skewed clock) are still picked up by re-reading this window
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+class RestingOrder:
+    """What the book needs to know about an open order"""
+    __slots__ = ('id', 'symbol', 'trigger', 'below')
+
+    def __init__(self, order_id: int, symbol: str, trigger: float, below: bool):
+        self.id = order_id
+        self.symbol = symbol
+        self.trigger = trigger
+        self.below = below
+
+
+class OrderBook:
+    """Per-symbol trigger heaps over open order ids"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._stale = 0
+        # symbol -> (falls-to heap of (-trigger, seq, id), rises-to heap of (trigger, seq, id))
+        self._books: Dict[str, Tuple[list, list]] = {}
+        self.orders: Dict[int, RestingOrder] = {}
+
+    def __len__(self):
+        return len(self.orders)
+
+    def add(self, order_id: int, symbol: str, trigger_price, below: bool):
+        trigger = float(trigger_price)
+        with self._lock:
+            if order_id in self.orders:
+                return
+            self._sequence += 1
+            self.orders[order_id] = RestingOrder(order_id, symbol, trigger, below)
+            falls_to, rises_to = self._books.setdefault(symbol, ([], []))
+            if below:
+                heapq.heappush(falls_to, (-trigger, self._sequence, order_id))
+            else:
+                heapq.heappush(rises_to, (trigger, self._sequence, order_id))
+
+    def remove(self, order_id: int) -> bool:
+        with self._lock:
+            if self.orders.pop(order_id, None) is None:
+                return False
+            # Removed ids stay in their heap until popped; compact once they dominate
+            self._stale += 1
+            if self._stale > 1024 and self._stale > len(self.orders):
+                self._compact()
+            return True
+
+    def _compact(self):
+        for falls_to, rises_to in self._books.values():
+            for heap in (falls_to, rises_to):
+                heap[:] = [entry for entry in heap if entry[2] in self.orders]
+                heapq.heapify(heap)
+        self._stale = 0
+
+    def crossed(self, symbol: str, price) -> List[int]:
+        """Remove and return the ids of orders triggered at ``price``, in priority order"""
+        book = self._books.get(symbol)
+        if book is None:
+            return []
+        price = float(price)
+        falls_to, rises_to = book
+        triggered = []
+        with self._lock:
+            while falls_to and -falls_to[0][0] >= price:
+                order_id = heapq.heappop(falls_to)[2]
+                if self.orders.pop(order_id, None) is not None:
+                    triggered.append(order_id)
+            while rises_to and rises_to[0][0] <= price:
+                order_id = heapq.heappop(rises_to)[2]
+                if self.orders.pop(order_id, None) is not None:
+                    triggered.append(order_id)
+        return triggered
+
+    def clear(self):
+        with self._lock:
+            self._books = {}
+            self.orders = {}
+            self._stale = 0
+
+
+class OrderManager:
+    """Places, cancels and fills limit/stop orders"""
+
+    def __init__(self, fill_workers: int = 1):
+        self.book = OrderBook()
+        self.fill_workers = fill_workers
+        self._executor = None
+        self._load_lock = threading.Lock()
+        self._synced_at = None
+        self.stats = {'ticks': 0, 'triggered': 0, 'filled': 0, 'rejected': 0}
+
+    def _ensure_loaded(self):
+        """Build the book from the open orders in the database, once per process"""
+        if self._synced_at is not None:
+            return
+        with self._load_lock:
+            if self._synced_at is not None:
+                return
+            synced_at = timezone.now()
+            count = self._apply(Order.objects.filter(status='OPEN').order_by('created_at', 'id'))
+            self._synced_at = synced_at
+            logger.info(f"Loaded {count} open orders into the order book")
+
+    def sync(self):
+        """
+        Catch the book up with orders placed, cancelled or filled by other
+        processes since the last sync: one indexed query on updated_at.
+        """
+        if self._synced_at is None:
+            self._ensure_loaded()
+            return
+        with self._load_lock:
+            synced_at = timezone.now()
+            self._apply(Order.objects.filter(updated_at__gte=self._synced_at - SYNC_OVERLAP).order_by('created_at', 'id'))
+            self._synced_at = synced_at
+
+    def _apply(self, orders) -> int:
+        """Add the open ``orders`` to the book and drop the rest; returns how many are open"""
+        count = 0
+        for order_id, symbol, trigger_price, side, order_type, status in orders.values_list(
+                'id', 'stock__ticker', 'trigger_price', 'side', 'order_type', 'status').iterator():
+            if status == 'OPEN':
+                self.book.add(order_id, symbol, trigger_price, (side == 'BUY') == (order_type == 'LIMIT'))
+                count += 1
+            else:
+                self.book.remove(order_id)
+        return count
+
+    def place(self, user, stock, side: str, order_type: str, quantity, trigger_price) -> Order:
+        """Validate and store an order; it fills at once if the stored price already crosses it"""
+        if side not in dict(Order.SIDES):
+            raise TradeError("Invalid order side.")
+        if order_type not in dict(Order.ORDER_TYPES):
+            raise TradeError("Invalid order type.")
+        quantity = trade_service.validate_quantity(quantity)
+        try:
+            trigger_price = Decimal(str(trigger_price)).quantize(CENT)
+        except (InvalidOperation, ValueError):
+            raise TradeError("Invalid trigger price.")
+        if not trigger_price.is_finite() or trigger_price < CENT:
+            raise TradeError("Trigger price must be positive.")
+
+        self._ensure_loaded()
+        order = Order.objects.create(
+            user=user, stock=stock, side=side, order_type=order_type,
+            quantity=quantity, trigger_price=trigger_price,
+        )
+        logger.info(f"User {user.username} placed {side} {order_type} order {order.id} for "
+                    f"{quantity} {stock.ticker} @ ${trigger_price}")
+
+        price = stock.curr_price
+        if self._crosses(order.triggers_below, trigger_price, price):
+            self.fill(order.id, price)
+            order.refresh_from_db()
+        else:
+            self.book.add(order.id, stock.ticker, trigger_price, order.triggers_below)
+        return order
+
+    @staticmethod
+    def _crosses(below: bool, trigger_price, price) -> bool:
+        return price <= trigger_price if below else price >= trigger_price
+
+    def cancel(self, user, order_id: int) -> bool:
+        cancelled = Order.objects.filter(pk=order_id, user=user, status='OPEN').update(
+            status='CANCELLED', updated_at=timezone.now())
+        if cancelled:
+            self.book.remove(order_id)
+        return bool(cancelled)
+
+    def on_quotes(self, quotes: Dict[str, Dict]):
+        """StockDataService listener: queue fills for every order the new prices cross"""
+        self.sync()
+        triggered = []
+        for symbol, data in quotes.items():
+            price = data.get('current_price') if data else None
+            if not price:
+                continue
+            self._count('ticks')
+            price = Decimal(str(price)).quantize(CENT)
+            triggered.extend((order_id, price) for order_id in self.book.crossed(symbol, price))
+        if not triggered:
+            return
+
+        self._count('triggered', len(triggered))
+        if not self.fill_workers:
+            self._fill_all(triggered)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.fill_workers, thread_name_prefix='order-fill')
+        self._executor.submit(self._fill_in_background, triggered)
+
+    def _fill_all(self, triggered: Iterable[Tuple[int, Decimal]]):
+        for order_id, price in triggered:
+            try:
+                self.fill(order_id, price)
+            except Exception as e:
+                logger.error(f"Failed to fill order {order_id}: {str(e)}")
+
+    def _fill_in_background(self, triggered: Iterable[Tuple[int, Decimal]]):
+        try:
+            self._fill_all(triggered)
+        finally:
+            close_old_connections()
+
+    def fill(self, order_id: int, price: Decimal) -> Optional[Order]:
+        """Execute an open order at ``price``; orders that can't trade are rejected"""
+        order = Order.objects.select_related('user', 'stock').filter(pk=order_id, status='OPEN').first()
+        if order is None:
+            return None  # Cancelled (or filled elsewhere) after it was triggered
+
+        stock = order.stock
+        stock.curr_price = price
+        try:
+            with transaction.atomic():
+                # Claiming the order first makes a concurrent fill or cancel a no-op
+                if not Order.objects.filter(pk=order_id, status='OPEN').update(
+                        status='FILLED', fill_price=price, updated_at=timezone.now()):
+                    return None
+                if order.side == 'BUY':
+                    trade_service.buy(order.user, stock, order.quantity)
+                else:
+                    trade_service.sell(order.user, stock, order.quantity)
+            order.status, order.fill_price = 'FILLED', price
+            self._count('filled')
+        except TradeError as e:
+            Order.objects.filter(pk=order_id, status='OPEN').update(
+                status='REJECTED', status_reason=str(e)[:200], updated_at=timezone.now())
+            order.status, order.status_reason = 'REJECTED', str(e)
+            self._count('rejected')
+            logger.info(f"Rejected order {order_id}: {str(e)}")
+        return order
+
+    def _count(self, stat: str, n: int = 1):
+        # Fill workers and the quote thread update these concurrently
+        with self.book._lock:
+            self.stats[stat] += n
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.book._lock:
+            return {**self.stats, 'resting': len(self.book.orders)}
+
+
+order_manager = OrderManager(
+    fill_workers=getattr(settings, 'STOCK_API_SETTINGS', {}).get('ORDER_FILL_WORKERS', 1),
+)
@@ -0,0 +1,197 @@
+"""
+Transactional email outbox.
+
+Code that wants to send an email calls ``email_outbox.enqueue`` inside the
+transaction that records the event, so the message is stored if and only
+if the trade (or registration) commits, and survives a crash. A background
+sender drains due messages in batches over one SMTP connection per batch,
+instead of a thread and a connection per email.
+
+Failed messages are retried with exponential backoff and marked FAILED
+after EMAIL_OUTBOX_MAX_ATTEMPTS. Batches are claimed with a conditional
+UPDATE, so several senders (the in-process worker and the send_outbox
+command) never pick up the same message; a claim that is never finished,
+because its sender died, expires after CLAIM_LEASE. Delivery is therefore
+at-least-once.
+
+At interpreter exit the worker sends at most one more batch, with a short
+connection timeout, so a slow or unreachable mail server can't hold up
+shutdown; whatever is left stays queued for the next sender.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, Optional
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+CLAIM_LEASE = timedelta(minutes=5)
+MAX_RETRY_DELAY = 3600
+EXIT_SEND_TIMEOUT = 5
+
+
+class OutboxSender:
+    """Stores outgoing emails and sends them in batches over a reused connection"""
+
+    def __init__(self, interval: Optional[float] = 5.0, batch_size: int = 100,
+                 max_attempts: int = 5, retry_delay: float = 30.0):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {'enqueued': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0,
+                       'send_seconds': 0.0}
+
+    def enqueue(self, recipient: str, subject: str, body: str) -> Optional[EmailOutbox]:
+        """
+        Store an email for sending once the current transaction commits.
+
+        Returns None (nothing stored) when there is no recipient address.
+        """
+        if not recipient:
+            return None
+        message = EmailOutbox.objects.create(recipient=recipient, subject=subject[:200], body=body)
+        with self._lock:
+            self._stats['enqueued'] += 1
+        if self.interval is not None:
+            transaction.on_commit(self._notify)
+        return message
+
+    def drain(self, limit: Optional[int] = None) -> int:
+        """Send due messages batch by batch until none are left (or ``limit`` were tried)"""
+        tried = 0
+        while limit is None or tried < limit:
+            batch_size = self.batch_size if limit is None else min(self.batch_size, limit - tried)
+            batch = self._claim(batch_size)
+            if not batch:
+                break
+            self._send(batch)
+            tried += len(batch)
+        return tried
+
+    def _claim(self, batch_size: int):
+        now = timezone.now()
+        due = EmailOutbox.objects.filter(status='PENDING', next_attempt_at__lte=now)
+        ids = list(due.order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        # Only rows still due are claimed; another sender may have taken some
+        due.filter(id__in=ids).update(claim_token=token, next_attempt_at=now + CLAIM_LEASE)
+        return list(EmailOutbox.objects.filter(claim_token=token, status='PENDING'))
+
+    def _send(self, batch, timeout: Optional[float] = None):
+        started = time.monotonic()
+        sent, failed = [], []
+        # timeout=None keeps the backend's EMAIL_TIMEOUT
+        connection = get_connection(fail_silently=False, timeout=timeout)
+        try:
+            connection.open()
+            for message in batch:
+                try:
+                    EmailMessage(message.subject, message.body, None, [message.recipient],
+                                 connection=connection).send()
+                    sent.append(message)
+                except Exception as e:
+                    message.last_error = str(e)[:200]
+                    failed.append(message)
+        except Exception as e:
+            # Couldn't connect at all: the whole batch is retried
+            logger.error(f"Email outbox could not open a mail connection: {str(e)}")
+            for message in batch:
+                if message not in sent and message not in failed:
+                    message.last_error = str(e)[:200]
+                    failed.append(message)
+        finally:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+        now = timezone.now()
+        for message in sent:
+            message.status = 'SENT'
+            message.sent_at = now
+            message.attempts += 1
+            message.claim_token = ''
+        retried = 0
+        for message in failed:
+            message.attempts += 1
+            message.claim_token = ''
+            if message.attempts >= self.max_attempts:
+                message.status = 'FAILED'
+            else:
+                retried += 1
+                delay = min(self.retry_delay * 2 ** (message.attempts - 1), MAX_RETRY_DELAY)
+                message.next_attempt_at = now + timedelta(seconds=delay)
+        EmailOutbox.objects.bulk_update(
+            sent + failed, ['status', 'sent_at', 'attempts', 'claim_token', 'next_attempt_at', 'last_error'])
+
+        if failed:
+            logger.warning(f"Email outbox: {len(failed)} of {len(batch)} messages failed; {retried} will be retried")
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['sent'] += len(sent)
+            self._stats['retried'] += retried
+            self._stats['failed'] += len(failed) - retried
+            self._stats['send_seconds'] += time.monotonic() - started
+
+    def _notify(self):
+        self._ensure_worker()
+        self._wake.set()
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+                self._thread.start()
+                atexit.register(self._drain_on_exit)
+
+    def _drain_on_exit(self):
+        """Send one last batch with a short timeout; the rest waits for the next sender"""
+        try:
+            batch = self._claim(self.batch_size)
+            if batch:
+                self._send(batch, timeout=EXIT_SEND_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Email outbox exit flush failed: {str(e)}")
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                logger.error(f"Email outbox loop error: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        seconds = stats.pop('send_seconds')
+        stats['messages_per_second'] = round(stats['sent'] / seconds, 1) if seconds else 0.0
+        return stats
+
+
+email_outbox = OutboxSender(
+    interval=getattr(settings, 'STOCK_API_SETTINGS', {}).get('EMAIL_OUTBOX_INTERVAL', 5.0),
+    batch_size=getattr(settings, 'STOCK_API_SETTINGS', {}).get('EMAIL_OUTBOX_BATCH_SIZE', 100),
+    max_attempts=getattr(settings, 'STOCK_API_SETTINGS', {}).get('EMAIL_OUTBOX_MAX_ATTEMPTS', 5),
+    retry_delay=getattr(settings, 'STOCK_API_SETTINGS', {}).get('EMAIL_OUTBOX_RETRY_DELAY', 30),
+)
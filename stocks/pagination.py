@@ -0,0 +1,57 @@
+"""
+Keyset (cursor) pagination over (date, id), newest first.
+
+Each page is an index range scan that starts right after the last row of the
+previous page, so page N costs the same as page 1; OFFSET pagination would
+re-read and discard every earlier row. The cursor is an opaque URL-safe token
+encoding the (date, id) of the last row served.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(date: datetime, pk: int) -> str:
+    payload = json.dumps([date.isoformat(), pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date, pk = json.loads(payload)
+        return datetime.fromisoformat(date), int(pk)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_page(queryset, cursor: Optional[str] = None, page_size: int = 50,
+                date_field: str = 'date'):
+    """
+    Return (rows, next_cursor) for the page after ``cursor``.
+
+    ``next_cursor`` is None on the last page. Raises InvalidCursor for a
+    malformed cursor.
+    """
+    queryset = queryset.order_by(f'-{date_field}', '-id')
+    if cursor:
+        date, pk = decode_cursor(cursor)
+        # The redundant date <= bound lets the (user, date) index seek straight to the cursor
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__lte': date}),
+            Q(**{f'{date_field}__lt': date}) | Q(**{date_field: date, 'id__lt': pk}),
+        )
+
+    # One extra row tells us whether another page exists without a COUNT(*)
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, date_field), last.pk)
@@ -0,0 +1,142 @@
+"""
+Write-behind persistence for stock quotes.
+
+Every code path that stores a new quote on a Stocks row goes through
+``price_persister.record``. Changed rows are buffered in memory with the
+fields that changed on each, and flushed periodically as one bulk_update per
+field set in one transaction, so SQLite's write lock is taken once per flush
+instead of once per request, and a row never rewrites a column it didn't
+change. Quotes that don't change price, previous close, volume or market cap
+only queue their check time, written for all such rows in one UPDATE of
+quote_checked_at; last_updated keeps meaning "the quote changed".
+
+Quotes are derived data the refresher re-fetches on its next pass, so losing
+a buffer on a crash costs at most one flush interval of freshness.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Stocks
+
+logger = logging.getLogger(__name__)
+
+class PricePersister:
+    """Change-suppressing, buffered writer for Stocks quote fields"""
+
+    def __init__(self, flush_interval: float = 2.0, max_pending: int = 500):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._checked: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {'recorded': 0, 'suppressed': 0, 'flushes': 0, 'rows_written': 0}
+
+    def record(self, stock: Stocks, stock_data: Dict[str, Any]) -> bool:
+        """
+        Apply a quote to ``stock`` in memory and queue the row for writing.
+
+        Returns False when nothing changed and only the check time will be
+        written. With a flush interval of 0 the row is written before
+        returning; with None the caller is responsible for calling flush().
+        """
+        changed = stock.apply_quote(stock_data)
+        now = timezone.now()
+        with self._lock:
+            if changed:
+                stock.last_updated = now
+                # Merge with a buffered quote for the row; only fields some quote changed are written
+                row = self._pending.setdefault(stock.pk, {})
+                row.update({field: getattr(stock, field) for field in changed}, last_updated=now)
+                self._stats['recorded'] += 1
+            else:
+                stock.quote_checked_at = now
+                self._checked.setdefault(stock.pk, now)
+                self._stats['suppressed'] += 1
+            full = len(self._pending) + len(self._checked) >= self.max_pending
+
+        if self.flush_interval == 0:
+            self.flush()
+        elif self.flush_interval is not None:
+            self._ensure_flusher()
+            if full:
+                self._wake.set()
+        return bool(changed)
+
+    def flush(self) -> int:
+        """Write every buffered row in one transaction and return how many quotes were written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                checked, self._checked = self._checked, {}
+            if not pending and not checked:
+                return 0
+
+            by_fields = defaultdict(list)
+            for pk, values in pending.items():
+                by_fields[tuple(sorted(values))].append(Stocks(pk=pk, **values))
+            try:
+                with transaction.atomic():
+                    for fields, rows in by_fields.items():
+                        Stocks.objects.bulk_update(rows, fields, batch_size=self.max_pending)
+                    if checked:
+                        # The oldest check time, so ages are never understated
+                        Stocks.objects.filter(pk__in=list(checked)).update(quote_checked_at=min(checked.values()))
+            except Exception as e:
+                logger.error(f"Failed to flush {len(pending)} stock prices: {str(e)}")
+                self._requeue(pending, checked)
+                return 0
+
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['rows_written'] += len(pending)
+            return len(pending)
+
+    def _requeue(self, pending, checked):
+        with self._lock:
+            # Anything recorded since the failed flush is newer and wins
+            for pk, values in pending.items():
+                self._pending[pk] = {**values, **self._pending.get(pk, {})}
+            self._checked = {**checked, **self._checked}
+
+    def _ensure_flusher(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='price-persister', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Price flush loop error: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+            stats['pending_checks'] = len(self._checked)
+        return stats
+
+
+price_persister = PricePersister(
+    flush_interval=getattr(settings, 'STOCK_API_SETTINGS', {}).get('PRICE_FLUSH_INTERVAL', 2.0),
+    max_pending=getattr(settings, 'STOCK_API_SETTINGS', {}).get('PRICE_FLUSH_MAX_PENDING', 500),
+)
@@ -0,0 +1,160 @@
+"""
+Two-level cache for stock quotes and related provider data.
+
+L1 is a small in-process LRU that answers hot keys without any I/O. L2 is a
+Django cache alias shared by every worker process on the host (file-backed by
+default), so a quote fetched by one gunicorn worker is served to all of them.
+Keys are versioned so a change in the cached data shape can invalidate every
+entry at once by bumping ``QUOTE_CACHE_VERSION``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+from django.conf import settings
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, timeout: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """
+    Read-through L1/L2 cache with the subset of the Django cache API the
+    stock services use. Cross-process coordination does not go through the
+    cache: the L2 backends' ``add`` is not atomic (see SingleFlight).
+    """
+
+    def __init__(self, alias: str = 'quotes', version: int = 1,
+                 l1_max_entries: int = 1024, l1_timeout: float = 5):
+        self.alias = alias
+        self.version = version
+        self.l1 = LRUCache(l1_max_entries)
+        self.l1_timeout = l1_timeout
+        self._lock = threading.Lock()
+        self._stats = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0}
+
+    @property
+    def l2(self):
+        return caches[self.alias]
+
+    def _l1_key(self, key: str) -> str:
+        return f"v{self.version}:{key}"
+
+    def _l1_timeout(self, timeout: Optional[float]) -> float:
+        return self.l1_timeout if timeout is None else min(timeout, self.l1_timeout)
+
+    def _count(self, counter: str, amount: int = 1):
+        if amount:
+            with self._lock:
+                self._stats[counter] += amount
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.l1.get(self._l1_key(key), _MISSING)
+        if value is not _MISSING:
+            self._count('l1_hits')
+            return value
+
+        value = self.l2.get(key, _MISSING, version=self.version)
+        if value is _MISSING:
+            self._count('misses')
+            return default
+
+        self._count('l2_hits')
+        self.l1.set(self._l1_key(key), value, self.l1_timeout)
+        return value
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        results = {}
+        remaining = []
+        for key in keys:
+            value = self.l1.get(self._l1_key(key), _MISSING)
+            if value is _MISSING:
+                remaining.append(key)
+            else:
+                results[key] = value
+        self._count('l1_hits', len(results))
+
+        if remaining:
+            found = self.l2.get_many(remaining, version=self.version)
+            for key, value in found.items():
+                self.l1.set(self._l1_key(key), value, self.l1_timeout)
+            results.update(found)
+            self._count('l2_hits', len(found))
+            self._count('misses', len(remaining) - len(found))
+
+        return results
+
+    def set(self, key: str, value: Any, timeout: Optional[float] = None):
+        self.l2.set(key, value, timeout, version=self.version)
+        self.l1.set(self._l1_key(key), value, self._l1_timeout(timeout))
+
+    def set_many(self, data: Dict[str, Any], timeout: Optional[float] = None):
+        self.l2.set_many(data, timeout, version=self.version)
+        for key, value in data.items():
+            self.l1.set(self._l1_key(key), value, self._l1_timeout(timeout))
+
+    def delete(self, key: str):
+        self.l1.delete(self._l1_key(key))
+        self.l2.delete(key, version=self.version)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['l1_hits'] + stats['l2_hits']) / lookups, 4) if lookups else 0.0
+        stats['l1_entries'] = len(self.l1)
+        stats['version'] = self.version
+        return stats
+
+
+_api_settings = getattr(settings, 'STOCK_API_SETTINGS', {})
+
+quote_cache = TieredCache(
+    alias=_api_settings.get('QUOTE_CACHE_ALIAS', 'quotes'),
+    version=_api_settings.get('QUOTE_CACHE_VERSION', 1),
+    l1_max_entries=_api_settings.get('L1_CACHE_MAX_ENTRIES', 1024),
+    l1_timeout=_api_settings.get('L1_CACHE_TIMEOUT', 5),
+)
@@ -0,0 +1,133 @@
+"""
+Ranked stock search.
+
+On SQLite, queries go to the ``stocks_stocks_fts`` FTS5 index created by
+migration 0009 and kept in sync by triggers, ranked with bm25 so ticker and
+name matches outrank sector, industry and description matches. Lookups cost
+an index probe rather than a table scan, so latency stays flat as the stock
+universe grows. Other databases (or SQLite builds without FTS5) fall back to
+icontains filtering.
+"""
+import logging
+import re
+from typing import List, Optional
+from django.db import DatabaseError, connection
+from django.db.models import Case, IntegerField, Q, When
+
+from .models import Stocks
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'stocks_stocks_fts'
+
+# bm25 column weights: ticker, name, sector, industry, description
+COLUMN_WEIGHTS = (10.0, 5.0, 2.0, 2.0, 0.5)
+
+_fts_available = None
+
+
+def fts_available() -> bool:
+    """Whether the FTS index exists on the current database (checked once)"""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+    return _fts_available
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_ids(query: str, limit: Optional[int] = None, offset: int = 0) -> List[int]:
+    """Return ids of matching stocks, best match first"""
+    match = _match_expression(query)
+    if match is None:
+        return []
+
+    if fts_available():
+        weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+        sql = (
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}), rowid"
+        )
+        params = [match]
+        if limit is not None or offset:
+            # SQLite only takes OFFSET after a LIMIT; -1 means no limit
+            sql += " LIMIT %s OFFSET %s"
+            params += [-1 if limit is None else limit, offset]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return [row[0] for row in cursor.fetchall()]
+        except DatabaseError as e:
+            logger.error(f"Full-text search failed for {query!r}, falling back: {str(e)}")
+
+    ids = _fallback_queryset(query).values_list('id', flat=True)
+    return list(ids[offset:offset + limit] if limit is not None else ids[offset:])
+
+
+def count_ids(query: str) -> int:
+    """Return how many stocks match, without fetching their ids"""
+    match = _match_expression(query)
+    if match is None:
+        return 0
+
+    if fts_available():
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+                return cursor.fetchone()[0]
+        except DatabaseError as e:
+            logger.error(f"Full-text count failed for {query!r}, falling back: {str(e)}")
+
+    return _fallback_queryset(query).count()
+
+
+class SearchResults:
+    """
+    Ranked ids for a Paginator: count() is one COUNT query and a slice is one
+    LIMIT/OFFSET query, so a page never fetches every matching id.
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+
+    def count(self) -> int:
+        return count_ids(self.query)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice) or item.step not in (None, 1):
+            raise TypeError("SearchResults only supports contiguous slices")
+        start = item.start or 0
+        limit = None if item.stop is None else max(0, item.stop - start)
+        return search_ids(self.query, limit, start)
+
+
+def _fallback_queryset(query: str):
+    terms = re.findall(r'\w+', query)
+    filters = Q()
+    for term in terms:
+        filters &= (Q(ticker__icontains=term) | Q(name__icontains=term) | Q(sector__icontains=term) |
+                    Q(industry__icontains=term) | Q(description__icontains=term))
+    # Exact tickers first, then ticker prefixes, then everything else
+    rank = Case(
+        When(ticker__iexact=query.strip(), then=0),
+        When(ticker__istartswith=query.strip(), then=1),
+        default=2,
+        output_field=IntegerField(),
+    )
+    return Stocks.objects.filter(filters).annotate(search_rank=rank).order_by('search_rank', 'ticker')
+
+
+def search(query: str, limit: Optional[int] = None) -> List[Stocks]:
+    """Return matching Stocks rows, best match first"""
+    ids = search_ids(query, limit)
+    stocks_by_id = Stocks.objects.in_bulk(ids)
+    return [stocks_by_id[pk] for pk in ids if pk in stocks_by_id]
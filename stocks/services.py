@@ -1,19 +1,528 @@
 """
 Stock data services for fetching and processing stock market data.
 """
+import asyncio
+import hashlib
 import logging
+import threading
+import time
+import weakref
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 import yfinance as yf
 import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Any
-from django.core.cache import cache
+from .bar_store import BarStore
+from .quote_cache import quote_cache
+from .search import search
 from django.conf import settings
 from datetime import datetime, timedelta
 from decimal import Decimal
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within each process only
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
 
+class SingleFlight:
+    """
+    Coalesce concurrent loads of the same cache key into a single call.
+    
+    Threads in this process that miss on the same key wait for the first
+    caller's result. The first caller also takes an exclusive flock on a
+    per-key lock file, so a worker process that finds the lock held waits
+    for the other process to fill the cache instead of hitting the provider
+    again. The kernel releases the lock if its holder dies. A caller that
+    waits longer than ``wait_timeout`` stops waiting and loads the key
+    itself rather than returning nothing.
+    """
+    
+    def __init__(self, lock_dir=None, wait_timeout: float = 10.0, poll_interval: float = 0.05):
+        self.lock_dir = Path(lock_dir) if lock_dir else None
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {
+            'misses': 0,
+            'coalesced': 0,
+            'remote_waits': 0,
+            'wait_timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+    
+    def do(self, key: str, fn, check=None):
+        """
+        Run ``fn`` once per key across concurrent callers and return its result.
+        
+        ``check`` is polled while another process holds the key's lock and
+        should return the loaded value once it is available (by default a
+        plain cache read of ``key``).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+        
+        if not leader:
+            started = time.monotonic()
+            finished = call['event'].wait(self.wait_timeout)
+            self._record_wait('coalesced', time.monotonic() - started)
+            if not finished:
+                # The leader is stuck; don't hand back nothing
+                self._count('wait_timeouts')
+                return self._miss(fn)
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        
+        try:
+            call['result'] = self._run_with_process_lock(key, fn, check or (lambda: quote_cache.get(key)))
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call['event'].set()
+    
+    def _run_with_process_lock(self, key: str, fn, check):
+        if fcntl is None or self.lock_dir is None:
+            return self._miss(fn)
+        
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.lock", 'a') as handle:
+            started = None
+            while True:
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    pass
+                # Another process is loading this key; wait for it to land in the cache
+                if started is None:
+                    started = time.monotonic()
+                elif time.monotonic() - started >= self.wait_timeout:
+                    self._record_wait('remote_waits', time.monotonic() - started)
+                    self._count('wait_timeouts')
+                    return self._miss(fn)
+                time.sleep(self.poll_interval)
+                value = check()
+                if value is not None:
+                    self._record_wait('remote_waits', time.monotonic() - started)
+                    return value
+            
+            try:
+                if started is not None:
+                    self._record_wait('remote_waits', time.monotonic() - started)
+                    # The previous holder may have filled the cache just before releasing
+                    value = check()
+                    if value is not None:
+                        return value
+                return self._miss(fn)
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+    
+    def _miss(self, fn):
+        self._count('misses')
+        return fn()
+    
+    def _count(self, counter: str):
+        with self._lock:
+            self._stats[counter] += 1
+    
+    def _record_wait(self, counter: str, waited: float):
+        with self._lock:
+            self._stats[counter] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of miss and wait counters for monitoring"""
+        with self._lock:
+            stats = dict(self._stats)
+        waits = stats['coalesced'] + stats['remote_waits']
+        stats['wait_time_avg'] = stats['wait_time_total'] / waits if waits else 0.0
+        stats['in_flight'] = len(self._calls)
+        return stats
+
+
+class TokenBucket:
+    """Non-blocking token bucket enforcing a requests-per-minute budget"""
+    
+    def __init__(self, rate_per_minute: int, capacity: Optional[int] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def try_acquire(self, tokens: int = 1) -> bool:
+        """Take tokens if the budget allows it; never waits"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """
+    Skip a provider after repeated failures.
+    
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls are rejected immediately for ``reset_timeout`` seconds. Then a
+    single trial call is let through; success closes the circuit again.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class _Unavailable:
+    """Falsy result of a provider call that was skipped or failed"""
+    
+    def __bool__(self):
+        return False
+    
+    def __repr__(self):
+        return 'UNAVAILABLE'
+
+
+UNAVAILABLE = _Unavailable()
+
+
+class DataProvider:
+    """
+    Guarded access to one upstream data provider.
+    
+    Every call passes the provider's circuit breaker and rate limit first, so
+    an unhealthy or exhausted provider is skipped in microseconds instead of
+    making the caller wait for a timeout. Exceptions count as failures.
+    
+    A skipped or failed call returns ``UNAVAILABLE`` rather than ``None``:
+    both are falsy, but only ``None`` (or an empty result) means the
+    provider actually answered that it has no data.
+    """
+    
+    def __init__(self, name: str, rate_per_minute: int, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.limiter = TokenBucket(rate_per_minute)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=200)
+        self._stats = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'short_circuited': 0,
+            'rate_limited': 0,
+            'last_error': '',
+        }
+    
+    def call(self, fn, *args, **kwargs):
+        """Run ``fn`` against the provider, returning UNAVAILABLE when skipped or failed"""
+        if not self._admit():
+            return UNAVAILABLE
+        
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._record_failure(started, str(e))
+            return UNAVAILABLE
+        
+        self._record_success(started)
+        return result
+    
+    async def acall(self, fn, *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Await ``fn(*args, **kwargs)`` under the same guards as call().
+        
+        Running past ``timeout`` seconds counts as a failure and returns UNAVAILABLE.
+        """
+        if not self._admit():
+            return UNAVAILABLE
+        
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(fn(*args, **kwargs), timeout)
+        except asyncio.TimeoutError:
+            self._record_failure(started, f"timed out after {timeout}s")
+            return UNAVAILABLE
+        except Exception as e:
+            self._record_failure(started, str(e))
+            return UNAVAILABLE
+        
+        self._record_success(started)
+        return result
+    
+    def _admit(self) -> bool:
+        if not self.breaker.allow_request():
+            self._count('short_circuited')
+            return False
+        if not self.limiter.try_acquire():
+            self._count('rate_limited')
+            return False
+        return True
+    
+    def _record_success(self, started: float):
+        self.breaker.record_success()
+        with self._lock:
+            self._stats['calls'] += 1
+            self._stats['successes'] += 1
+            self._latencies.append(time.monotonic() - started)
+    
+    def _record_failure(self, started: float, error: str):
+        self.breaker.record_failure()
+        with self._lock:
+            self._stats['calls'] += 1
+            self._stats['failures'] += 1
+            self._stats['last_error'] = error[:200]
+            self._latencies.append(time.monotonic() - started)
+        logger.warning(f"{self.name} call failed: {error}")
+    
+    def _count(self, counter: str):
+        with self._lock:
+            self._stats[counter] += 1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Health and latency statistics for monitoring"""
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+        stats['state'] = self.breaker.state
+        stats['latency_avg_ms'] = round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0
+        stats['latency_p95_ms'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2) if latencies else 0.0
+        stats['latency_max_ms'] = round(latencies[-1] * 1000, 2) if latencies else 0.0
+        return stats
+
+
+class TiingoClient:
+    """
+    Tiingo REST client with a pooled keep-alive session.
+    
+    A single quote fetches metadata and prices concurrently; batches use the
+    multi-ticker IEX endpoint so one request prices every symbol. Metadata
+    is cached like the yfinance fundamentals.
+    """
+    
+    def __init__(self, token: str, base_url: str = 'https://api.tiingo.com',
+                 timeout: float = 5, pool_size: int = 8, metadata_timeout: int = 86400):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.metadata_timeout = metadata_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='tiingo')
+    
+    def _get(self, path: str, **params):
+        """GET a Tiingo resource; None for 404s, raises on throttling and server errors"""
+        params['token'] = self.token
+        response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+        if response.status_code != 200:
+            return None
+        return response.json()
+    
+    def get_metadata(self, symbol: str) -> Optional[Dict[str, Any]]:
+        cache_key = f"tiingo_meta_{symbol}"
+        metadata = quote_cache.get(cache_key)
+        if metadata is None:
+            metadata = self._get(f"/tiingo/daily/{symbol}")
+            if metadata:
+                quote_cache.set(cache_key, metadata, self.metadata_timeout)
+        return metadata
+    
+    def get_quote(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Fetch one quote, requesting metadata and prices in parallel"""
+        meta_future = self._executor.submit(self.get_metadata, symbol)
+        price_data = self._get(f"/tiingo/daily/{symbol}/prices")
+        return self._build_price_quote(meta_future.result(), price_data)
+    
+    def get_quotes(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch quotes for many symbols with one multi-ticker IEX request"""
+        if not symbols:
+            return {}
+        
+        price_data = self._get("/iex/", tickers=','.join(symbols)) or []
+        metadata = dict(zip(symbols, self._executor.map(self.get_metadata, symbols)))
+        return self._build_iex_quotes(price_data, metadata)
+    
+    def close(self):
+        """Release pooled connections and worker threads"""
+        self.session.close()
+        self._executor.shutdown(wait=False)
+    
+    @staticmethod
+    def _build_price_quote(metadata: Optional[Dict[str, Any]], price_data) -> Optional[Dict[str, Any]]:
+        """Quote from a /tiingo/daily/<symbol>/prices response"""
+        if not metadata or not price_data:
+            return None
+        latest_price = price_data[0]
+        return TiingoClient._build_quote(
+            metadata,
+            latest_price['close'],
+            latest_price.get('prevClose', latest_price['close']),
+            latest_price.get('volume', 0),
+        )
+    
+    @staticmethod
+    def _build_iex_quotes(price_data, metadata: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Quotes from an /iex/ multi-ticker response, for the symbols in ``metadata``"""
+        results = {}
+        for row in price_data:
+            symbol = str(row.get('ticker', '')).upper()
+            current_price = row.get('tngoLast') or row.get('last')
+            if symbol not in metadata or current_price is None:
+                continue
+            results[symbol] = TiingoClient._build_quote(
+                metadata[symbol] or {'ticker': symbol, 'name': symbol},
+                current_price,
+                row.get('prevClose') or current_price,
+                row.get('volume') or 0,
+            )
+        return results
+    
+    @staticmethod
+    def _build_quote(metadata: Dict[str, Any], current_price, previous_close, volume) -> Dict[str, Any]:
+        return {
+            'symbol': str(metadata.get('ticker', '')).upper(),
+            'name': metadata.get('name', ''),
+            'current_price': float(current_price),
+            'previous_close': float(previous_close),
+            'day_change': float(current_price - previous_close),
+            'day_change_percent': float((current_price - previous_close) / previous_close * 100) if previous_close else 0,
+            'volume': int(volume or 0),
+            'description': metadata.get('description', ''),
+            'last_updated': datetime.now().isoformat(),
+            'source': 'tiingo'
+        }
+
+
+class AsyncTiingoClient:
+    """
+    asyncio counterpart of TiingoClient on a pooled aiohttp session.
+    
+    Requests never hold a thread, so one event loop can keep many quote
+    fetches in flight. The session belongs to the event loop that first
+    used it and is recreated when a different loop calls in.
+    """
+    
+    def __init__(self, token: str, base_url: str = 'https://api.tiingo.com',
+                 timeout: float = 5, pool_size: int = 8, metadata_timeout: int = 86400):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.metadata_timeout = metadata_timeout
+        self._session = None
+        self._session_loop = None
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={'Content-Type': 'application/json'},
+            )
+            self._session_loop = loop
+        return self._session
+    
+    async def _get(self, path: str, **params):
+        """GET a Tiingo resource; None for 404s, raises on throttling and server errors"""
+        params['token'] = self.token
+        async with self._get_session().get(f"{self.base_url}{path}", params=params) as response:
+            if response.status == 429 or response.status >= 500:
+                response.raise_for_status()
+            if response.status != 200:
+                return None
+            return await response.json(content_type=None)
+    
+    async def get_metadata(self, symbol: str) -> Optional[Dict[str, Any]]:
+        cache_key = f"tiingo_meta_{symbol}"
+        metadata = await asyncio.to_thread(quote_cache.get, cache_key)
+        if metadata is None:
+            metadata = await self._get(f"/tiingo/daily/{symbol}")
+            if metadata:
+                await asyncio.to_thread(quote_cache.set, cache_key, metadata, self.metadata_timeout)
+        return metadata
+    
+    async def get_quote(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Fetch one quote, requesting metadata and prices concurrently"""
+        metadata, price_data = await asyncio.gather(
+            self.get_metadata(symbol),
+            self._get(f"/tiingo/daily/{symbol}/prices"),
+        )
+        return TiingoClient._build_price_quote(metadata, price_data)
+    
+    async def get_quotes(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch quotes for many symbols with one multi-ticker IEX request"""
+        if not symbols:
+            return {}
+        
+        price_data, metadata = await asyncio.gather(
+            self._get("/iex/", tickers=','.join(symbols)),
+            asyncio.gather(*(self.get_metadata(symbol) for symbol in symbols)),
+        )
+        return TiingoClient._build_iex_quotes(price_data or [], dict(zip(symbols, metadata)))
+    
+    async def close(self):
+        """Release pooled connections"""
+        if self._session is not None:
+            await self._session.close()
+
+
 class StockDataService:
     """Service for fetching stock data from various APIs"""
     
@@ -22,169 +531,634 @@ class StockDataService:
         self.alpha_vantage_key = getattr(settings, 'STOCK_API_SETTINGS', {}).get('ALPHA_VANTAGE_API_KEY')
         self.finnhub_key = getattr(settings, 'STOCK_API_SETTINGS', {}).get('FINNHUB_API_KEY')
         self.cache_timeout = getattr(settings, 'STOCK_API_SETTINGS', {}).get('CACHE_TIMEOUT', 300)
+        self.max_concurrent_requests = getattr(settings, 'STOCK_API_SETTINGS', {}).get('MAX_CONCURRENT_REQUESTS', 8)
+        self.fundamentals_cache_timeout = getattr(settings, 'STOCK_API_SETTINGS', {}).get('FUNDAMENTALS_CACHE_TIMEOUT', 86400)
+        self.negative_cache_timeout = getattr(settings, 'STOCK_API_SETTINGS', {}).get('NEGATIVE_CACHE_TIMEOUT', 60)
+        self.provider_timeout = getattr(settings, 'STOCK_API_SETTINGS', {}).get('PROVIDER_TIMEOUT', 5)
+        self.cache_hard_timeout = getattr(settings, 'STOCK_API_SETTINGS', {}).get('CACHE_HARD_TIMEOUT', 1800)
+        self.single_flight = SingleFlight(
+            getattr(settings, 'STOCK_API_SETTINGS', {}).get('SINGLE_FLIGHT_LOCK_DIR', settings.BASE_DIR / 'cache' / 'locks'),
+        )
+        self._revalidating = set()
+        self._revalidate_lock = threading.Lock()
+        self._revalidate_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='revalidate')
+        self._quote_listeners = []
+        self._inflight = {}  # symbol -> asyncio task of the async fetch in progress
+        self._yfinance_slots = weakref.WeakKeyDictionary()  # event loop -> Semaphore
         
+        api_settings = getattr(settings, 'STOCK_API_SETTINGS', {})
+        self.tiingo = TiingoClient(
+            self.tiingo_token,
+            base_url=api_settings.get('TIINGO_BASE_URL', 'https://api.tiingo.com'),
+            timeout=self.provider_timeout,
+            pool_size=self.max_concurrent_requests,
+            metadata_timeout=self.fundamentals_cache_timeout,
+        ) if self.tiingo_token else None
+        self.async_tiingo = AsyncTiingoClient(
+            self.tiingo_token,
+            base_url=api_settings.get('TIINGO_BASE_URL', 'https://api.tiingo.com'),
+            timeout=self.provider_timeout,
+            pool_size=api_settings.get('ASYNC_MAX_CONCURRENT_REQUESTS', 100),
+            metadata_timeout=self.fundamentals_cache_timeout,
+        ) if self.tiingo_token else None
+        self.providers = {
+            name: DataProvider(
+                name,
+                rate_per_minute=api_settings.get('MAX_REQUESTS_PER_MINUTE', 60),
+                failure_threshold=api_settings.get('CIRCUIT_BREAKER_FAILURES', 5),
+                reset_timeout=api_settings.get('CIRCUIT_BREAKER_RESET_TIMEOUT', 30),
+            )
+            for name in ('yfinance', 'tiingo')
+        }
+        
+    def add_quote_listener(self, callback):
+        """Call ``callback({symbol: quote})`` with every batch of quotes fetched from the providers"""
+        self._quote_listeners.append(callback)
+    
+    def remove_quote_listener(self, callback):
+        if callback in self._quote_listeners:
+            self._quote_listeners.remove(callback)
+    
+    def _publish_quotes(self, quotes: Dict[str, Dict[str, Any]]):
+        for callback in self._quote_listeners:
+            try:
+                callback(quotes)
+            except Exception as e:
+                logger.error(f"Quote listener {callback!r} failed: {str(e)}")
+    
+    def _cache_put(self, key: str, value: Any, timeout: Optional[int] = None):
+        """
+        Cache a value with stale-while-revalidate timestamps.
+        
+        The entry is fresh for ``timeout`` (the soft TTL) and then served stale
+        until CACHE_HARD_TIMEOUT, when the cache drops it.
+        """
+        timeout = timeout or self.cache_timeout
+        entry = {'value': value, 'fresh_until': time.time() + timeout}
+        quote_cache.set(key, entry, max(timeout, self.cache_hard_timeout))
+    
+    def _cache_read(self, entry: Any):
+        """Unwrap a cached entry into (value, is_fresh)"""
+        if not entry:
+            return None, False
+        return entry['value'], time.time() < entry['fresh_until']
+    
+    def _fresh_cached(self, key: str) -> Any:
+        value, fresh = self._cache_read(quote_cache.get(key))
+        return value if fresh else None
+    
+    def _revalidate(self, key: str, fn, *args):
+        """Refresh a stale entry on a background thread, once per key"""
+        with self._revalidate_lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+        
+        def run():
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Background refresh of {key} failed: {str(e)}")
+            finally:
+                with self._revalidate_lock:
+                    self._revalidating.discard(key)
+        
+        self._revalidate_executor.submit(run)
+    
     def get_stock_data(self, symbol: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
         """
         Get comprehensive stock data for a given symbol.
+        
+        A stale cached quote is returned immediately while one background
+        refresh runs. Concurrent cache misses for the same symbol are
+        coalesced, so only one caller fetches from the providers while the
+        others wait for its result.
         """
         cache_key = f"stock_data_{symbol}"
         
         if use_cache:
-            cached_data = cache.get(cache_key)
+            cached = quote_cache.get_many([cache_key, f"stock_data_miss_{symbol}"])
+            cached_data, fresh = self._cache_read(cached.get(cache_key))
             if cached_data:
+                if not fresh:
+                    self._revalidate(cache_key, self._coalesced_load, symbol, cache_key)
                 logger.info(f"Retrieved cached data for {symbol}")
                 return cached_data
+            if cached.get(f"stock_data_miss_{symbol}"):
+                # Failed recently; don't wait on the providers again yet
+                return None
+            
+            try:
+                return self._coalesced_load(symbol, cache_key)
+            except Exception as e:
+                logger.error(f"Error fetching stock data for {symbol}: {str(e)}")
+                return None
+        
+        return self._load_stock_data(symbol)
+    
+    def _coalesced_load(self, symbol: str, cache_key: str) -> Optional[Dict[str, Any]]:
+        return self.single_flight.do(
+            cache_key,
+            lambda: self._load_stock_data(symbol, cache_key),
+            check=lambda: self._fresh_cached(cache_key),
+        )
+    
+    def _load_stock_data(self, symbol: str, cache_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Fetch a quote from the providers, caching it when a cache key is given"""
+        if cache_key:
+            # Another caller may have refreshed the cache while we waited for the lock
+            cached_data = self._fresh_cached(cache_key)
+            if cached_data:
+                return cached_data
         
         try:
             # Try yfinance first (free and reliable)
-            stock_data = self._get_yfinance_data(symbol)
+            stock_data = self.providers['yfinance'].call(self._get_yfinance_data, symbol)
+            answered = stock_data is not UNAVAILABLE
             
             if not stock_data and self.tiingo_token:
                 # Fallback to Tiingo
-                stock_data = self._get_tiingo_data(symbol)
+                stock_data = self.providers['tiingo'].call(self._get_tiingo_data, symbol)
+                answered = answered and stock_data is not UNAVAILABLE
             
-            if stock_data and use_cache:
-                cache.set(cache_key, stock_data, self.cache_timeout)
+            if stock_data and cache_key:
+                self._cache_put(cache_key, stock_data)
                 logger.info(f"Cached data for {symbol}")
+            elif not stock_data and answered and cache_key:
+                # Only a real "no data" answer is remembered, not a skipped or failed call
+                quote_cache.set(f"stock_data_miss_{symbol}", True, self.negative_cache_timeout)
+            
+            if stock_data:
+                self._publish_quotes({symbol: stock_data})
                 
-            return stock_data
+            return stock_data or None
             
         except Exception as e:
             logger.error(f"Error fetching stock data for {symbol}: {str(e)}")
             return None
     
-    def _get_yfinance_data(self, symbol: str) -> Optional[Dict[str, Any]]:
-        """Fetch stock data using yfinance"""
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Quote cache hit rates plus miss and single-flight wait statistics"""
+        return {**quote_cache.get_stats(), **self.single_flight.get_stats()}
+    
+    def get_provider_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Circuit state, rate limiting and latency statistics per provider"""
+        return {name: provider.get_stats() for name, provider in self.providers.items()}
+    
+    def get_cached_stock_data(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Return the cached quote (fresh or stale) for a symbol without calling any provider"""
+        return self._cache_read(quote_cache.get(f"stock_data_{symbol}"))[0]
+    
+    def get_cached_stocks(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Batch version of get_cached_stock_data: one cache round trip, no provider calls"""
+        entries = quote_cache.get_many([f"stock_data_{symbol}" for symbol in symbols])
+        results = {}
+        for symbol in symbols:
+            value = self._cache_read(entries.get(f"stock_data_{symbol}"))[0]
+            if value:
+                results[symbol] = value
+        return results
+    
+    async def aget_stock_data(self, symbol: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Async get_stock_data with the same cache rules.
+        
+        Concurrent misses for a symbol on one event loop share a single fetch;
+        each provider call is bounded by PROVIDER_TIMEOUT.
+        """
+        cache_key = f"stock_data_{symbol}"
+        
+        if use_cache:
+            cached = await asyncio.to_thread(quote_cache.get_many, [cache_key, f"stock_data_miss_{symbol}"])
+            cached_data, fresh = self._cache_read(cached.get(cache_key))
+            if cached_data:
+                if not fresh:
+                    self._revalidate(cache_key, self._coalesced_load, symbol, cache_key)
+                return cached_data
+            if cached.get(f"stock_data_miss_{symbol}"):
+                return None
+        
+        return await self._aload_coalesced(symbol, cache_key if use_cache else None)
+    
+    async def aget_multiple_stocks(self, symbols: List[str], use_cache: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+        Async get_multiple_stocks.
+        
+        Cached quotes come from one cache round trip; every miss is then
+        fetched concurrently with asyncio.gather, so the batch takes about as
+        long as its slowest symbol, and a symbol that times out is simply
+        left out of the result.
+        """
+        results = {}
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return results
+        
+        missing = symbols
+        if use_cache:
+            cached = await asyncio.to_thread(
+                quote_cache.get_many,
+                [f"stock_data_{symbol}" for symbol in symbols] + [f"stock_data_miss_{symbol}" for symbol in symbols],
+            )
+            missing = []
+            stale = []
+            for symbol in symbols:
+                data, fresh = self._cache_read(cached.get(f"stock_data_{symbol}"))
+                if data:
+                    results[symbol] = data
+                    if not fresh:
+                        stale.append(symbol)
+                elif not cached.get(f"stock_data_miss_{symbol}"):
+                    missing.append(symbol)
+            
+            if stale:
+                self._revalidate(
+                    f"stock_data_batch_{','.join(stale)}",
+                    self.get_multiple_stocks, stale, True, None, True
+                )
+        
+        fetched = await asyncio.gather(
+            *(self._aload_coalesced(symbol, f"stock_data_{symbol}" if use_cache else None) for symbol in missing),
+            return_exceptions=True,
+        )
+        for symbol, data in zip(missing, fetched):
+            if isinstance(data, BaseException):
+                logger.error(f"Error fetching stock data for {symbol}: {str(data)}")
+            elif data:
+                results[symbol] = data
+        return results
+    
+    async def _aload_coalesced(self, symbol: str, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        task = self._inflight.get(symbol)
+        if task is None or task.get_loop() is not loop:
+            task = loop.create_task(self._aload_stock_data(symbol, cache_key))
+            self._inflight[symbol] = task
+            task.add_done_callback(lambda done: self._inflight.pop(symbol, None) if self._inflight.get(symbol) is done else None)
+        # One caller giving up must not cancel the fetch for the others
+        return await asyncio.shield(task)
+    
+    async def _aload_stock_data(self, symbol: str, cache_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Async _load_stock_data: yfinance on a bounded set of threads, then native async Tiingo"""
         try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.info
-            hist = ticker.history(period="1d")
+            # yfinance has no async API; wait for a thread slot before the timeout starts
+            async with self._yfinance_slot():
+                stock_data = await self.providers['yfinance'].acall(
+                    asyncio.to_thread, self._get_yfinance_data, symbol, timeout=self.provider_timeout
+                )
+            answered = stock_data is not UNAVAILABLE
             
-            if hist.empty:
-                return None
-                
-            current_price = hist['Close'].iloc[-1]
-            
-            return {
-                'symbol': symbol.upper(),
-                'name': info.get('longName', symbol),
-                'current_price': float(current_price),
-                'previous_close': float(info.get('previousClose', current_price)),
-                'day_change': float(current_price - info.get('previousClose', current_price)),
-                'day_change_percent': float((current_price - info.get('previousClose', current_price)) / info.get('previousClose', current_price) * 100) if info.get('previousClose') else 0,
-                'volume': int(info.get('volume', 0)),
-                'market_cap': info.get('marketCap', 0),
-                'description': info.get('longBusinessSummary', ''),
-                'sector': info.get('sector', ''),
-                'industry': info.get('industry', ''),
-                'last_updated': datetime.now().isoformat(),
-                'source': 'yfinance'
-            }
+            if not stock_data and self.async_tiingo:
+                stock_data = await self.providers['tiingo'].acall(
+                    self.async_tiingo.get_quote, symbol, timeout=self.provider_timeout
+                )
+                answered = answered and stock_data is not UNAVAILABLE
+            
+            if stock_data and cache_key:
+                await asyncio.to_thread(self._cache_put, cache_key, stock_data)
+            elif not stock_data and answered and cache_key:
+                await asyncio.to_thread(quote_cache.set, f"stock_data_miss_{symbol}", True, self.negative_cache_timeout)
+            
+            if stock_data:
+                await asyncio.to_thread(self._publish_quotes, {symbol: stock_data})
+            
+            return stock_data or None
             
         except Exception as e:
-            logger.warning(f"yfinance failed for {symbol}: {str(e)}")
+            logger.error(f"Error fetching stock data for {symbol}: {str(e)}")
             return None
     
-    def _get_tiingo_data(self, symbol: str) -> Optional[Dict[str, Any]]:
-        """Fetch stock data using Tiingo API"""
-        if not self.tiingo_token:
+    def _yfinance_slot(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        slots = self._yfinance_slots.get(loop)
+        if slots is None:
+            slots = self._yfinance_slots[loop] = asyncio.Semaphore(self.max_concurrent_requests)
+        return slots
+    
+    def _get_yfinance_data(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Fetch stock data using yfinance; errors propagate to the provider guard"""
+        ticker = yf.Ticker(symbol)
+        hist = ticker.history(period="5d", timeout=self.provider_timeout)
+        if hist.empty:
             return None
-            
+        
         try:
-            headers = {'Content-Type': 'application/json'}
-            
-            # Get stock metadata
-            meta_url = f"https://api.tiingo.com/tiingo/daily/{symbol}?token={self.tiingo_token}"
-            price_url = f"https://api.tiingo.com/tiingo/daily/{symbol}/prices?token={self.tiingo_token}"
+            fundamentals = self._get_yfinance_fundamentals(symbol, ticker)
+        except Exception as e:
+            # Already inside the provider guard; a quote without company details is still useful
+            logger.warning(f"yfinance fundamentals failed for {symbol}: {str(e)}")
+            fundamentals = {}
+        return self._build_yfinance_quote(symbol, fundamentals, hist)
+    
+    def _get_yfinance_fundamentals(self, symbol: str, ticker: Optional[yf.Ticker] = None) -> Dict[str, Any]:
+        """
+        Get slow-changing company metadata for a symbol.
+        
+        ``ticker.info`` is by far the slowest yfinance call, so its result is
+        cached for FUNDAMENTALS_CACHE_TIMEOUT (a day) instead of expiring with
+        the quote. Callers run it under the yfinance provider guard; errors
+        propagate to them.
+        """
+        cache_key = f"stock_fundamentals_{symbol}"
+        fundamentals = quote_cache.get(cache_key)
+        if fundamentals is not None:
+            return fundamentals
+        
+        info = (ticker or yf.Ticker(symbol)).info
+        if not info:
+            return {}
+        
+        fundamentals = self._extract_fundamentals(symbol, info)
+        if fundamentals:
+            quote_cache.set(cache_key, fundamentals, self.fundamentals_cache_timeout)
+        return fundamentals
+    
+    def _get_yfinance_fundamentals_many(self, symbols: List[str], max_workers: int) -> Dict[str, Dict[str, Any]]:
+        """Get fundamentals for several symbols, looking up cache misses in a bounded thread pool"""
+        cached = quote_cache.get_many([f"stock_fundamentals_{symbol}" for symbol in symbols])
+        results = {symbol: cached[f"stock_fundamentals_{symbol}"]
+                   for symbol in symbols if f"stock_fundamentals_{symbol}" in cached}
+        
+        def lookup(symbol):
+            return self.providers['yfinance'].call(self._get_yfinance_fundamentals, symbol) or {}
+        
+        missing = [symbol for symbol in symbols if symbol not in results]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+                results.update(zip(missing, executor.map(lookup, missing)))
+        
+        return results
+    
+    def _extract_fundamentals(self, symbol: str, info: Dict[str, Any]) -> Dict[str, Any]:
+        """Keep only the slow-changing fields of a yfinance info mapping"""
+        if not info:
+            return {}
+        
+        return {
+            'name': info.get('longName') or symbol,
+            'description': info.get('longBusinessSummary') or '',
+            'sector': info.get('sector') or '',
+            'industry': info.get('industry') or '',
+            'shares_outstanding': info.get('sharesOutstanding') or 0,
+            'market_cap': info.get('marketCap') or 0,
+        }
+    
+    def _build_yfinance_quote(self, symbol: str, fundamentals: Dict[str, Any], hist: pd.DataFrame) -> Optional[Dict[str, Any]]:
+        """
+        Build the quote dict from cached fundamentals and recent daily bars.
+        
+        Price, previous close and volume all come from the bars, so a quote
+        refresh only needs the cheap history call.
+        """
+        if hist is None or hist.empty:
+            return None
             
-            meta_response = requests.get(meta_url, headers=headers, timeout=10)
-            price_response = requests.get(price_url, headers=headers, timeout=10)
+        hist = hist.dropna(subset=['Close'])
+        if hist.empty:
+            return None
             
-            if meta_response.status_code == 200 and price_response.status_code == 200:
-                metadata = meta_response.json()
-                price_data = price_response.json()
-                
-                if price_data:
-                    latest_price = price_data[0]
-                    current_price = latest_price['close']
-                    previous_close = latest_price.get('prevClose', current_price)
-                    
-                    return {
-                        'symbol': metadata['ticker'],
-                        'name': metadata['name'],
-                        'current_price': float(current_price),
-                        'previous_close': float(previous_close),
-                        'day_change': float(current_price - previous_close),
-                        'day_change_percent': float((current_price - previous_close) / previous_close * 100) if previous_close else 0,
-                        'volume': int(latest_price.get('volume', 0)),
-                        'description': metadata.get('description', ''),
-                        'last_updated': datetime.now().isoformat(),
-                        'source': 'tiingo'
-                    }
-                    
-        except Exception as e:
-            logger.warning(f"Tiingo API failed for {symbol}: {str(e)}")
+        current_price = float(hist['Close'].iloc[-1])
+        previous_close = float(hist['Close'].iloc[-2]) if len(hist) > 1 else None
+        volume = hist['Volume'].iloc[-1] if 'Volume' in hist else 0
+        
+        shares_outstanding = fundamentals.get('shares_outstanding') or 0
+        market_cap = int(shares_outstanding * current_price) if shares_outstanding else fundamentals.get('market_cap', 0)
+        
+        return {
+            'symbol': symbol.upper(),
+            'name': fundamentals.get('name', symbol),
+            'current_price': current_price,
+            'previous_close': previous_close or current_price,
+            'day_change': current_price - previous_close if previous_close else 0,
+            'day_change_percent': (current_price - previous_close) / previous_close * 100 if previous_close else 0,
+            'volume': int(volume) if pd.notna(volume) else 0,
+            'market_cap': market_cap,
+            'description': fundamentals.get('description', ''),
+            'sector': fundamentals.get('sector', ''),
+            'industry': fundamentals.get('industry', ''),
+            'last_updated': datetime.now().isoformat(),
+            'source': 'yfinance'
+        }
+    
+    def _get_tiingo_data(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Fetch stock data using Tiingo API; transport errors propagate to the provider guard"""
+        if not self.tiingo:
+            return None
+        return self.tiingo.get_quote(symbol)
+    
+    def get_multiple_stocks(self, symbols: List[str], use_cache: bool = True,
+                            max_workers: Optional[int] = None,
+                            force_refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Get data for multiple stocks.
+        
+        Cache misses are fetched together: one multi-ticker yfinance history
+        download for prices plus a bounded thread pool for the per-symbol
+        metadata. Symbols that cannot be fetched are left out of the result,
+        so one bad ticker never fails the whole batch.
+        
+        ``force_refresh`` skips cached reads but still caches what it fetches,
+        which is what the background refresher wants.
+        """
+        results = {}
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return results
+        
+        missing = symbols
+        if use_cache and not force_refresh:
+            cached = quote_cache.get_many(
+                [f"stock_data_{symbol}" for symbol in symbols] +
+                [f"stock_data_miss_{symbol}" for symbol in symbols]
+            )
+            missing = []
+            stale = []
+            for symbol in symbols:
+                data, fresh = self._cache_read(cached.get(f"stock_data_{symbol}"))
+                if data:
+                    results[symbol] = data
+                    if not fresh:
+                        stale.append(symbol)
+                elif not cached.get(f"stock_data_miss_{symbol}"):
+                    missing.append(symbol)
             
-        return None
+            if stale:
+                self._revalidate(
+                    f"stock_data_batch_{','.join(stale)}",
+                    self.get_multiple_stocks, stale, True, max_workers, True
+                )
+        
+        if not missing:
+            return results
+        
+        if len(missing) == 1 and not force_refresh:
+            data = self.get_stock_data(missing[0], use_cache=use_cache)
+            if data:
+                results[missing[0]] = data
+            return results
+        
+        max_workers = max_workers or self.max_concurrent_requests
+        fetched = self._get_yfinance_batch(missing, max_workers)
+        answered = fetched is not UNAVAILABLE
+        fetched = fetched or {}
+        
+        failed = [symbol for symbol in missing if symbol not in fetched]
+        if failed and self.tiingo:
+            quotes = self.providers['tiingo'].call(self.tiingo.get_quotes, failed)
+            answered = answered and quotes is not UNAVAILABLE
+            fetched.update(quotes or {})
+        
+        failed = [symbol for symbol in missing if symbol not in fetched]
+        if failed:
+            logger.warning(f"Could not fetch data for {len(failed)} of {len(missing)} symbols: {', '.join(failed)}")
+            if use_cache and answered:
+                quote_cache.set_many({f"stock_data_miss_{symbol}": True for symbol in failed}, self.negative_cache_timeout)
+        
+        if fetched and use_cache:
+            for symbol, data in fetched.items():
+                self._cache_put(f"stock_data_{symbol}", data)
+            logger.info(f"Cached data for {len(fetched)} symbols")
+        
+        if fetched:
+            self._publish_quotes(fetched)
+        
+        results.update(fetched)
+        return results
     
-    def get_multiple_stocks(self, symbols: List[str]) -> Dict[str, Dict[str, Any]]:
-        """Get data for multiple stocks"""
+    def _get_yfinance_batch(self, symbols: List[str], max_workers: int) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch quotes for several symbols with one history download plus cached fundamentals.
+        
+        Returns UNAVAILABLE when the download was skipped or failed.
+        """
+        history = self.providers['yfinance'].call(
+            yf.download, symbols, period="5d", group_by='ticker', auto_adjust=True,
+            progress=False, threads=False, timeout=self.provider_timeout
+        )
+        
+        if history is UNAVAILABLE:
+            return UNAVAILABLE
+        if history is None or history.empty:
+            return {}
+        
+        fundamentals = self._get_yfinance_fundamentals_many(symbols, max_workers)
+        
         results = {}
         for symbol in symbols:
-            data = self.get_stock_data(symbol)
-            if data:
-                results[symbol] = data
+            try:
+                if isinstance(history.columns, pd.MultiIndex):
+                    if symbol not in history.columns.get_level_values(0):
+                        continue
+                    hist = history[symbol]
+                else:
+                    hist = history
+                data = self._build_yfinance_quote(symbol, fundamentals.get(symbol) or {}, hist)
+                if data:
+                    results[symbol] = data
+            except Exception as e:
+                logger.warning(f"yfinance batch failed for {symbol}: {str(e)}")
+        
         return results
     
-    def get_stock_history(self, symbol: str, period: str = "1mo") -> Optional[pd.DataFrame]:
-        """Get historical stock data"""
-        cache_key = f"stock_history_{symbol}_{period}"
+    HISTORY_PERIOD_DAYS = {
+        '1d': 1, '5d': 5, '1mo': 31, '3mo': 92, '6mo': 183,
+        '1y': 366, '2y': 731, '5y': 1827, '10y': 3653,
+    }
+    HISTORY_PERIODS = frozenset(HISTORY_PERIOD_DAYS) | {'ytd', 'max'}
+    HISTORY_INTERVALS = frozenset({'1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h', '1d', '5d', '1wk', '1mo', '3mo'})
+    
+    def _period_start(self, period: str) -> int:
+        """Epoch seconds at which a yfinance-style period begins"""
+        now = datetime.now()
+        if period == 'max':
+            return 0
+        if period == 'ytd':
+            return int(datetime(now.year, 1, 1).timestamp())
+        return int((now - timedelta(days=self.HISTORY_PERIOD_DAYS.get(period, 31))).timestamp())
+    
+    def get_stock_history(self, symbol: str, period: str = "1mo", interval: str = "1d") -> Optional[pd.DataFrame]:
+        """
+        Get historical stock data.
         
-        cached_data = cache.get(cache_key)
-        if cached_data is not None:
-            return cached_data
+        Bars are served from the persistent bar store. A period the store has
+        never covered is downloaded once; after that only missing bars are
+        appended, in the background once the last sync is older than
+        CACHE_TIMEOUT (stale-while-revalidate, like quotes). Raises ValueError
+        for a period or interval yfinance doesn't know; the interval names a
+        directory of the bar store and both end up in cache keys.
+        """
+        if period not in self.HISTORY_PERIODS:
+            raise ValueError(f"Unsupported period: {period}")
+        if interval not in self.HISTORY_INTERVALS:
+            raise ValueError(f"Unsupported interval: {interval}")
+        symbol = symbol.upper()
+        start = self._period_start(period)
+        sync_key = f"stock_history_sync_{symbol}_{interval}"
         
+        covered_from = bar_store.covered_from(symbol, interval)
+        if covered_from is None or covered_from > start:
+            self.single_flight.do(
+                sync_key,
+                lambda: self._sync_history(symbol, interval, period, start),
+                check=lambda: self._fresh_cached(sync_key),
+            )
+        else:
+            _, fresh = self._cache_read(quote_cache.get(sync_key))
+            if not fresh:
+                self._revalidate(sync_key, self._sync_history, symbol, interval)
+        
+        if interval == '1d' and period in ('1d', '5d'):
+            # Day periods mean trading sessions, not calendar days
+            bars = bar_store.tail(symbol, interval, self.HISTORY_PERIOD_DAYS[period])
+        else:
+            bars = bar_store.read(symbol, interval, start=start)
+        
+        if not len(bars):
+            return None
+        return bar_store.to_frame(bars)
+    
+    def _sync_history(self, symbol: str, interval: str, period: Optional[str] = None,
+                      start: Optional[int] = None) -> bool:
+        """Backfill a period the store doesn't cover yet, or append bars since the last one"""
         try:
             ticker = yf.Ticker(symbol)
-            hist = ticker.history(period=period)
+            last_ts = bar_store.last_timestamp(symbol, interval)
+            
+            if period is not None or last_ts is None:
+                period = period or '1mo'
+                hist = self.providers['yfinance'].call(
+                    ticker.history, period=period, interval=interval, timeout=self.provider_timeout
+                )
+                if hist is UNAVAILABLE or hist is None or hist.empty:
+                    return False
+                bar_store.write(symbol, interval, bar_store.from_frame(hist),
+                                start=start if start is not None else self._period_start(period))
+            else:
+                # Re-fetch from the last stored bar so a partial bar gets completed
+                hist = self.providers['yfinance'].call(
+                    ticker.history, start=pd.Timestamp(last_ts, unit='s').strftime('%Y-%m-%d'),
+                    interval=interval, timeout=self.provider_timeout
+                )
+                if hist is UNAVAILABLE or hist is None:
+                    return False
+                if not hist.empty:
+                    added = bar_store.append(symbol, interval, bar_store.from_frame(hist))
+                    logger.info(f"Appended {added} {interval} bars for {symbol}")
             
-            if not hist.empty:
-                cache.set(cache_key, hist, self.cache_timeout)
-                return hist
+            self._cache_put(f"stock_history_sync_{symbol}_{interval}", True)
+            return True
                 
         except Exception as e:
             logger.error(f"Error fetching history for {symbol}: {str(e)}")
         
-        return None
+        return False
     
     def search_stocks(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search for stocks by name or symbol"""
-        # This is a simplified search - in production, you might want to use
-        # a more sophisticated search API
-        nasdaq_symbols = [
-            {"symbol": "AAPL", "name": "Apple Inc."},
-            {"symbol": "MSFT", "name": "Microsoft Corporation"},
-            {"symbol": "GOOGL", "name": "Alphabet Inc."},
-            {"symbol": "AMZN", "name": "Amazon.com Inc."},
-            {"symbol": "TSLA", "name": "Tesla Inc."},
-            {"symbol": "META", "name": "Meta Platforms Inc."},
-            {"symbol": "NVDA", "name": "NVIDIA Corporation"},
-            {"symbol": "NFLX", "name": "Netflix Inc."},
-            {"symbol": "ADBE", "name": "Adobe Inc."},
-            {"symbol": "CRM", "name": "Salesforce Inc."},
+        """Search stored stocks by ticker, name, sector, industry or description, best match first"""
+        return [
+            {'symbol': stock.ticker, 'name': stock.name, 'sector': stock.sector, 'industry': stock.industry}
+            for stock in search(query, limit)
         ]
-        
-        query = query.lower()
-        results = []
-        
-        for stock in nasdaq_symbols:
-            if (query in stock["symbol"].lower() or 
-                query in stock["name"].lower()):
-                results.append(stock)
-                if len(results) >= limit:
-                    break
-        
-        return results
 
 
 class PortfolioAnalyzer:
@@ -246,5 +1220,6 @@ class PortfolioAnalyzer:
 
 
 # Singleton instances
+bar_store = BarStore(getattr(settings, 'STOCK_API_SETTINGS', {}).get('BAR_STORE_DIR', settings.BASE_DIR / 'data' / 'bars'))
 stock_service = StockDataService()
 portfolio_analyzer = PortfolioAnalyzer()
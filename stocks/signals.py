@@ -0,0 +1,22 @@
+"""
+Model signal handlers for the stocks app, connected in StocksConfig.ready().
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .autocomplete import autocomplete_index
+from .models import Stocks
+
+
+@receiver(post_save, sender=Stocks)
+def index_saved_stock(sender, instance, **kwargs):
+    """Keep the typeahead index current as stocks are added or renamed"""
+    if instance.is_active:
+        autocomplete_index.add(instance.pk, instance.ticker, instance.name)
+    else:
+        autocomplete_index.remove(instance.pk)
+
+
+@receiver(post_delete, sender=Stocks)
+def unindex_deleted_stock(sender, instance, **kwargs):
+    autocomplete_index.remove(instance.pk)
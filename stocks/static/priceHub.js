@@ -0,0 +1,52 @@
+// Live prices for every element marked data-live-price="SYMBOL", pushed by
+// the market-data hub (/ws/prices/). Frames only carry changed fields, so
+// only symbols whose price changed ("p") touch the DOM.
+(function () {
+    const elements = document.querySelectorAll('[data-live-price]');
+    if (!elements.length || !window.WebSocket) {
+        return;
+    }
+    const symbols = [...new Set([...elements].map((element) => element.dataset.livePrice))];
+    let retryDelay = 1000;
+
+    function updatePrice(symbol, price) {
+        document.querySelectorAll(`[data-live-price="${symbol}"]`).forEach((element) => {
+            // Keep the element's own formatting around the number
+            element.textContent = element.textContent.replace(/[\d,]+(\.\d+)?/, price.toFixed(2));
+        });
+    }
+
+    function connect() {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/prices/`);
+
+        socket.addEventListener('open', () => {
+            retryDelay = 1000;
+            socket.send(JSON.stringify({ action: 'subscribe', symbols: symbols }));
+        });
+
+        socket.addEventListener('message', (event) => {
+            const message = JSON.parse(event.data);
+            if (message.type !== 'prices') {
+                return;
+            }
+            for (const [symbol, fields] of Object.entries(message.data)) {
+                if (fields.p !== undefined && fields.p !== null) {
+                    updatePrice(symbol, fields.p);
+                }
+            }
+        });
+
+        socket.addEventListener('close', (event) => {
+            if (event.code === 4403) {
+                return; // Not signed in; retrying won't help
+            }
+            setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 30000);
+        });
+
+        window.addEventListener('beforeunload', () => socket.close());
+    }
+
+    connect();
+})();
@@ -0,0 +1,183 @@
+"""
+Shared fan-out of price updates for streaming clients.
+
+One poller thread per process reads the Stocks rows that changed since its
+last pass (one query, however many clients are connected) and publishes each
+changed quote once. Every subscriber registers the symbols it cares about;
+publishing hands a subscriber only its own symbols, so the cost per client
+per update is a dict write and at most one event-loop wakeup. A slow client
+never queues more than one pending quote per symbol: newer quotes replace
+older ones until the client reads them.
+"""
+import asyncio
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Set
+from django.conf import settings
+from django.db import connection
+
+from .models import Stocks
+
+logger = logging.getLogger(__name__)
+
+# Rows committed slightly out of last_updated order (or by another process
+# with a skewed clock) are still picked up by re-reading this window
+POLL_OVERLAP = timedelta(seconds=5)
+
+QUOTE_FIELDS = ['ticker', 'curr_price', 'previous_close', 'volume', 'market_cap', 'last_updated', 'quote_checked_at']
+
+
+class Subscription:
+    """One streaming client's pending price updates, read on its event loop"""
+
+    def __init__(self, symbols: Iterable[str], loop: asyncio.AbstractEventLoop):
+        self.symbols = set(symbols)
+        self.loop = loop
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self._event = asyncio.Event()
+        self._lock = threading.Lock()
+        self._wakeup_scheduled = False
+        self.closed = False
+
+    def offer(self, payloads: List[Dict[str, Any]]):
+        """Queue quotes for this client; safe to call from any thread"""
+        with self._lock:
+            for payload in payloads:
+                self.pending[payload['symbol']] = payload
+            if self._wakeup_scheduled:
+                return
+            self._wakeup_scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            self.closed = True  # The client's event loop is gone
+
+    def _wake(self):
+        with self._lock:
+            self._wakeup_scheduled = False
+        self._event.set()
+
+    async def get(self, timeout: float) -> Dict[str, Dict[str, Any]]:
+        """Wait up to ``timeout`` seconds and return {symbol: quote} (empty on timeout)"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        with self._lock:
+            self._event.clear()
+            batch, self.pending = self.pending, {}
+        return batch
+
+
+class PriceBroadcaster:
+    """Polls stored quotes once per interval and fans changes out to subscribers"""
+
+    def __init__(self, poll_interval: float = 1.0):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._by_symbol: Dict[str, Set[Subscription]] = {}
+        self._subscriptions: Set[Subscription] = set()
+        self._poller = None
+        self._cursor = None
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        self.stats = {'polls': 0, 'published': 0}
+
+    def subscribe(self, symbols: Iterable[str]) -> Subscription:
+        """Register the calling event loop's client for ``symbols``"""
+        subscription = Subscription(symbols, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+            for symbol in subscription.symbols:
+                self._by_symbol.setdefault(symbol, set()).add(subscription)
+            if self.poll_interval and (self._poller is None or not self._poller.is_alive()):
+                self._poller = threading.Thread(target=self._poll_loop, name='price-broadcaster', daemon=True)
+                self._poller.start()
+        return subscription
+
+    def update_symbols(self, subscription: Subscription, add: Iterable[str] = (), remove: Iterable[str] = ()):
+        """Change what an existing subscription receives"""
+        with self._lock:
+            for symbol in add:
+                subscription.symbols.add(symbol)
+                self._by_symbol.setdefault(symbol, set()).add(subscription)
+            for symbol in remove:
+                subscription.symbols.discard(symbol)
+                with subscription._lock:
+                    subscription.pending.pop(symbol, None)
+                subscribers = self._by_symbol.get(symbol)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._by_symbol[symbol]
+                        self.latest.pop(symbol, None)  # No longer polled, so it would go stale
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            for symbol in subscription.symbols:
+                subscribers = self._by_symbol.get(symbol)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._by_symbol[symbol]
+                        self.latest.pop(symbol, None)  # No longer polled, so it would go stale
+
+    def publish(self, payloads: Iterable[Dict[str, Any]]):
+        """Send each changed quote to the clients watching its symbol"""
+        per_subscriber: Dict[Subscription, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for payload in payloads:
+                symbol = payload['symbol']
+                previous = self.latest.get(symbol)
+                if previous is not None and previous['last_updated'] == payload['last_updated']:
+                    continue  # Already sent
+                self.latest[symbol] = payload
+                self.stats['published'] += 1
+                for subscription in self._by_symbol.get(symbol, ()):
+                    per_subscriber.setdefault(subscription, []).append(payload)
+
+        for subscription, batch in per_subscriber.items():
+            subscription.offer(batch)
+            if subscription.closed:
+                self.unsubscribe(subscription)
+
+    def poll(self):
+        """Publish every watched stock whose stored quote changed since the last poll"""
+        with self._lock:
+            symbols = list(self._by_symbol)
+        if not symbols:
+            return
+        stocks = Stocks.objects.filter(ticker__in=symbols).only(*QUOTE_FIELDS)
+        if self._cursor is not None:
+            stocks = stocks.filter(last_updated__gte=self._cursor - POLL_OVERLAP)
+        stocks = list(stocks)
+        self.stats['polls'] += 1
+        if stocks:
+            self._cursor = max(filter(None, [self._cursor] + [stock.last_updated for stock in stocks]))
+            self.publish(stock.quote_payload() for stock in stocks)
+
+    def _poll_loop(self):
+        try:
+            while True:
+                with self._lock:
+                    if not self._subscriptions:
+                        self._poller = None
+                        return
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error(f"Price broadcaster poll failed: {str(e)}")
+                time.sleep(self.poll_interval)
+        finally:
+            connection.close()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, 'subscribers': len(self._subscriptions), 'symbols': len(self._by_symbol)}
+
+
+price_broadcaster = PriceBroadcaster(
+    poll_interval=getattr(settings, 'STOCK_API_SETTINGS', {}).get('STREAM_POLL_INTERVAL', 1),
+)
@@ -1,3 +1,2005 @@
-from django.test import TestCase
+import asyncio
+import fcntl
+import hashlib
+import json
+import statistics
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .bar_store import BarStore
+from .cache_backends import QuoteFileCache
+from .indicators import INDICATORS, IndicatorService
+from .models import EmailOutbox, Stocks, Transaction, UserStock, Watchlist
+from .orders import OrderBook, OrderManager, order_manager
+from .outbox import OutboxSender
+from .streaming import PriceBroadcaster, price_broadcaster
+from .ws import MarketDataHub
+from .persistence import PricePersister, price_persister
+from . import search
+from .autocomplete import AutocompleteIndex, autocomplete_index
+from .pagination import encode_cursor, keyset_page
+from .quote_cache import TieredCache, quote_cache
+from .services import (
+    UNAVAILABLE, AsyncTiingoClient, CircuitBreaker, DataProvider, SingleFlight, StockDataService,
+    TiingoClient, TokenBucket, stock_service,
+)
+from .trading import TradeError, trade_service
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-default',
+    },
+    'quotes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-quotes',
+    },
+}
+
+
+class FakeTiingoHandler(BaseHTTPRequestHandler):
+    """Serves canned Tiingo responses and records every request"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        self.server.record(self.path, self.client_address)
+
+        if params.get('token') != ['test-token']:
+            return self._send(401, {'detail': 'Invalid token'})
+
+        if parts == ['iex']:
+            tickers = params.get('tickers', [''])[0].split(',')
+            return self._send(200, [
+                {'ticker': ticker.upper(), 'tngoLast': 101.0, 'prevClose': 100.0, 'volume': 1000}
+                for ticker in tickers if ticker.upper() in self.server.known
+            ])
+
+        if len(parts) >= 3 and parts[:2] == ['tiingo', 'daily']:
+            symbol = parts[2].upper()
+            if symbol not in self.server.known:
+                return self._send(404, {'detail': 'Not found'})
+            time.sleep(self.server.latency)
+            if parts[3:] == ['prices']:
+                return self._send(200, [{'close': 101.0, 'prevClose': 100.0, 'volume': 1000}])
+            return self._send(200, {'ticker': symbol, 'name': f'{symbol} Inc.', 'description': ''})
+
+        self._send(404, {'detail': 'Not found'})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeTiingoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, known, latency=0.0):
+        super().__init__(('127.0.0.1', 0), FakeTiingoHandler)
+        self.known = set(known)
+        self.latency = latency
+        self.paths = []
+        self.clients = set()
+        self._lock = threading.Lock()
+
+    def record(self, path, client_address):
+        with self._lock:
+            self.paths.append(path)
+            self.clients.add(client_address)
+
+
+def daily_bars(*closes, volume=1000):
+    """Daily history frame like yfinance returns for one symbol"""
+    index = pd.date_range('2024-01-01', periods=len(closes), freq='D')
+    return pd.DataFrame({'Close': closes, 'Volume': [volume] * len(closes)}, index=index)
+
+
+def batch_history(symbols, **kwargs):
+    """yf.download stand-in: two daily bars for every requested symbol"""
+    return pd.concat({symbol: daily_bars(10.0, 11.0) for symbol in symbols}, axis=1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BatchQuoteFetchTests(SimpleTestCase):
+    """get_multiple_stocks fetches every miss in one batch and tolerates partial failure"""
+
+    def setUp(self):
+        quote_cache.clear()
+        self.service = StockDataService()
+        self.service.tiingo = mock.Mock()
+        self.service.tiingo.get_quotes.return_value = {
+            'CCC': {'symbol': 'CCC', 'current_price': 30.0, 'source': 'tiingo'},
+        }
+        patcher = mock.patch('stocks.services.yf.Ticker', return_value=mock.Mock(info={}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_partial_yfinance_failure_falls_back_to_tiingo(self):
+        # One download for all symbols; BBB came back empty and CCC/DDD not at all
+        history = pd.concat({'AAA': daily_bars(10.0, 11.0), 'BBB': daily_bars(np.nan, np.nan)}, axis=1)
+
+        with mock.patch('stocks.services.yf.download', return_value=history) as download:
+            quotes = self.service.get_multiple_stocks(['AAA', 'BBB', 'CCC', 'DDD'])
+
+            self.assertEqual(download.call_count, 1)
+            self.assertEqual(download.call_args.args[0], ['AAA', 'BBB', 'CCC', 'DDD'])
+            self.assertEqual(set(quotes), {'AAA', 'CCC'})
+            self.assertEqual(quotes['AAA']['current_price'], 11.0)
+            self.assertEqual(quotes['CCC']['source'], 'tiingo')
+            self.service.tiingo.get_quotes.assert_called_once_with(['BBB', 'CCC', 'DDD'])
+
+            # Fetched quotes are cached and the failures negatively cached
+            self.assertEqual(set(self.service.get_multiple_stocks(['AAA', 'BBB', 'CCC', 'DDD'])), {'AAA', 'CCC'})
+            self.assertEqual(download.call_count, 1)
+            self.assertEqual(self.service.tiingo.get_quotes.call_count, 1)
+
+    def test_only_cache_misses_are_fetched(self):
+        with mock.patch('stocks.services.yf.download', side_effect=batch_history) as download:
+            self.service.get_multiple_stocks(['AAA', 'BBB'])
+            quotes = self.service.get_multiple_stocks(['AAA', 'BBB', 'CCC', 'DDD'])
+
+        self.assertEqual([call.args[0] for call in download.call_args_list], [['AAA', 'BBB'], ['CCC', 'DDD']])
+        self.assertEqual(set(quotes), {'AAA', 'BBB', 'CCC', 'DDD'})
+        self.service.tiingo.get_quotes.assert_not_called()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class FundamentalsCacheTests(SimpleTestCase):
+    """Slow ticker.info lookups are cached apart from the quotes built on them"""
+
+    def setUp(self):
+        quote_cache.clear()
+        self.service = StockDataService()
+        self.ticker = mock.Mock()
+        self.ticker.history.return_value = daily_bars(100.0, 110.0)
+        self.info = mock.PropertyMock(return_value={
+            'longName': 'Apple Inc.', 'sector': 'Technology', 'sharesOutstanding': 1000,
+            'marketCap': 1, 'currentPrice': 99.0,
+        })
+        type(self.ticker).info = self.info
+        patcher = mock.patch('stocks.services.yf.Ticker', return_value=self.ticker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_quotes_reuse_cached_fundamentals(self):
+        first = self.service._get_yfinance_data('AAPL')
+        self.ticker.history.return_value = daily_bars(110.0, 120.0)
+        second = self.service._get_yfinance_data('AAPL')
+
+        self.assertEqual(self.info.call_count, 1)
+        self.assertEqual(self.ticker.history.call_count, 2)
+        self.assertEqual(quote_cache.get('stock_fundamentals_AAPL')['sector'], 'Technology')
+        # Price and market cap come from the bars, not the cached info
+        self.assertEqual((first['current_price'], first['market_cap']), (110.0, 110000))
+        self.assertEqual((second['current_price'], second['market_cap']), (120.0, 120000))
+        self.assertEqual(second['name'], 'Apple Inc.')
+        self.assertNotIn('currentPrice', quote_cache.get('stock_fundamentals_AAPL'))
+
+    def test_failed_fundamentals_still_give_a_quote(self):
+        self.info.side_effect = RuntimeError('info unavailable')
+
+        quote = self.service._get_yfinance_data('AAPL')
+
+        self.assertEqual((quote['name'], quote['current_price']), ('AAPL', 110.0))
+        self.assertIsNone(quote_cache.get('stock_fundamentals_AAPL'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class StaleWhileRevalidateTests(SimpleTestCase):
+    """Quotes past their soft TTL are served at once and refreshed in the background"""
+
+    def setUp(self):
+        quote_cache.clear()
+        self.service = StockDataService()
+        self.service.tiingo_token = None
+        self.prices = iter([20.0, 30.0])
+        self.fetches = []
+
+        def fake_yfinance(symbol):
+            self.fetches.append(symbol)
+            time.sleep(0.2)
+            return {'symbol': symbol, 'current_price': next(self.prices)}
+
+        patcher = mock.patch.object(self.service, '_get_yfinance_data', fake_yfinance)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cache_stale(self, price):
+        entry = {'value': {'symbol': 'AAPL', 'current_price': price}, 'fresh_until': time.time() - 1}
+        quote_cache.set('stock_data_AAPL', entry, 60)
+
+    def test_stale_quote_is_served_while_one_refresh_runs(self):
+        self.cache_stale(10.0)
+
+        started = time.monotonic()
+        prices = [self.service.get_stock_data('AAPL')['current_price'] for _ in range(5)]
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertEqual(prices, [10.0] * 5)
+
+        self.service._revalidate_executor.shutdown(wait=True)
+        self.assertEqual(self.fetches, ['AAPL'])
+        self.assertEqual(self.service.get_stock_data('AAPL')['current_price'], 20.0)
+
+    def test_fresh_quote_is_not_refreshed(self):
+        self.service._cache_put('stock_data_AAPL', {'symbol': 'AAPL', 'current_price': 10.0})
+
+        self.assertEqual(self.service.get_stock_data('AAPL')['current_price'], 10.0)
+        self.service._revalidate_executor.shutdown(wait=True)
+        self.assertEqual(self.fetches, [])
+
+    def test_soft_ttl_expires_before_the_cache_drops_the_entry(self):
+        self.service.cache_hard_timeout = 1800
+        with mock.patch.object(quote_cache, 'set') as cache_set:
+            self.service._cache_put('stock_data_AAPL', {'current_price': 10.0}, timeout=30)
+
+        key, entry, timeout = cache_set.call_args.args
+        self.assertEqual(timeout, 1800)
+        self.assertAlmostEqual(entry['fresh_until'], time.time() + 30, delta=1)
+
+    def test_expired_quote_is_fetched_inline(self):
+        self.assertEqual(self.service.get_stock_data('AAPL')['current_price'], 20.0)
+        self.assertEqual(self.fetches, ['AAPL'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TiingoClientTests(SimpleTestCase):
+    """TiingoClient against a local HTTP stand-in for api.tiingo.com"""
+
+    def setUp(self):
+        quote_cache.clear()
+        self.server = FakeTiingoServer(['AAPL', 'MSFT', 'GOOGL'])
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.client = TiingoClient('test-token', base_url=f'http://127.0.0.1:{self.server.server_port}')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.client.close()
+
+    def test_get_quote(self):
+        quote = self.client.get_quote('AAPL')
+
+        self.assertEqual(quote['symbol'], 'AAPL')
+        self.assertEqual(quote['name'], 'AAPL Inc.')
+        self.assertEqual(quote['current_price'], 101.0)
+        self.assertEqual(quote['day_change'], 1.0)
+        self.assertEqual(quote['source'], 'tiingo')
+
+    def test_get_quote_fetches_metadata_and_prices_concurrently(self):
+        self.server.latency = 0.25
+        started = time.monotonic()
+        self.client.get_quote('AAPL')
+
+        # Two sequential calls would take at least twice the server latency
+        self.assertLess(time.monotonic() - started, 0.45)
+
+    def test_unknown_symbol_returns_none(self):
+        self.assertIsNone(self.client.get_quote('NOPE'))
+
+    def test_metadata_is_cached(self):
+        self.client.get_quote('AAPL')
+        self.client.get_quote('AAPL')
+
+        meta_requests = [path for path in self.server.paths if path.startswith('/tiingo/daily/AAPL?')]
+        self.assertEqual(len(meta_requests), 1)
+
+    def test_get_quotes_uses_one_price_request(self):
+        quotes = self.client.get_quotes(['AAPL', 'MSFT', 'NOPE'])
+
+        self.assertEqual(set(quotes), {'AAPL', 'MSFT'})
+        self.assertEqual(len([path for path in self.server.paths if path.startswith('/iex/')]), 1)
+        self.assertFalse([path for path in self.server.paths if path.endswith('/prices')])
+
+    def test_session_reuses_connections(self):
+        for _ in range(20):
+            self.client.get_quotes(['AAPL', 'MSFT', 'GOOGL'])
+
+        # Keep-alive: far fewer TCP connections than requests
+        self.assertLessEqual(len(self.server.clients), self.client._executor._max_workers + 1)
+        self.assertGreater(len(self.server.paths), len(self.server.clients))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AsyncTiingoClientTests(SimpleTestCase):
+    """AsyncTiingoClient against the same local Tiingo stand-in"""
+
+    def setUp(self):
+        quote_cache.clear()
+        self.server = FakeTiingoServer(['AAPL', 'MSFT', 'GOOGL'])
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.client = AsyncTiingoClient('test-token', base_url=f'http://127.0.0.1:{self.server.server_port}')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    async def test_get_quote(self):
+        quote = await self.client.get_quote('AAPL')
+        await self.client.close()
+
+        self.assertEqual(quote['symbol'], 'AAPL')
+        self.assertEqual(quote['current_price'], 101.0)
+        self.assertEqual(quote['source'], 'tiingo')
+
+    async def test_many_quotes_in_flight_at_once(self):
+        self.server.latency = 0.2
+        started = time.monotonic()
+        quotes = await asyncio.gather(*(self.client.get_quote(symbol) for symbol in ['AAPL', 'MSFT', 'GOOGL', 'NOPE']))
+        await self.client.close()
+
+        # Eight requests; sequentially they would take at least 6 x 0.2s
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual([quote and quote['symbol'] for quote in quotes], ['AAPL', 'MSFT', 'GOOGL', None])
+
+    async def test_get_quotes_uses_one_price_request(self):
+        quotes = await self.client.get_quotes(['AAPL', 'MSFT', 'NOPE'])
+        await self.client.close()
+
+        self.assertEqual(set(quotes), {'AAPL', 'MSFT'})
+        self.assertEqual(len([path for path in self.server.paths if path.startswith('/iex/')]), 1)
+
+
+class ProviderGuardTests(SimpleTestCase):
+    """Rate limits and circuit breakers skip a provider without waiting on it"""
+
+    def test_token_bucket_spends_capacity_then_refills(self):
+        bucket = TokenBucket(rate_per_minute=60, capacity=2)
+
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        bucket.updated_at -= 1.0  # one second at 60/min buys one token
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+    def test_circuit_breaker_opens_then_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        breaker.opened_at -= 30
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        # A failed trial reopens the circuit; a successful one closes it
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        breaker.opened_at -= 30
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+    def test_skipped_and_failed_calls_are_unavailable_not_none(self):
+        provider = DataProvider('test', rate_per_minute=1, failure_threshold=1)
+
+        self.assertIsNone(provider.call(lambda: None))
+        self.assertIs(provider.call(lambda: 'quote'), UNAVAILABLE)  # rate limited
+        provider.limiter.tokens = 1
+        self.assertIs(provider.call(mock.Mock(side_effect=RuntimeError('boom'))), UNAVAILABLE)
+        self.assertIs(provider.call(lambda: 'quote'), UNAVAILABLE)  # circuit open
+        self.assertFalse(UNAVAILABLE)
+        stats = provider.get_stats()
+        self.assertEqual((stats['rate_limited'], stats['failures'], stats['short_circuited']), (1, 1, 1))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class NegativeCacheTests(SimpleTestCase):
+    """Only a provider saying it has no data is remembered as a miss"""
+
+    def setUp(self):
+        quote_cache.clear()
+        self.service = StockDataService()
+        self.service._quote_listeners = []
+        self.service.tiingo_token = None
+        self.service.tiingo = None
+        self.yfinance = mock.Mock(return_value=None)
+        patcher = mock.patch.object(self.service, '_get_yfinance_data', self.yfinance)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_not_found_is_cached_and_not_fetched_again(self):
+        self.assertIsNone(self.service.get_stock_data('NOPE'))
+        self.assertIsNone(self.service.get_stock_data('NOPE'))
+
+        self.assertEqual(self.yfinance.call_count, 1)
+        self.assertTrue(quote_cache.get('stock_data_miss_NOPE'))
+
+    def test_rate_limited_or_failed_lookups_are_not_cached_as_misses(self):
+        self.service.providers['yfinance'].limiter.tokens = 0
+        self.assertIsNone(self.service.get_stock_data('AAPL'))
+        self.assertEqual(self.yfinance.call_count, 0)
+
+        self.service.providers['yfinance'].limiter.tokens = 10
+        self.yfinance.side_effect = RuntimeError('upstream down')
+        self.assertIsNone(self.service.get_stock_data('AAPL'))
+
+        self.assertIsNone(quote_cache.get('stock_data_miss_AAPL'))
+
+    def test_uncached_lookups_never_write_miss_markers(self):
+        self.assertIsNone(self.service.get_stock_data('NOPE', use_cache=False))
+        self.assertIsNone(quote_cache.get('stock_data_miss_NOPE'))
+
+    def test_batch_skips_miss_markers_when_download_was_skipped(self):
+        with mock.patch.object(self.service, '_get_yfinance_batch', return_value=UNAVAILABLE):
+            self.assertEqual(self.service.get_multiple_stocks(['AAA', 'BBB']), {})
+        self.assertEqual(quote_cache.get_many(['stock_data_miss_AAA', 'stock_data_miss_BBB']), {})
+
+        with mock.patch.object(self.service, '_get_yfinance_batch', return_value={}):
+            self.assertEqual(self.service.get_multiple_stocks(['AAA', 'BBB']), {})
+        self.assertTrue(quote_cache.get('stock_data_miss_AAA'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AsyncProviderTests(SimpleTestCase):
+    """Async fan-out through the provider guards, with per-call timeouts"""
+
+    def setUp(self):
+        quote_cache.clear()
+        self.service = StockDataService()
+        self.service.provider_timeout = 0.3
+        self.service._quote_listeners = []
+        self.service.async_tiingo = None  # yfinance only; no real network
+        self.calls = []
+
+        def fake_yfinance(symbol):
+            self.calls.append(symbol)
+            time.sleep(1 if symbol == 'SLOW' else 0.1)
+            return {'symbol': symbol, 'current_price': 10.0, 'source': 'yfinance'}
+
+        patcher = mock.patch.object(self.service, '_get_yfinance_data', fake_yfinance)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_acall_timeout_counts_as_failure(self):
+        provider = DataProvider('test', rate_per_minute=60)
+
+        self.assertIs(await provider.acall(asyncio.sleep, 1, timeout=0.05), UNAVAILABLE)
+        self.assertEqual(await provider.acall(asyncio.sleep, 0, 'done', timeout=1), 'done')
+        stats = provider.get_stats()
+        self.assertEqual((stats['failures'], stats['successes']), (1, 1))
+        self.assertIn('timed out', stats['last_error'])
+
+    async def test_misses_are_fetched_concurrently_and_slow_symbols_dropped(self):
+        symbols = ['AAA', 'BBB', 'CCC', 'DDD', 'SLOW']
+        started = time.monotonic()
+        quotes = await self.service.aget_multiple_stocks(symbols)
+
+        # Five 0.1s+ fetches side by side, the slow one cut off at the timeout
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual(set(quotes), {'AAA', 'BBB', 'CCC', 'DDD'})
+
+        # Cached now; a timeout is a failure, not "no data", so only the slow symbol is retried
+        self.assertEqual(set(await self.service.aget_multiple_stocks(symbols)), {'AAA', 'BBB', 'CCC', 'DDD'})
+        self.assertEqual(sorted(self.calls), sorted(symbols + ['SLOW']))
+        self.assertIsNone(await asyncio.to_thread(quote_cache.get, 'stock_data_miss_SLOW'))
+
+    async def test_concurrent_misses_share_one_fetch(self):
+        quotes = await asyncio.gather(*(self.service.aget_stock_data('AAA') for _ in range(10)))
+
+        self.assertEqual({quote['symbol'] for quote in quotes}, {'AAA'})
+        self.assertEqual(self.calls, ['AAA'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SingleFlightTests(SimpleTestCase):
+    """Concurrent misses for a key load it once, within and across processes"""
+
+    def setUp(self):
+        quote_cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.lock_dir = tmp.name
+        self.flight = SingleFlight(self.lock_dir, wait_timeout=0.5, poll_interval=0.01)
+        self.calls = []
+
+    def load(self, delay=0.1, value='fresh'):
+        def fn():
+            self.calls.append(threading.current_thread().name)
+            time.sleep(delay)
+            return value
+        return fn
+
+    def run_concurrently(self, count, fn):
+        results = [None] * count
+
+        def worker(i):
+            results[i] = self.flight.do('stock_data_AAPL', fn)
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def hold_other_process_lock(self):
+        # A separate open file description conflicts with flock like another process would
+        handle = open(f"{self.lock_dir}/{hashlib.sha1(b'stock_data_AAPL').hexdigest()}.lock", 'a')
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        self.addCleanup(handle.close)
+        return handle
+
+    def test_concurrent_callers_share_one_load(self):
+        self.assertEqual(self.run_concurrently(10, self.load()), ['fresh'] * 10)
+        self.assertEqual(len(self.calls), 1)
+        stats = self.flight.get_stats()
+        self.assertEqual((stats['misses'], stats['coalesced'], stats['in_flight']), (1, 9, 0))
+
+    def test_waits_for_other_process_to_fill_the_cache(self):
+        self.hold_other_process_lock()
+        threading.Timer(0.1, quote_cache.set, args=('stock_data_AAPL', 'from-other-process', 60)).start()
+
+        self.assertEqual(self.flight.do('stock_data_AAPL', self.load()), 'from-other-process')
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.flight.get_stats()['remote_waits'], 1)
+
+    def test_loads_itself_when_the_other_process_is_stuck(self):
+        self.hold_other_process_lock()
+
+        self.assertEqual(self.flight.do('stock_data_AAPL', self.load(delay=0)), 'fresh')
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.flight.get_stats()['wait_timeouts'], 1)
+
+    def test_followers_load_themselves_when_the_leader_is_stuck(self):
+        results = self.run_concurrently(3, self.load(delay=0.8))
+
+        self.assertEqual(results, ['fresh'] * 3)
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(self.flight.get_stats()['wait_timeouts'], 2)
+
+    def test_errors_reach_every_waiting_caller(self):
+        def fail():
+            time.sleep(0.1)
+            raise RuntimeError('provider down')
+
+        errors = []
+
+        def worker():
+            try:
+                self.flight.do('stock_data_AAPL', fail)
+            except RuntimeError as e:
+                errors.append(str(e))
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, ['provider down'] * 3)
+
+
+class QuoteFileCacheTests(SimpleTestCase):
+    """File-backed L2 doesn't scan its directory on every write"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = QuoteFileCache(tmp.name, {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2, 'CULL_INTERVAL': 60}})
+
+    def test_culls_at_most_once_per_interval(self):
+        with mock.patch.object(self.cache, '_list_cache_files', wraps=self.cache._list_cache_files) as listed:
+            for i in range(50):
+                self.cache.set(f'key{i}', i, 60)
+        self.assertEqual(listed.call_count, 1)
+        self.assertEqual(self.cache.get('key49'), 49)
+
+    def test_culls_again_once_the_interval_passes(self):
+        for i in range(20):
+            self.cache.set(f'key{i}', i, 60)
+        self.cache._next_cull = 0
+        self.cache.set('one-more', 1, 60)
+        self.assertLessEqual(len(self.cache._list_cache_files()), 11)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TieredCacheTests(SimpleTestCase):
+    """L1/L2 quote cache behaviour"""
+
+    def setUp(self):
+        self.worker_a = TieredCache(alias='quotes', version=1)
+        self.worker_b = TieredCache(alias='quotes', version=1)
+        self.worker_a.clear()
+
+    def test_value_set_by_one_worker_is_served_by_another(self):
+        self.worker_a.set('stock_data_AAPL', {'current_price': 1.0}, 60)
+
+        self.assertEqual(self.worker_b.get('stock_data_AAPL'), {'current_price': 1.0})
+        self.assertEqual(self.worker_b.get_stats()['l2_hits'], 1)
+
+        # Second read is answered by worker B's own L1
+        self.worker_b.get('stock_data_AAPL')
+        self.assertEqual(self.worker_b.get_stats()['l1_hits'], 1)
+
+    def test_get_many_mixes_levels(self):
+        self.worker_a.set_many({'a': 1, 'b': 2}, 60)
+        self.worker_b.get('a')
+
+        self.assertEqual(self.worker_b.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2})
+
+    def test_version_bump_invalidates_entries(self):
+        self.worker_a.set('stock_data_AAPL', {'current_price': 1.0}, 60)
+
+        self.assertIsNone(TieredCache(alias='quotes', version=2).get('stock_data_AAPL'))
+
+    def test_l1_is_bounded(self):
+        cache = TieredCache(alias='quotes', l1_max_entries=2)
+        for key in 'abc':
+            cache.set(key, key, 60)
+
+        self.assertEqual(len(cache.l1), 2)
+
+
+class BarStoreTests(SimpleTestCase):
+    """Persistent OHLCV store"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = BarStore(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def frame(self, start, periods, close=1.0):
+        index = pd.date_range(start, periods=periods, freq='D', tz='America/New_York')
+        closes = np.arange(periods, dtype=float) + close
+        return pd.DataFrame({'Open': closes, 'High': closes, 'Low': closes, 'Close': closes,
+                             'Volume': np.full(periods, 100.0)}, index=index)
+
+    def test_write_and_read_range(self):
+        bars = BarStore.from_frame(self.frame('2024-01-01', 10))
+        self.store.write('AAPL', '1d', bars, start=int(bars['ts'][0]))
+
+        sliced = self.store.read('AAPL', '1d', start=int(bars['ts'][3]), end=int(bars['ts'][6]))
+
+        self.assertEqual(list(sliced['close']), [4.0, 5.0, 6.0])
+        self.assertEqual(self.store.covered_from('AAPL', '1d'), int(bars['ts'][0]))
+
+    def test_append_only_adds_missing_bars_and_updates_last(self):
+        self.store.append('AAPL', '1d', BarStore.from_frame(self.frame('2024-01-01', 5)))
+
+        # Overlapping refresh: the last stored bar changed and two new bars arrived
+        added = self.store.append('AAPL', '1d', BarStore.from_frame(self.frame('2024-01-05', 3, close=50.0)))
+
+        bars = self.store.read('AAPL', '1d')
+        self.assertEqual(added, 2)
+        self.assertEqual(len(bars), 7)
+        self.assertEqual(list(bars['close'][-3:]), [50.0, 51.0, 52.0])
+        self.assertTrue(np.all(np.diff(bars['ts']) > 0))
+
+    def test_round_trip_frame(self):
+        frame = self.frame('2024-01-01', 3)
+        self.store.append('MSFT', '1d', BarStore.from_frame(frame))
+
+        restored = BarStore.to_frame(self.store.read('MSFT', '1d'))
+
+        self.assertEqual(list(restored['Close']), list(frame['Close']))
+        self.assertTrue(restored.index.equals(frame.index.tz_convert('UTC')))
+
+    def test_missing_symbol_is_empty(self):
+        self.assertEqual(len(self.store.read('NOPE', '1d')), 0)
+        self.assertIsNone(self.store.last_timestamp('NOPE', '1d'))
+
+
+class FakeHistoryService:
+    """Stands in for StockDataService.get_stock_history over a local bar store"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def get_stock_history(self, symbol, period='1y', interval='1d'):
+        bars = self.store.read(symbol, interval)
+        return BarStore.to_frame(bars) if len(bars) else None
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IndicatorServiceTests(SimpleTestCase):
+    """Vectorized indicators and their incremental updates"""
+
+    def setUp(self):
+        quote_cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = BarStore(self.tmp.name)
+        self.service = IndicatorService(FakeHistoryService(self.store), self.store)
+
+        rng = np.random.default_rng(7)
+        closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 120)))
+        index = pd.date_range('2024-01-01', periods=120, freq='D', tz='UTC')
+        self.frame = pd.DataFrame({'Open': closes, 'High': closes, 'Low': closes, 'Close': closes,
+                                   'Volume': np.full(120, 100.0)}, index=index)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def all_indicators(self):
+        return self.service.get_indicators('AAPL', {name: {} for name in INDICATORS})
+
+    def test_matches_pandas_reference(self):
+        self.store.append('AAPL', '1d', BarStore.from_frame(self.frame))
+
+        result = self.service.get_indicators('AAPL', {'sma': {'window': 10}, 'ema': {'span': 10}})
+
+        closes = self.frame['Close']
+        np.testing.assert_allclose(result['indicators']['sma']['values']['sma'],
+                                   closes.rolling(10).mean(), equal_nan=True)
+        np.testing.assert_allclose(result['indicators']['ema']['values']['ema'],
+                                   closes.ewm(span=10, adjust=False).mean())
+        self.assertEqual(len(result['timestamps']), 120)
+
+    def test_incremental_update_matches_full_recompute(self):
+        self.store.append('AAPL', '1d', BarStore.from_frame(self.frame.iloc[:100]))
+        self.all_indicators()
+
+        # New bars arrive and the last cached bar is revised
+        revised = self.frame.iloc[99:].copy()
+        revised.iloc[0, revised.columns.get_loc('Close')] *= 1.01
+        self.store.append('AAPL', '1d', BarStore.from_frame(revised))
+        with mock.patch.object(INDICATORS['ema'], 'compute', side_effect=AssertionError):
+            incremental = self.all_indicators()
+
+        quote_cache.clear()
+        full = self.all_indicators()
+
+        for name, indicator in full['indicators'].items():
+            for output, values in indicator['values'].items():
+                np.testing.assert_allclose(incremental['indicators'][name]['values'][output], values,
+                                           equal_nan=True, err_msg=f"{name}.{output}")
+
+    def test_unchanged_bars_reuse_cached_series(self):
+        self.store.append('AAPL', '1d', BarStore.from_frame(self.frame))
+        self.all_indicators()
+
+        with mock.patch.object(INDICATORS['rsi'], 'compute', side_effect=AssertionError) as compute:
+            self.all_indicators()
+        compute.assert_not_called()
+
+    def test_invalid_parameters(self):
+        self.store.append('AAPL', '1d', BarStore.from_frame(self.frame))
+
+        with self.assertRaises(ValueError):
+            self.service.get_indicators('AAPL', {'sma': {'window': 0}})
+        with self.assertRaises(KeyError):
+            self.service.get_indicators('AAPL', {'nope': {}})
+
+
+class IndicatorApiTests(TestCase):
+    """Query parameters that reach the bar store's paths are whitelisted"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('charter', 'charter@example.com', 'password'))
+
+    def test_unknown_period_or_interval_is_rejected(self):
+        with mock.patch('stocks.services.yf.Ticker') as ticker, \
+                mock.patch.object(stock_service, '_sync_history') as sync:
+            for query in ('interval=../../x', 'interval=1d/../../x', 'period=forever', 'period=1y%00'):
+                response = self.client.get(f'/api/stock/AAPL/indicators/?indicators=sma&{query}')
+                self.assertEqual(response.status_code, 400, query)
+
+            with self.assertRaises(ValueError):
+                stock_service.get_stock_history('AAPL', interval='../x')
+            with self.assertRaises(ValueError):
+                stock_service.get_stock_history('AAPL', period='1y/../../x')
+
+        ticker.assert_not_called()
+        sync.assert_not_called()
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PositionLedgerTests(TestCase):
+    """Positions maintained by buy/sell and rebuilt from history"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'password')
+        self.client.force_login(self.user)
+        self.stock = Stocks.objects.create(ticker='AAPL', name='Apple Inc.', curr_price=Decimal('100.00'))
+
+    def trade(self, action, quantity, price):
+        Stocks.objects.filter(pk=self.stock.pk).update(curr_price=Decimal(price))
+        self.client.post(f'/{action}/{self.stock.pk}/', {'quantity': quantity})
+
+    def test_buy_and_sell_update_cost_basis_and_realized_pnl(self):
+        self.trade('buy', 10, '100.00')
+        self.trade('buy', 10, '130.00')
+        self.trade('sell', 5, '150.00')
+
+        position = UserStock.objects.get(user=self.user, stock=self.stock)
+        self.assertEqual(position.purchase_quantity, 15)
+        self.assertEqual(position.cost_basis, Decimal('1725.00'))
+        self.assertEqual(position.realized_pnl, Decimal('175.00'))
+        self.assertEqual(Transaction.objects.filter(user=self.user).count(), 3)
+
+    def test_rebuild_matches_incremental_ledger(self):
+        for action, quantity, price in [('buy', 3, '10.00'), ('buy', 4, '11.00'), ('sell', 5, '12.00'),
+                                        ('sell', 2, '9.00'), ('buy', 1, '20.00')]:
+            self.trade(action, quantity, price)
+
+        call_command('rebuild_positions', '--check', stdout=StringIO())
+
+        UserStock.objects.update(cost_basis=Decimal('0'), realized_pnl=Decimal('0'))
+        with self.assertRaises(CommandError):
+            call_command('rebuild_positions', '--check', stdout=StringIO())
+        call_command('rebuild_positions', stdout=StringIO())
+        call_command('rebuild_positions', '--check', stdout=StringIO())
+
+    def test_dashboard_queries_do_not_grow_with_trade_count(self):
+        self.trade('buy', 10, '100.00')
+        with CaptureQueriesContext(connection) as few_trades:
+            self.client.get('/portfolio_dashboard/')
+
+        for _ in range(20):
+            self.trade('buy', 1, '100.00')
+            self.trade('sell', 1, '101.00')
+        with CaptureQueriesContext(connection) as many_trades:
+            response = self.client.get('/portfolio_dashboard/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['portfolio']['AAPL']['quantity'], 10)
+        self.assertEqual(len(many_trades), len(few_trades))
+
+
+class TradeExecutionTests(TestCase):
+    """trade_service guards and the sell view around it"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'password')
+        self.stock = Stocks.objects.create(ticker='AAPL', name='Apple Inc.', curr_price=Decimal('100.00'))
+
+    def test_oversell_is_rejected_without_side_effects(self):
+        trade_service.buy(self.user, self.stock, 5)
+        with self.assertRaises(TradeError):
+            trade_service.sell(self.user, self.stock, 6)
+        with self.assertRaises(TradeError):
+            trade_service.sell(User.objects.create_user('other'), self.stock, 1)
+
+        position = UserStock.objects.get(user=self.user, stock=self.stock)
+        self.assertEqual(position.purchase_quantity, 5)
+        self.assertEqual(position.cost_basis, Decimal('500.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_invalid_quantities_are_rejected(self):
+        for quantity in [None, 'abc', 0, -3, 10001]:
+            with self.assertRaises(TradeError):
+                trade_service.buy(self.user, self.stock, quantity)
+        self.assertFalse(UserStock.objects.exists())
+
+    def test_sell_view_requires_login_and_post(self):
+        trade_service.buy(self.user, self.stock, 5)
+        response = self.client.post(f'/sell/{self.stock.pk}/', {'quantity': 1})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/login/', response['Location'])
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(f'/sell/{self.stock.pk}/').status_code, 405)
+        self.client.post(f'/sell/{self.stock.pk}/', {'quantity': 'lots'})
+        self.assertEqual(UserStock.objects.get(user=self.user).purchase_quantity, 5)
+
+    def test_benchmark_verifies_positions(self):
+        out = StringIO()
+        call_command('benchmark_trades', '--orders', 200, '--threads', 1, '--seed', 7, stdout=out)
+        self.assertIn('orders/sec', out.getvalue())
+        self.assertIn('All positions match', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='bench_trader_').exists())
+
+
+class BatchOrderTests(TestCase):
+    """api/orders/batch/: all legs in one transaction, per-leg results"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'password')
+        self.client.force_login(self.user)
+        Stocks.objects.bulk_create([
+            Stocks(ticker=f'S{i:02d}', name=f'Stock {i}', curr_price=Decimal('10.00') + i) for i in range(50)
+        ])
+
+    def submit(self, legs):
+        return self.client.post('/api/orders/batch/', json.dumps({'legs': legs}), content_type='application/json')
+
+    def test_fifty_leg_rebalance_runs_in_one_transaction(self):
+        trade_service.buy(self.user, Stocks.objects.get(ticker='S00'), 100)
+        legs = [{'symbol': 'S00', 'side': 'SELL', 'quantity': 60}]
+        legs += [{'symbol': f'S{i:02d}', 'side': 'BUY', 'quantity': i} for i in range(1, 50)]
+
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = self.submit(legs)
+            elapsed = time.perf_counter() - started
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['filled'] * 50)
+        self.assertEqual(results[1], {'symbol': 'S01', 'side': 'BUY', 'quantity': 1, 'price': 11.0,
+                                      'total': 11.0, 'status': 'filled'})
+        # session, user, prices, lock, positions, bulk update, bulk create x2, outbox email, savepoint + release
+        self.assertLessEqual(len(captured), 11)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(Transaction.objects.count(), 51)
+        self.assertEqual(UserStock.objects.get(stock__ticker='S00').purchase_quantity, 40)
+        call_command('rebuild_positions', '--check', stdout=StringIO())
+
+    def test_legs_apply_in_order_and_failures_roll_back_everything(self):
+        response = self.submit([
+            {'symbol': 'S01', 'side': 'BUY', 'quantity': 5},
+            {'symbol': 'S01', 'side': 'SELL', 'quantity': 5},
+            {'symbol': 'S02', 'side': 'SELL', 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r['status'] for r in response.json()['results']], ['skipped', 'skipped', 'rejected'])
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(UserStock.objects.exists())
+
+    def test_invalid_legs_are_reported_before_anything_runs(self):
+        response = self.submit([
+            {'symbol': 's01', 'side': 'buy', 'quantity': 1},
+            {'symbol': 'NOPE', 'side': 'BUY', 'quantity': 1},
+            {'symbol': 'S02', 'side': 'HOLD', 'quantity': 1},
+            {'symbol': 'S03', 'side': 'BUY', 'quantity': 0},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual(results[0], {'symbol': 'S01', 'side': 'BUY', 'quantity': 1, 'status': 'skipped'})
+        self.assertEqual([r.get('error') for r in results[1:]],
+                         ['Stock not found.', 'Side must be BUY or SELL.', 'Quantity must be a positive number.'])
+        self.assertEqual(self.client.post('/api/orders/batch/', 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.submit([]).status_code, 400)
+
+    def test_fractional_quantities_are_rejected_not_truncated(self):
+        response = self.submit([
+            {'symbol': 'S01', 'side': 'BUY', 'quantity': '3'},
+            {'symbol': 'S02', 'side': 'BUY', 'quantity': 2.7},
+            {'symbol': 'S03', 'side': 'BUY', 'quantity': '1e3'},
+            {'symbol': 'S04', 'side': 'BUY', 'quantity': True},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual(results[0]['quantity'], 3)
+        self.assertEqual([r.get('error') for r in results[1:]], ['Quantity must be a whole number.'] * 3)
+        self.assertFalse(Transaction.objects.exists())
+
+
+@mock.patch.object(price_broadcaster, 'poll_interval', 0)
+class EmailOutboxTests(TestCase):
+    """Transactional outbox: stored with the trade, sent in batches, retried with backoff"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mailer', 'mailer@example.com', 'password')
+        self.stock = Stocks.objects.create(ticker='AAPL', name='Apple', curr_price=Decimal('100.00'))
+        self.outbox = OutboxSender(interval=None, batch_size=10, max_attempts=3, retry_delay=30)
+
+    def test_email_is_stored_only_if_the_trade_commits(self):
+        trade_service.buy(self.user, self.stock, 5, notify=True)
+        with self.assertRaises(TradeError):
+            trade_service.sell(self.user, self.stock, 6, notify=True)
+
+        message = EmailOutbox.objects.get()
+        self.assertEqual(message.subject, 'Stock Purchase Confirmation')
+        self.assertIn('5 shares of Apple at $100.00', message.body)
+        self.assertEqual(mail.outbox, [])  # Nothing sent on the request path
+
+    def test_batches_share_one_connection(self):
+        for i in range(25):
+            EmailOutbox.objects.create(recipient=f'user{i}@example.com', subject=f'Message {i}', body='Hello')
+
+        with mock.patch('stocks.outbox.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(self.outbox.drain(), 25)
+
+        self.assertEqual(get_connection.call_count, 3)
+        self.assertEqual([message.subject for message in mail.outbox], [f'Message {i}' for i in range(25)])
+        self.assertEqual(EmailOutbox.objects.filter(status='SENT').count(), 25)
+        self.assertEqual(self.outbox.drain(), 0)
+        self.assertEqual(self.outbox.get_stats()['sent'], 25)
+
+    def test_failures_back_off_then_give_up(self):
+        EmailOutbox.objects.create(recipient='user@example.com', subject='Hi', body='Hello')
+        backend = 'django.core.mail.backends.locmem.EmailBackend.send_messages'
+
+        with mock.patch(backend, side_effect=OSError('connection refused')):
+            self.assertEqual(self.outbox.drain(), 1)
+            message = EmailOutbox.objects.get()
+            self.assertEqual((message.status, message.attempts, message.last_error), ('PENDING', 1, 'connection refused'))
+            self.assertEqual(self.outbox.drain(), 0)  # Not due yet
+
+            for attempt, delay in [(2, 60), (3, None)]:
+                EmailOutbox.objects.update(next_attempt_at=timezone.now())
+                started = timezone.now()
+                self.outbox.drain()
+                message.refresh_from_db()
+                self.assertEqual(message.attempts, attempt)
+                if delay:
+                    self.assertAlmostEqual((message.next_attempt_at - started).total_seconds(), delay, delta=1)
+        self.assertEqual(message.status, 'FAILED')
+        self.assertEqual(mail.outbox, [])
+
+    def test_claimed_messages_are_skipped_by_other_senders(self):
+        EmailOutbox.objects.create(recipient='user@example.com', subject='Hi', body='Hello')
+        claimed = self.outbox._claim(10)
+
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(OutboxSender(interval=None)._claim(10), [])
+
+    def test_exit_flush_sends_one_batch_with_a_short_timeout(self):
+        for i in range(25):
+            EmailOutbox.objects.create(recipient=f'user{i}@example.com', subject=f'Message {i}', body='Hello')
+
+        with mock.patch('stocks.outbox.get_connection', wraps=mail.get_connection) as get_connection:
+            self.outbox._drain_on_exit()
+
+        get_connection.assert_called_once_with(fail_silently=False, timeout=5)
+        self.assertEqual(len(mail.outbox), 10)
+        self.assertEqual(EmailOutbox.objects.filter(status='PENDING').count(), 15)
+
+    def test_send_outbox_command(self):
+        self.client.force_login(self.user)
+        self.client.post(f'/buy/{self.stock.pk}/', {'quantity': 2})
+        out = StringIO()
+        call_command('send_outbox', stdout=out)
+
+        self.assertIn('Sent 1 of 1 messages', out.getvalue())
+        self.assertIn('msg/s', out.getvalue())
+        self.assertEqual(mail.outbox[0].to, ['mailer@example.com'])
+
+
+class PriceStreamTests(TestCase):
+    """Shared price fan-out and the watchlist SSE endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('watcher', 'watcher@example.com', 'password')
+        for ticker, price in [('AAPL', '100.00'), ('MSFT', '200.00')]:
+            Stocks.objects.create(ticker=ticker, name=ticker, curr_price=Decimal(price))
+            Watchlist.objects.create(user=self.user, stock_symbol=ticker, stock_name=ticker)
+
+    def quote(self, symbol, price, updated):
+        return {'symbol': symbol, 'current_price': price, 'last_updated': updated}
+
+    async def test_subscribers_get_only_their_symbols_coalesced(self):
+        broadcaster = PriceBroadcaster(poll_interval=0)
+        apple = broadcaster.subscribe(['AAPL'])
+        both = broadcaster.subscribe(['AAPL', 'MSFT'])
+
+        # Published from another thread, as the poller does
+        publisher = threading.Thread(target=broadcaster.publish, args=([
+            self.quote('AAPL', 101.0, 't1'), self.quote('MSFT', 201.0, 't1'), self.quote('AAPL', 102.0, 't2'),
+        ],))
+        publisher.start()
+        publisher.join()
+
+        self.assertEqual(await apple.get(timeout=1), {'AAPL': self.quote('AAPL', 102.0, 't2')})
+        self.assertEqual(set(await both.get(timeout=1)), {'AAPL', 'MSFT'})
+
+        broadcaster.publish([self.quote('AAPL', 102.0, 't2')])  # Unchanged: not resent
+        self.assertEqual(await apple.get(timeout=0.05), {})
+
+        broadcaster.unsubscribe(apple)
+        broadcaster.unsubscribe(both)
+        self.assertEqual(broadcaster.get_stats()['subscribers'], 0)
+
+    def test_poll_publishes_rows_changed_since_last_poll(self):
+        broadcaster = PriceBroadcaster(poll_interval=0)
+        received = []
+        with mock.patch.object(broadcaster, '_by_symbol', {'AAPL': set()}), \
+                mock.patch.object(broadcaster, 'publish', lambda payloads: received.extend(payloads)):
+            broadcaster.poll()
+            self.assertEqual([payload['symbol'] for payload in received], ['AAPL'])
+            with CaptureQueriesContext(connection) as captured:
+                broadcaster.poll()
+            self.assertEqual(len(captured), 1)
+
+    async def test_stream_sends_snapshot_then_deltas(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get('/api/watchlist/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = response.streaming_content
+
+        self.assertEqual(await anext(events), b'retry: 5000\n\n')
+        snapshot = await anext(events)
+        self.assertIn(b'event: prices', snapshot)
+        self.assertEqual({quote['symbol'] for quote in json.loads(snapshot.split(b'data: ')[1])}, {'AAPL', 'MSFT'})
+
+        pending = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0)
+        price_broadcaster.publish([self.quote('MSFT', 205.5, 'later')])
+        delta = json.loads((await asyncio.wait_for(pending, 1)).split(b'data: ')[1])
+        self.assertEqual(delta, [self.quote('MSFT', 205.5, 'later')])
+        await events.aclose()
+
+    def test_stream_requires_login_and_asgi(self):
+        self.assertEqual(self.client.get('/api/watchlist/stream/').status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/api/watchlist/stream/').status_code, 503)
+
+
+class MarketDataHubTests(SimpleTestCase):
+    """WebSocket hub: per-symbol subscriptions and changed-fields-only frames"""
+
+    def quote(self, symbol, price, updated, volume=1000):
+        return {'symbol': symbol, 'current_price': price, 'previous_close': 100.0, 'day_change': None,
+                'day_change_percent': None, 'volume': volume, 'last_updated': updated}
+
+    async def connect(self, hub, headers=()):
+        inbox, outbox = asyncio.Queue(), asyncio.Queue()
+        inbox.put_nowait({'type': 'websocket.connect'})
+        task = asyncio.ensure_future(hub({'type': 'websocket', 'headers': list(headers)}, inbox.get, outbox.put))
+        return inbox, outbox, task
+
+    async def frame(self, outbox):
+        message = await asyncio.wait_for(outbox.get(), 1)
+        return json.loads(message['text'])
+
+    def request(self, inbox, action, *symbols):
+        inbox.put_nowait({'type': 'websocket.receive', 'text': json.dumps({'action': action, 'symbols': symbols})})
+
+    async def test_subscribe_sends_full_quote_then_only_changed_fields(self):
+        stored = {'AAPL': self.quote('AAPL', 100.0, 't0'), 'MSFT': self.quote('MSFT', 300.0, 't0')}
+        hub = MarketDataHub(PriceBroadcaster(poll_interval=0), require_login=False,
+                            load_quotes=lambda symbols: [stored[symbol] for symbol in symbols])
+        inbox, outbox, task = await self.connect(hub)
+        self.assertEqual(await asyncio.wait_for(outbox.get(), 1), {'type': 'websocket.accept'})
+
+        self.request(inbox, 'subscribe', 'aapl')
+        self.assertEqual(await self.frame(outbox), {'type': 'prices', 'data': {'AAPL': {
+            'p': 100.0, 'pc': 100.0, 'c': None, 'cp': None, 'v': 1000, 't': 't0'}}})
+
+        hub.broadcaster.publish([self.quote('AAPL', 101.5, 't1'), self.quote('MSFT', 300.0, 't1')])
+        self.assertEqual(await self.frame(outbox), {'type': 'prices', 'data': {'AAPL': {'p': 101.5, 't': 't1'}}})
+
+        self.request(inbox, 'unsubscribe', 'AAPL')
+        await asyncio.sleep(0.01)
+        self.assertNotIn('AAPL', hub.broadcaster.latest)
+
+        # Unwatched symbols aren't polled; re-subscribing seeds from the stored quote
+        stored['AAPL'] = self.quote('AAPL', 103.0, 't3')
+        self.request(inbox, 'subscribe', 'AAPL', 'MSFT')
+        data = (await self.frame(outbox))['data']
+        self.assertEqual(set(data), {'AAPL', 'MSFT'})
+        self.assertEqual((data['AAPL']['p'], data['AAPL']['t']), (103.0, 't3'))
+
+        self.request(inbox, 'watch', 'AAPL')
+        self.assertEqual((await self.frame(outbox))['type'], 'error')
+
+        inbox.put_nowait({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(task, 1)
+        self.assertEqual(hub.broadcaster.get_stats()['subscribers'], 0)
+
+    async def test_slow_client_gets_latest_quote_only(self):
+        hub = MarketDataHub(PriceBroadcaster(poll_interval=0), require_login=False, load_quotes=lambda symbols: [])
+        inbox, outbox, task = await self.connect(hub)
+        await outbox.get()
+        self.request(inbox, 'subscribe', 'AAPL')
+        await asyncio.sleep(0.01)
+
+        # Several updates before the client's writer gets to run
+        for step in range(5):
+            hub.broadcaster.publish([self.quote('AAPL', 100.0 + step, f't{step}')])
+        frame = await self.frame(outbox)
+        self.assertEqual(frame['data']['AAPL']['p'], 104.0)
+        self.assertTrue(outbox.empty())
+        self.assertEqual(hub.get_stats()['frames'], 1)
+
+        inbox.put_nowait({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(task, 1)
+
+    async def test_rejects_anonymous_and_cross_origin_clients(self):
+        hub = MarketDataHub(PriceBroadcaster(poll_interval=0))
+        _, outbox, task = await self.connect(hub)
+        self.assertEqual(await asyncio.wait_for(outbox.get(), 1), {'type': 'websocket.close', 'code': 4403})
+        await task
+
+        hub.require_login = False
+        _, outbox, task = await self.connect(hub, [(b'origin', b'https://evil.example')])
+        self.assertEqual((await asyncio.wait_for(outbox.get(), 1))['code'], 4403)
+        await task
+
+    def test_benchmark_command_runs(self):
+        out = StringIO()
+        call_command('benchmark_ws_hub', clients=20, symbols=10, per_client=3, rate=200, seconds=0.3,
+                     seed=1, stdout=out)
+        self.assertIn('Delivered', out.getvalue())
+
+
+class OrderBookTests(SimpleTestCase):
+    """Trigger heaps: only crossed orders, in price-time priority"""
+
+    def test_crossed_returns_triggered_orders_in_priority_order(self):
+        book = OrderBook()
+        book.add(1, 'AAPL', '95.00', below=True)    # buy limit
+        book.add(2, 'AAPL', '98.00', below=True)    # buy limit, better price
+        book.add(3, 'AAPL', '98.00', below=True)    # same price, later
+        book.add(4, 'AAPL', '105.00', below=False)  # sell limit
+        book.add(5, 'MSFT', '99.00', below=True)
+
+        self.assertEqual(book.crossed('AAPL', 100), [])
+        self.assertEqual(book.crossed('AAPL', Decimal('97.50')), [2, 3])
+        self.assertEqual(book.crossed('AAPL', 110), [4])
+        self.assertEqual(book.crossed('AAPL', 90), [1])
+        self.assertEqual(len(book), 1)
+
+    def test_removed_orders_never_trigger(self):
+        book = OrderBook()
+        for order_id in range(3000):
+            book.add(order_id, 'AAPL', 100 + order_id % 10, below=False)
+        for order_id in range(0, 3000, 2):
+            self.assertTrue(book.remove(order_id))
+        self.assertFalse(book.remove(0))
+
+        triggered = book.crossed('AAPL', 200)
+        self.assertEqual(len(triggered), 1500)
+        self.assertTrue(all(order_id % 2 for order_id in triggered))
+
+    def test_matching_cost_does_not_grow_with_resting_orders(self):
+        book = OrderBook()
+        for order_id in range(100000):
+            book.add(order_id, 'AAPL', 50 + order_id % 1000 / 100, below=True)
+        started = time.perf_counter()
+        for _ in range(1000):
+            book.crossed('AAPL', 100)
+        self.assertLess((time.perf_counter() - started) / 1000, 0.0005)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class OrderManagerTests(TestCase):
+    """Limit/stop orders persisted, triggered by quote updates and filled"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'password')
+        self.stock = Stocks.objects.create(ticker='AAPL', name='Apple Inc.', curr_price=Decimal('100.00'))
+        self.manager = OrderManager(fill_workers=0)
+
+    def test_limit_buy_fills_when_price_falls_to_limit(self):
+        order = self.manager.place(self.user, self.stock, 'BUY', 'LIMIT', 10, '95.00')
+        self.assertEqual(order.status, 'OPEN')
+
+        self.manager.on_quotes({'AAPL': {'current_price': 96.0}})
+        self.assertFalse(UserStock.objects.exists())
+
+        self.manager.on_quotes({'AAPL': {'current_price': 94.5}})
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'FILLED')
+        self.assertEqual(order.fill_price, Decimal('94.50'))
+        position = UserStock.objects.get(user=self.user, stock=self.stock)
+        self.assertEqual(position.purchase_quantity, 10)
+        self.assertEqual(position.cost_basis, Decimal('945.00'))
+
+    def test_stop_sell_without_shares_is_rejected(self):
+        order = self.manager.place(self.user, self.stock, 'SELL', 'STOP', 5, '90.00')
+        self.manager.on_quotes({'AAPL': {'current_price': 89.0}})
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'REJECTED')
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_marketable_order_fills_immediately_and_cancel_stops_others(self):
+        filled = self.manager.place(self.user, self.stock, 'BUY', 'LIMIT', 3, '101.00')
+        self.assertEqual(filled.status, 'FILLED')
+        resting = self.manager.place(self.user, self.stock, 'SELL', 'LIMIT', 3, '120.00')
+
+        self.assertTrue(self.manager.cancel(self.user, resting.id))
+        self.assertFalse(self.manager.cancel(self.user, resting.id))
+        self.manager.on_quotes({'AAPL': {'current_price': 125.0}})
+        self.assertEqual(UserStock.objects.get(user=self.user).purchase_quantity, 3)
+
+    def test_open_orders_are_recovered_from_the_database(self):
+        order = self.manager.place(self.user, self.stock, 'BUY', 'STOP', 2, '110.00')
+        recovered = OrderManager(fill_workers=0)
+        recovered.on_quotes({'AAPL': {'current_price': 111.0}})
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'FILLED')
+
+    def test_orders_placed_by_another_process_are_picked_up(self):
+        # The price process loaded its book before the web worker took these orders
+        price_process = OrderManager(fill_workers=0)
+        price_process.on_quotes({})
+        web_worker = OrderManager(fill_workers=0)
+        order = web_worker.place(self.user, self.stock, 'BUY', 'LIMIT', 5, '95.00')
+        cancelled = web_worker.place(self.user, self.stock, 'BUY', 'LIMIT', 5, '96.00')
+        web_worker.cancel(self.user, cancelled.id)
+
+        with CaptureQueriesContext(connection) as captured:
+            price_process.on_quotes({'MSFT': {'current_price': 1.0}})
+        self.assertEqual(len(captured), 1)
+        self.assertEqual(set(price_process.book.orders), {order.id})
+
+        price_process.on_quotes({'AAPL': {'current_price': 94.0}})
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'FILLED')
+        self.assertEqual(UserStock.objects.get(user=self.user).purchase_quantity, 5)
+
+    def test_provider_quotes_reach_listeners(self):
+        received = []
+        with mock.patch.object(stock_service, '_quote_listeners', [received.append]), \
+                mock.patch.object(stock_service, '_get_yfinance_batch',
+                                  return_value={'AAPL': {'current_price': 1.0}, 'MSFT': {'current_price': 2.0}}):
+            stock_service.get_multiple_stocks(['AAPL', 'MSFT'], use_cache=False)
+        self.assertEqual(set(received[0]), {'AAPL', 'MSFT'})
+
+    def test_only_the_refresh_command_matches_orders(self):
+        self.assertNotIn(order_manager.on_quotes, stock_service._quote_listeners)
+
+        listening = []
+        with mock.patch.object(stock_service, 'get_multiple_stocks',
+                               side_effect=lambda *args, **kwargs: listening.extend(stock_service._quote_listeners) or {}):
+            call_command('refresh_prices', '--once', stdout=StringIO())
+
+        self.assertIn(order_manager.on_quotes, listening)
+        self.assertNotIn(order_manager.on_quotes, stock_service._quote_listeners)
+
+    def test_order_form_places_limit_order(self):
+        self.client.force_login(self.user)
+        with mock.patch('stocks.views.order_manager', self.manager):
+            self.client.post(f'/buy/{self.stock.pk}/', {'quantity': 4, 'order_type': 'LIMIT', 'trigger_price': '90'})
+            response = self.client.get('/')
+        self.assertEqual(len(response.context['open_orders']), 1)
+        self.assertEqual(self.client.get('/api/orders/').json()['orders'][0]['trigger_price'], 90.0)
+
+
+@override_settings(CACHES=TEST_CACHES,
+                   STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class WatchlistQueryTests(TestCase):
+    """Watchlist endpoints use a fixed number of queries regardless of size"""
+
+    def setUp(self):
+        quote_cache.clear()
+        self.user = User.objects.create_user('watcher', 'watcher@example.com', 'password')
+        self.client.force_login(self.user)
+
+        # Flush by hand instead of from the background thread
+        patcher = mock.patch.object(price_persister, 'flush_interval', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(price_persister.flush)
+
+    def watch(self, count):
+        for i in range(count):
+            stock = Stocks.objects.create(ticker=f'T{i:03d}', name=f'Ticker {i}', curr_price=Decimal('10.00'))
+            Watchlist.objects.create(user=self.user, stock_symbol=stock.ticker, stock_name=stock.name)
+            if i % 2:
+                # Half the symbols have a fresher cached quote to write back
+                stock_service._cache_put(f"stock_data_{stock.ticker}", {'current_price': 12.5, 'volume': 7})
+
+    def test_api_query_count_is_constant(self):
+        self.watch(100)
+
+        # session, user, watchlist rows, stocks; price writes are deferred
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/watchlist/update-prices/')
+
+        self.assertEqual(response.json()['updated_count'], 100)
+        self.assertEqual(price_persister.get_stats()['pending'], 50)
+        self.assertEqual(price_persister.flush(), 50)
+        self.assertEqual(Stocks.objects.filter(curr_price=Decimal('12.50'), volume=7).count(), 50)
+
+        # Nothing changed since the last request: nothing is queued
+        self.client.get('/api/watchlist/update-prices/')
+        self.assertEqual(price_persister.get_stats()['pending'], 0)
+
+    def test_api_live_fetch_updates_stored_prices(self):
+        self.watch(3)
+
+        async def live_quotes(symbols):
+            return {symbol: {'current_price': 20.0, 'volume': 9, 'source': 'yfinance'} for symbol in symbols[:2]}
+
+        with mock.patch.object(stock_service, 'aget_multiple_stocks', side_effect=live_quotes) as fetch:
+            response = self.client.get('/api/watchlist/update-prices/?live=1')
+
+        fetch.assert_called_once_with(['T000', 'T001', 'T002'])
+        prices = {price['symbol']: price for price in response.json()['prices']}
+        self.assertEqual(prices['T000']['current_price'], 20.0)
+        self.assertEqual(prices['T000']['source'], 'yfinance')
+        self.assertEqual(prices['T002']['source'], 'Database')
+
+    def test_view_query_count_is_constant(self):
+        self.watch(100)
+
+        with self.assertNumQueries(4):
+            response = self.client.get('/watchlist/')
+
+        self.assertEqual(response.context['total_items'], 100)
+
+
+class ConditionalPriceApiTests(TestCase):
+    """ETag/Last-Modified revalidation and ?since= deltas on the price APIs"""
+
+    def setUp(self):
+        quote_cache.clear()
+        self.user = User.objects.create_user('poller', 'poller@example.com', 'password')
+        self.client.force_login(self.user)
+        for ticker in ['AAPL', 'MSFT', 'GOOGL']:
+            Stocks.objects.create(ticker=ticker, name=ticker, curr_price=Decimal('100.00'))
+            Watchlist.objects.create(user=self.user, stock_symbol=ticker, stock_name=ticker)
+        # Old enough to be outside the delta overlap window
+        Stocks.objects.update(last_updated=timezone.now() - timezone.timedelta(hours=1))
+
+    def touch(self, ticker, price):
+        Stocks.objects.filter(ticker=ticker).update(curr_price=Decimal(price), last_updated=timezone.now())
+
+    def test_unchanged_quote_is_not_modified(self):
+        response = self.client.get('/api/stock/AAPL/price/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        not_modified = self.client.get('/api/stock/AAPL/price/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        self.touch('AAPL', '101.00')
+        changed = self.client.get('/api/stock/AAPL/price/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['current_price'], 101.0)
+
+    def test_watchlist_etag_changes_with_any_quote(self):
+        etag = self.client.get('/api/watchlist/update-prices/')['ETag']
+        self.assertEqual(self.client.get('/api/watchlist/update-prices/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.touch('MSFT', '250.00')
+        self.assertEqual(self.client.get('/api/watchlist/update-prices/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_since_returns_only_changed_quotes(self):
+        full = self.client.get('/api/watchlist/update-prices/').json()
+        self.assertEqual(full['updated_count'], 3)
+        self.assertFalse(full['delta'])
+
+        self.touch('GOOGL', '150.00')
+        delta = self.client.get('/api/watchlist/update-prices/', {'since': full['cursor']}).json()
+        self.assertTrue(delta['delta'])
+        self.assertEqual([price['symbol'] for price in delta['prices']], ['GOOGL'])
+
+        # Updated within the overlap window before the new cursor, so repeated once more
+        again = self.client.get('/api/watchlist/update-prices/', {'since': delta['cursor']}).json()
+        self.assertEqual([price['symbol'] for price in again['prices']], ['GOOGL'])
+
+        response = self.client.get('/api/watchlist/update-prices/', {'since': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unchanged_since_poll_keeps_its_cursor_and_is_not_modified(self):
+        full = self.client.get('/api/watchlist/update-prices/')
+        first = self.client.get('/api/watchlist/update-prices/', {'since': full.json()['cursor']})
+        self.assertEqual(first.json()['prices'], [])
+
+        # Nothing changed, so the cursor is handed back and the next poll's URL
+        # (the browser's cache key) is unchanged
+        cursor = first.json()['cursor']
+        self.assertEqual(cursor, full.json()['cursor'])
+        again = self.client.get('/api/watchlist/update-prices/', {'since': cursor}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+        self.touch('MSFT', '250.00')
+        changed = self.client.get('/api/watchlist/update-prices/', {'since': cursor}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual([price['symbol'] for price in changed.json()['prices']], ['MSFT'])
+        self.assertNotEqual(changed.json()['cursor'], cursor)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RefreshPricesCommandTests(TestCase):
+    """The refresh_prices command is the only caller of the providers for stored quotes"""
+
+    def setUp(self):
+        quote_cache.clear()
+        for ticker in ('AAPL', 'GOOGL', 'MSFT'):
+            Stocks.objects.create(ticker=ticker, name=ticker, curr_price=Decimal('1.00'))
+        Stocks.objects.create(ticker='OLD', name='Delisted', curr_price=Decimal('1.00'), is_active=False)
+
+    def refresh(self, quotes, *args):
+        out = StringIO()
+        with mock.patch.object(stock_service, 'get_multiple_stocks', return_value=quotes) as fetch:
+            call_command('refresh_prices', '--once', *args, stdout=out)
+        return fetch, out.getvalue()
+
+    def test_refresh_pass_stores_fetched_quotes(self):
+        quote = {'current_price': 123.456, 'previous_close': 120, 'volume': 5, 'market_cap': 9}
+        fetch, output = self.refresh({'AAPL': quote})
+
+        fetch.assert_called_once_with(['AAPL', 'GOOGL', 'MSFT'], max_workers=None, force_refresh=True)
+        self.assertIn('Refreshed 1 stocks, 2 failed', output)
+        aapl = Stocks.objects.get(ticker='AAPL')
+        self.assertEqual((aapl.curr_price, aapl.previous_close, aapl.volume, aapl.market_cap),
+                         (Decimal('123.46'), Decimal('120.00'), 5, 9))
+        self.assertEqual(Stocks.objects.get(ticker='MSFT').curr_price, Decimal('1.00'))
+
+    def test_symbols_are_fetched_in_batches(self):
+        fetch, _ = self.refresh({}, '--batch-size', '2', '--symbols', 'aapl', 'msft', 'googl', 'old')
+
+        self.assertEqual([call.args[0] for call in fetch.call_args_list], [['AAPL', 'GOOGL'], ['MSFT']])
+
+    def test_price_api_serves_the_stored_quote_without_calling_providers(self):
+        user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.client.force_login(user)
+
+        with mock.patch('stocks.services.yf') as yfinance, \
+                mock.patch.object(stock_service, 'get_multiple_stocks') as batch:
+            response = self.client.get('/api/stock/aapl/price/')
+
+        self.assertEqual(response.json()['current_price'], 1.0)
+        self.assertEqual(response.json()['source'], 'Database')
+        self.assertEqual(yfinance.mock_calls, [])
+        batch.assert_not_called()
+
+
+class PricePersisterTests(TestCase):
+    """Write-behind quote persistence"""
+
+    def setUp(self):
+        self.persister = PricePersister(flush_interval=None)
+        self.stocks = [
+            Stocks.objects.create(ticker=ticker, name=ticker, curr_price=Decimal('10.00'), volume=100)
+            for ticker in ('AAPL', 'MSFT', 'GOOGL')
+        ]
+
+    def test_unchanged_quotes_only_record_the_check(self):
+        Stocks.objects.filter(pk=self.stocks[0].pk).update(last_updated=timezone.now() - timezone.timedelta(hours=1))
+        stock = Stocks.objects.get(pk=self.stocks[0].pk)
+        self.assertFalse(self.persister.record(stock, {'current_price': 10.0, 'volume': 100}))
+
+        # savepoint, one UPDATE of the check time, release
+        with self.assertNumQueries(3):
+            self.assertEqual(self.persister.flush(), 0)
+
+        stored = Stocks.objects.get(pk=stock.pk)
+        self.assertEqual(stored.last_updated, stock.last_updated)
+        self.assertLess(stored.quote_age_seconds, 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.persister.flush(), 0)
+
+    def test_buffered_rows_flush_in_one_update(self):
+        for stock in self.stocks:
+            self.persister.record(stock, {'current_price': 11.0})
+        # A later quote for the same row replaces the buffered one
+        self.persister.record(self.stocks[0], {'current_price': 12.0})
+
+        # savepoint, one UPDATE, release
+        with self.assertNumQueries(3):
+            self.assertEqual(self.persister.flush(), 3)
+
+        prices = dict(Stocks.objects.values_list('ticker', 'curr_price'))
+        self.assertEqual(prices, {'AAPL': Decimal('12.00'), 'MSFT': Decimal('11.00'), 'GOOGL': Decimal('11.00')})
+        self.assertEqual(Stocks.objects.get(ticker='AAPL').volume, 100)
+
+    def test_rows_only_write_the_fields_they_changed(self):
+        self.persister.record(self.stocks[0], {'current_price': 11.0})
+        self.persister.record(self.stocks[1], {'current_price': 10.0, 'volume': 200})
+        # Another writer moved MSFT's price after our copy was loaded
+        Stocks.objects.filter(ticker='MSFT').update(curr_price=Decimal('15.00'))
+
+        # savepoint, one UPDATE per field set, release
+        with self.assertNumQueries(4):
+            self.assertEqual(self.persister.flush(), 2)
+
+        rows = {stock.ticker: (stock.curr_price, stock.volume) for stock in Stocks.objects.all()}
+        self.assertEqual(rows['AAPL'], (Decimal('11.00'), 100))
+        self.assertEqual(rows['MSFT'], (Decimal('15.00'), 200))
+
+
+class StockSearchTests(TestCase):
+    """Ranked full-text stock search"""
+
+    def setUp(self):
+        Stocks.objects.create(ticker='AAPL', name='Apple Inc.', sector='Technology',
+                              industry='Consumer Electronics', curr_price=Decimal('1.00'))
+        Stocks.objects.create(ticker='MSFT', name='Microsoft Corporation', sector='Technology',
+                              industry='Software', curr_price=Decimal('1.00'))
+        Stocks.objects.create(ticker='APLE', name='Apple Hospitality REIT', sector='Real Estate',
+                              description='Not to be confused with AAPL.', curr_price=Decimal('1.00'))
+
+    def tickers(self, query):
+        return [stock.ticker for stock in search.search(query)]
+
+    def test_ticker_match_ranks_first(self):
+        self.assertTrue(search.fts_available())
+        self.assertEqual(self.tickers('aapl'), ['AAPL', 'APLE'])
+
+    def test_prefix_and_multi_column_terms(self):
+        self.assertEqual(self.tickers('micro'), ['MSFT'])
+        self.assertEqual(self.tickers('apple real estate'), ['APLE'])
+        self.assertEqual(set(self.tickers('technology')), {'AAPL', 'MSFT'})
+
+    def test_index_follows_row_changes(self):
+        Stocks.objects.filter(ticker='MSFT').update(name='Macrohard')
+        Stocks.objects.filter(ticker='APLE').delete()
+
+        self.assertEqual(self.tickers('macrohard'), ['MSFT'])
+        self.assertEqual(self.tickers('microsoft'), [])
+        self.assertEqual(self.tickers('hospitality'), [])
+
+    def test_punctuation_only_query(self):
+        self.assertEqual(self.tickers('"*-'), [])
+
+    def test_fallback_without_index(self):
+        with mock.patch.object(search, 'fts_available', return_value=False):
+            self.assertEqual(self.tickers('aapl'), ['AAPL', 'APLE'])
+            self.assertEqual(self.tickers('micro'), ['MSFT'])
+
+    def test_service_search_uses_index(self):
+        self.assertEqual(stock_service.search_stocks('soft')[0]['symbol'], 'MSFT')
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class StockSearchViewTests(TestCase):
+    """The market page pages through ranked ids and only loads the current page"""
+
+    def setUp(self):
+        Stocks.objects.bulk_create([
+            Stocks(ticker=f'T{i}', name=f'Company {i} Holdings', sector='Tech' if i % 2 else 'Energy',
+                   curr_price=Decimal('1.00'))
+            for i in range(40)
+        ])
+        self.user = User.objects.create_user('searcher', 'searcher@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def test_query_pages_follow_search_rank(self):
+        ranked = search.search_ids('holdings energy')
+        self.assertEqual(len(ranked), 20)
+
+        response = self.client.get('/stocks/?q=holdings energy&page=2')
+
+        page = response.context['data']
+        self.assertEqual(page.paginator.num_pages, 3)
+        self.assertEqual([stock.pk for stock in page], ranked[8:16])
+        self.assertTrue(all(stock.sector == 'Energy' for stock in page))
+
+    def test_exact_ticker_is_found_among_many_names(self):
+        self.assertEqual(search.search_ids('T19', 1), [Stocks.objects.get(ticker='T19').pk])
+
+    def test_only_the_requested_page_of_ids_is_fetched(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/stocks/?q=holdings&page=3')
+
+        searches = [query['sql'] for query in queries if search.FTS_TABLE in query['sql']]
+        self.assertEqual(len(searches), 2)
+        self.assertIn('count(*)', searches[0])
+        self.assertTrue(searches[1].endswith('LIMIT 8 OFFSET 16'), searches[1])
+        self.assertEqual([stock.pk for stock in response.context['data']], search.search_ids('holdings')[16:24])
+
+        with mock.patch.object(search, 'fts_available', return_value=False):
+            results = search.SearchResults('holdings')
+            self.assertEqual((results.count(), results[16:24]), (40, search.search_ids('holdings')[16:24]))
+
+
+class AutocompleteTests(TestCase):
+    """In-memory typeahead index"""
+
+    def setUp(self):
+        for ticker, name in [('AAPL', 'Apple Inc.'), ('AMZN', 'Amazon.com, Inc.'),
+                             ('MSFT', 'Microsoft Corporation'), ('A', 'Agilent Technologies')]:
+            Stocks.objects.create(ticker=ticker, name=name, curr_price=Decimal('1.00'))
+        self.index = AutocompleteIndex(max_age=None)
+
+    def symbols(self, query, **kwargs):
+        return [suggestion['symbol'] for suggestion in self.index.suggest(query, **kwargs)]
+
+    def test_ticker_and_name_prefixes(self):
+        self.assertEqual(self.symbols('a')[:3], ['A', 'AAPL', 'AMZN'])
+        self.assertEqual(self.symbols('micro'), ['MSFT'])
+        self.assertEqual(self.symbols('amazon com'), ['AMZN'])
+
+    def test_typos_fall_back_to_fuzzy_matches(self):
+        self.assertEqual(self.symbols('microsfot'), ['MSFT'])
+        self.assertEqual(self.symbols('aple'), ['AAPL'])
+
+    def test_answers_from_memory_after_build(self):
+        self.index.suggest('a')
+
+        with self.assertNumQueries(0):
+            for query in ('ap', 'micro', 'amzon', 'zzz'):
+                self.index.suggest(query)
+
+    def test_new_stocks_are_added_incrementally(self):
+        self.index.suggest('a')
+        stock = Stocks.objects.create(ticker='NVDA', name='NVIDIA Corporation', curr_price=Decimal('1.00'))
+        self.index.add(stock.pk, stock.ticker, stock.name)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.symbols('nvid'), ['NVDA'])
+
+    def test_multi_term_queries_are_not_limited_by_capped_prefix_lists(self):
+        # More than top_k names start with "global" and with "h"
+        Stocks.objects.bulk_create([
+            Stocks(ticker=f'G{i:02}', name=f'Global {word} Inc.', curr_price=Decimal('1.00'))
+            for i, word in enumerate(['Partners'] * 24 + ['Holdings', 'Hotels'] + ['Harbor'] * 24)
+        ])
+
+        self.assertEqual(self.symbols('global hold'), ['G24'])
+        self.assertEqual(set(self.symbols('glo ho', limit=50)), {'G24', 'G25'})
+        self.assertEqual(self.symbols('h global hote'), ['G25'])
+        # Both terms common: every match is still found, best ranked first
+        harbor = self.symbols('global har', limit=50)
+        self.assertEqual(harbor, [f'G{i}' for i in range(26, 50)])
+
+    def test_removed_stocks_leave_the_prefix_lists(self):
+        Stocks.objects.bulk_create([
+            Stocks(ticker=f'G{i:02}', name=f'Global Partners {i}', curr_price=Decimal('1.00')) for i in range(30)
+        ])
+        self.index.build()
+        first = Stocks.objects.get(ticker='G00').pk
+        self.assertEqual(len(self.index.trie.lookup('g')), self.index.top_k)
+
+        self.index.remove(first)
+
+        self.assertNotIn(first, self.index.trie.lookup('g'))
+        self.assertNotIn(first, self.index.trie.lookup('g00'))
+        # The id the cap had cut off takes the freed slot, so the full list stays complete
+        self.assertEqual(len(self.index.trie.lookup('g')), self.index.top_k)
+        self.assertEqual(self.symbols('global part', limit=50), [f'G{i:02}' for i in range(1, 30)])
+        self.assertEqual(self.symbols('g00'), [])
+
+    def test_one_background_rebuild_at_a_time(self):
+        self.index.build()
+        self.index.max_age = 0
+        self.index._built_at = time.monotonic() - 1
+
+        workers = [threading.Thread(target=self.index._ensure_built) for _ in range(8)]
+        with mock.patch('stocks.autocomplete.threading.Thread') as thread:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        self.assertEqual(thread.call_count, 1)
+
+    def test_fuzzy_matches_respect_earlier_terms(self):
+        Stocks.objects.create(ticker='MSCI', name='MSCI Inc. Microsystems', curr_price=Decimal('1.00'))
+
+        self.assertEqual(self.symbols('corp microsfot'), [])
+        self.assertEqual(self.symbols('msci microsistems'), ['MSCI'])
+
+    def test_save_signal_updates_shared_index(self):
+        autocomplete_index.build()
+        Stocks.objects.create(ticker='TSLA', name='Tesla, Inc.', curr_price=Decimal('1.00'))
+
+        self.assertEqual([s['symbol'] for s in autocomplete_index.suggest('tesla')], ['TSLA'])
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TransactionHistoryTests(TestCase):
+    """Keyset-paginated history and streaming export"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('historian', 'historian@example.com', 'password')
+        self.client.force_login(self.user)
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, stock_symbol='AAPL', stock_name='Apple Inc.', quantity=i + 1,
+                        price=Decimal('10.00'), type='BUY')
+            for i in range(25)
+        ])
+        # Several rows share a timestamp so the id tie-breaker matters
+        Transaction.objects.filter(quantity__lte=10).update(date=timezone.now())
+
+    def test_pages_cover_every_row_once(self):
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = keyset_page(Transaction.objects.filter(user=self.user), cursor, page_size=7)
+            seen.extend(row.pk for row in rows)
+            if cursor is None:
+                break
+
+        expected = list(Transaction.objects.filter(user=self.user).order_by('-date', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_view_pages_and_rejects_bad_cursor(self):
+        response = self.client.get('/transaction_history/?page_size=10')
+        self.assertEqual(len(response.context['transactions']), 10)
+
+        response = self.client.get(f"/transaction_history/?page_size=10&cursor={response.context['next_cursor']}")
+        self.assertEqual(len(response.context['transactions']), 10)
+
+        self.assertEqual(self.client.get('/transaction_history/?cursor=garbage').status_code, 400)
+
+    def test_later_pages_use_the_same_query_shape(self):
+        last = Transaction.objects.order_by('date', 'id').first()
+        with CaptureQueriesContext(connection) as queries:
+            keyset_page(Transaction.objects.filter(user=self.user), encode_cursor(last.date, last.pk), 10)
+
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+
+    def test_history_query_uses_the_user_date_index(self):
+        last = Transaction.objects.order_by('date', 'id').first()
+        with CaptureQueriesContext(connection) as queries:
+            keyset_page(Transaction.objects.filter(user=self.user), encode_cursor(last.date, last.pk), 10)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('transaction_user_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_csv_export_streams_every_row(self):
+        response = self.client.get('/transaction_history/export/?format=csv')
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'date,type,stock_symbol,stock_name,quantity,price')
+        self.assertEqual(len(lines), 26)
+
+    def test_ndjson_export(self):
+        response = self.client.get('/transaction_history/export/?format=ndjson')
+
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(records), 25)
+        self.assertEqual(records[0]['price'], '10.00')
+        self.assertEqual(self.client.get('/transaction_history/export/?format=xml').status_code, 400)
+
+    async def test_asgi_export_is_an_async_stream_of_keyset_pages(self):
+        expected = await sync_to_async(lambda: b''.join(
+            self.client.get('/transaction_history/export/?format=csv').streaming_content))()
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+        with mock.patch('stocks.views.TRANSACTION_EXPORT_CHUNK', 10), \
+                mock.patch('stocks.views.keyset_page', wraps=keyset_page) as page:
+            response = await self.async_client.get('/transaction_history/export/?format=csv')
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+
+        self.assertEqual(b''.join(chunks), expected)
+        self.assertEqual(page.call_count, 3)
+
+
+@override_settings(CACHES=TEST_CACHES,
+                   STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ViewPerformanceTests(TestCase):
+    """
+    Query and latency budgets for every view against a heavy account.
+
+    Budgets are exact query counts for the seeded data; a view whose count
+    grows with positions, trades or watchlist size (N+1) fails here. Time
+    limits are generous and checked against the median of several requests,
+    so they catch order-of-magnitude regressions without failing on a busy
+    machine.
+    """
+
+    TIMING_RUNS = 5
+    STOCKS = 300
+    POSITIONS = 200
+    TRANSACTIONS = 3000
+    WATCHLIST = 150
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('whale', 'whale@example.com', 'password')
+        Stocks.objects.bulk_create([
+            Stocks(ticker=f'S{i:04d}', name=f'Seed Company {i}', sector='Technology',
+                   curr_price=Decimal('50.00'), previous_close=Decimal('49.00'), volume=1000)
+            for i in range(cls.STOCKS)
+        ])
+        stocks = list(Stocks.objects.order_by('id'))
+        cls.stock = stocks[0]
+
+        UserStock.objects.bulk_create([
+            UserStock(user=cls.user, stock=stock, purchase_price=Decimal('40.00'), purchase_quantity=100,
+                      cost_basis=Decimal('4000.00'))
+            for stock in stocks[:cls.POSITIONS]
+        ])
+        Transaction.objects.bulk_create([
+            Transaction(user=cls.user, stock_symbol=stocks[i % cls.POSITIONS].ticker,
+                        stock_name=stocks[i % cls.POSITIONS].name, quantity=1, price=Decimal('40.00'), type='BUY')
+            for i in range(cls.TRANSACTIONS)
+        ])
+        Watchlist.objects.bulk_create([
+            Watchlist(user=cls.user, stock_symbol=stock.ticker, stock_name=stock.name)
+            for stock in stocks[:cls.WATCHLIST]
+        ])
+
+    def setUp(self):
+        quote_cache.clear()
+        self.client.force_login(self.user)
+
+        # No provider traffic: the views only see cached-quote misses
+        service = mock.patch('stocks.views.stock_service', spec=True)
+        self.stock_service = service.start()
+        self.stock_service.get_cached_stocks.return_value = {}
+        self.stock_service.get_cached_stock_data.return_value = None
+        self.addCleanup(service.stop)
+
+        persister = mock.patch.object(price_persister, 'flush_interval', None)
+        persister.start()
+        self.addCleanup(persister.stop)
+
+        # One-off, per-process lookups shouldn't count against a request
+        search.fts_available()
+
+    def assertBudget(self, method, url, queries, seconds, data=None, status=200):
+        """
+        Request ``url`` and check its status and query count, then its median
+        wall time; only GETs are repeated, other methods change state.
+        """
+        timings = []
+        for run in range(self.TIMING_RUNS if method == 'get' else 1):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(self.client, method)(url, data or {})
+                timings.append(time.perf_counter() - started)
+
+            self.assertEqual(response.status_code, status)
+            self.assertLessEqual(
+                len(captured), queries,
+                f"{url} ran {len(captured)} queries (budget {queries}):\n" +
+                '\n'.join(query['sql'] for query in captured.captured_queries)
+            )
+        elapsed = statistics.median(timings)
+        self.assertLess(elapsed, seconds, f"{url} took {elapsed:.3f}s (median of {len(timings)}, budget {seconds}s)")
+        return response
+
+    def test_index(self):
+        response = self.assertBudget('get', '/', queries=4, seconds=1.5)
+        self.assertEqual(len(response.context['data']), self.POSITIONS)
+
+    def test_stocks(self):
+        self.assertBudget('get', '/stocks/?page=5', queries=4, seconds=1.0)
+
+    def test_stocks_search(self):
+        # session, user, match count, one page of ranked ids, that page's rows
+        self.assertBudget('get', '/stocks/?q=seed+company', queries=5, seconds=1.0)
+
+    def test_portfolio_dashboard(self):
+        response = self.assertBudget('get', '/portfolio_dashboard/', queries=3, seconds=1.5)
+        self.assertEqual(len(response.context['portfolio']), self.POSITIONS)
+
+    def test_watchlist_view(self):
+        response = self.assertBudget('get', '/watchlist/', queries=4, seconds=1.5)
+        self.assertEqual(response.context['total_items'], self.WATCHLIST)
+
+    def test_transaction_history(self):
+        response = self.assertBudget('get', '/transaction_history/', queries=3, seconds=1.0)
+        cursor = response.context['next_cursor']
+        self.assertBudget('get', f'/transaction_history/?cursor={cursor}', queries=3, seconds=1.0)
+
+    def test_transaction_export(self):
+        response = self.assertBudget('get', '/transaction_history/export/', queries=2, seconds=1.0)
+        # Rows are fetched while streaming, in chunks
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), self.TRANSACTIONS + 1)
+        self.assertLessEqual(len(captured), 1)
+
+    def test_buy(self):
+        self.assertBudget('post', f'/buy/{self.stock.pk}/', data={'quantity': 5},
+                          queries=10, seconds=1.0, status=302)
+
+    def test_sell(self):
+        self.assertBudget('post', f'/sell/{self.stock.pk}/', data={'quantity': 5},
+                          queries=10, seconds=1.0, status=302)
+
+    def test_stock_price_api(self):
+        self.assertBudget('get', f'/api/stock/{self.stock.ticker}/price/', queries=3, seconds=0.5)
+
+    def test_watchlist_prices_api(self):
+        response = self.assertBudget('get', '/api/watchlist/update-prices/', queries=4, seconds=1.0)
+        self.assertEqual(response.json()['updated_count'], self.WATCHLIST)
+
+    def test_suggest_api(self):
+        autocomplete_index.build()
+        self.assertBudget('get', '/api/stocks/suggest/?q=seed', queries=2, seconds=0.5)
+
+    def test_indicators_api(self):
+        result = {'timestamps': np.arange(3), 'indicators': {'sma': {'params': {'window': 2},
+                                                                     'values': {'sma': np.array([np.nan, 1.0, 2.0])}}}}
+        with mock.patch('stocks.views.indicator_service.get_indicators', return_value=result):
+            self.assertBudget('get', f'/api/stock/{self.stock.ticker}/indicators/?indicators=sma',
+                              queries=2, seconds=0.5)
@@ -0,0 +1,265 @@
+"""
+Trade execution against the locally stored quotes.
+
+Every order is priced from the Stocks row (kept current by refresh_prices),
+so no provider call happens while a request is being served, and the
+database transaction only spans the position update and the Transaction
+insert.
+
+Position updates start with a conditional ``UPDATE ... SET purchase_quantity
+= purchase_quantity +/- n`` built from F() expressions. That statement is the
+concurrency guard: it can't oversell, and it takes the row lock (the write
+lock on SQLite, where select_for_update is a no-op) before anything is read,
+so concurrent orders for the same position serialize instead of losing
+updates. The exact average-cost bookkeeping is then done in Decimal on the
+locked row.
+
+With ``notify=True`` the confirmation email is written to the outbox in the
+same transaction, so it is sent if and only if the trade commits.
+"""
+import logging
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CENT, Stocks, Transaction, UserStock
+from .outbox import email_outbox
+
+logger = logging.getLogger(__name__)
+
+MAX_ORDER_QUANTITY = 10000
+MAX_BATCH_LEGS = 100
+LEDGER_FIELDS = ['purchase_quantity', 'purchase_price', 'cost_basis', 'realized_pnl', 'updated_at']
+
+
+class TradeError(Exception):
+    """An order that can't be executed; the message is safe to show the user"""
+
+
+class BatchTradeError(TradeError):
+    """A batch that was not applied; ``results`` holds the per-leg outcome"""
+
+    def __init__(self, message: str, results: List[Dict[str, Any]]):
+        super().__init__(message)
+        self.results = results
+
+
+class TradeExecutionService:
+    """Executes buy and sell orders with atomic position updates"""
+
+    def validate_quantity(self, quantity) -> int:
+        # int() would truncate 2.7 and reject '1e3'; only whole numbers are share counts
+        if isinstance(quantity, str) and quantity.strip().isdigit():
+            quantity = int(quantity)
+        elif not isinstance(quantity, int) or isinstance(quantity, bool):
+            raise TradeError("Quantity must be a whole number.")
+        if quantity <= 0:
+            raise TradeError("Quantity must be a positive number.")
+        if quantity > MAX_ORDER_QUANTITY:
+            raise TradeError(f"Quantity too large. Maximum allowed is {MAX_ORDER_QUANTITY:,} shares.")
+        return quantity
+
+    def buy(self, user, stock, quantity, notify: bool = False) -> Tuple[Transaction, UserStock]:
+        """Buy ``quantity`` shares at the stored price"""
+        quantity = self.validate_quantity(quantity)
+        price = stock.curr_price
+
+        with transaction.atomic():
+            position = self._claim(user, stock, quantity)
+            if position is None:
+                position = self._open_position(user, stock, quantity, price)
+            else:
+                # The claim already added the shares; redo the cost bookkeeping exactly
+                position.purchase_quantity -= quantity
+                position.apply_buy(quantity, price)
+                position.save(update_fields=LEDGER_FIELDS)
+            trade = self._record(user, stock, quantity, price, 'BUY')
+            if notify:
+                email_outbox.enqueue(
+                    user.email, "Stock Purchase Confirmation",
+                    f"You successfully purchased {quantity} shares of {stock.name} at ${price:.2f} per share. "
+                    f"Total: ${price * quantity:.2f}",
+                )
+
+        logger.info(f"User {user.username} bought {quantity} shares of {stock.ticker} at ${price}")
+        return trade, position
+
+    def sell(self, user, stock, quantity, notify: bool = False) -> Tuple[Transaction, UserStock]:
+        """Sell ``quantity`` shares at the stored price; never more than are held"""
+        quantity = self.validate_quantity(quantity)
+        price = stock.curr_price
+
+        with transaction.atomic():
+            position = self._claim(user, stock, -quantity)
+            if position is None:
+                raise TradeError("Can't sell more than you own")
+            position.purchase_quantity += quantity
+            position.apply_sell(quantity, price)
+            position.save(update_fields=LEDGER_FIELDS)
+            trade = self._record(user, stock, quantity, price, 'SELL')
+            if notify:
+                email_outbox.enqueue(
+                    user.email, "Sell Option executed successfully",
+                    f"Your sale of {quantity} shares of {stock.name} at ${price:.2f} per share was successful",
+                )
+
+        logger.info(f"User {user.username} sold {quantity} shares of {stock.ticker} at ${price}")
+        return trade, position
+
+    def execute_batch(self, user, legs: List[Dict[str, Any]], notify: bool = False) -> List[Dict[str, Any]]:
+        """
+        Execute a list of {'symbol', 'side', 'quantity'} legs all-or-nothing.
+
+        Every leg is validated before anything is written, all legs are
+        priced from one query, and the positions and Transaction rows are
+        written in one transaction with bulk statements. Legs apply in order,
+        so a batch may sell shares it bought in an earlier leg. Raises
+        BatchTradeError, with the per-leg results, if any leg can't execute.
+        """
+        if not isinstance(legs, list) or not legs:
+            raise TradeError("No orders provided.")
+        if len(legs) > MAX_BATCH_LEGS:
+            raise TradeError(f"Too many orders. Maximum allowed is {MAX_BATCH_LEGS} per batch.")
+
+        results = []
+        for leg in legs:
+            result = {'symbol': None, 'side': None, 'quantity': None}
+            try:
+                if not isinstance(leg, dict):
+                    raise TradeError("Order must be an object.")
+                result['symbol'] = str(leg.get('symbol') or '').upper()
+                result['side'] = str(leg.get('side') or '').upper()
+                if result['side'] not in ('BUY', 'SELL'):
+                    raise TradeError("Side must be BUY or SELL.")
+                result['quantity'] = self.validate_quantity(leg.get('quantity'))
+            except TradeError as e:
+                result['error'] = str(e)
+            results.append(result)
+
+        stocks = Stocks.objects.only('id', 'ticker', 'name', 'curr_price').in_bulk(
+            {result['symbol'] for result in results if result['symbol']}, field_name='ticker')
+        for result in results:
+            if 'error' not in result and result['symbol'] not in stocks:
+                result['error'] = "Stock not found."
+        if any('error' in result for result in results):
+            raise BatchTradeError("Invalid orders; nothing was executed.", self._mark(results, 'skipped'))
+
+        try:
+            with transaction.atomic():
+                self._apply_batch(user, results, stocks)
+                if notify:
+                    summary = "\n".join(f"{r['side']} {r['quantity']} {r['symbol']} at ${r['price']:.2f}" for r in results)
+                    email_outbox.enqueue(user.email, "Orders executed",
+                                         f"Your {len(results)} orders were executed:\n{summary}")
+        except IntegrityError:
+            # A concurrent trade opened one of the positions first
+            raise TradeError("Positions changed while the batch was running; please retry.")
+
+        logger.info(f"User {user.username} executed a batch of {len(results)} orders")
+        return self._mark(results, 'filled')
+
+    @staticmethod
+    def _mark(results: List[Dict[str, Any]], status: str) -> List[Dict[str, Any]]:
+        """Set each leg's status: 'rejected' if it has an error, ``status`` otherwise"""
+        for result in results:
+            result['status'] = 'rejected' if 'error' in result else status
+            if result['status'] != 'filled':
+                result.pop('price', None)
+                result.pop('total', None)
+        return results
+
+    def _apply_batch(self, user, results: List[Dict[str, Any]], stocks: Dict[str, Stocks]):
+        stock_ids = {stock.id for stock in stocks.values()}
+        positions = self._lock_positions(user, stock_ids)
+        existing = set(positions)
+
+        trades = []
+        for result in results:
+            stock = stocks[result['symbol']]
+            quantity, price = result['quantity'], stock.curr_price
+            position = positions.get(stock.id)
+            if result['side'] == 'BUY':
+                if position is None:
+                    position = positions[stock.id] = UserStock(
+                        user=user, stock=stock, purchase_quantity=0, cost_basis=Decimal('0'))
+                position.apply_buy(quantity, price)
+            elif position is None or position.purchase_quantity < quantity:
+                result['error'] = "Can't sell more than you own"
+                continue
+            else:
+                position.apply_sell(quantity, price)
+
+            result['price'] = price
+            result['total'] = (price * quantity).quantize(CENT)
+            trades.append(Transaction(
+                user=user,
+                stock_symbol=stock.ticker,
+                stock_name=stock.name,
+                quantity=quantity,
+                price=price,
+                type=result['side'],
+            ))
+
+        if any('error' in result for result in results):
+            raise BatchTradeError("Some orders can't be executed; nothing was executed.",
+                                  self._mark(results, 'skipped'))
+
+        now = timezone.now()
+        for position in positions.values():
+            position.updated_at = now
+        UserStock.objects.bulk_update([positions[pk] for pk in existing], LEDGER_FIELDS)
+        UserStock.objects.bulk_create([position for pk, position in positions.items() if pk not in existing])
+        Transaction.objects.bulk_create(trades)
+
+    def _lock_positions(self, user, stock_ids) -> Dict[int, UserStock]:
+        """
+        Lock and load the user's positions in these stocks, keyed by stock id.
+
+        The no-op UPDATE takes the row locks (and SQLite's write lock) before
+        the rows are read, like _claim does for single orders.
+        """
+        positions = UserStock.objects.filter(user=user, stock_id__in=stock_ids)
+        positions.update(purchase_quantity=F('purchase_quantity'))
+        return {position.stock_id: position for position in positions}
+
+    def _claim(self, user, stock, delta: int):
+        """
+        Atomically add ``delta`` shares to the position and return it locked,
+        or None if there is no position (or, for sells, not enough shares).
+        """
+        positions = UserStock.objects.filter(user=user, stock=stock)
+        if delta < 0:
+            positions = positions.filter(purchase_quantity__gte=-delta)
+        if not positions.update(purchase_quantity=F('purchase_quantity') + delta):
+            return None
+        return UserStock.objects.get(user=user, stock=stock)
+
+    def _open_position(self, user, stock, quantity, price) -> UserStock:
+        position = UserStock(user=user, stock=stock, purchase_quantity=0, cost_basis=Decimal('0'))
+        position.apply_buy(quantity, price)
+        try:
+            with transaction.atomic():
+                position.save()
+            return position
+        except IntegrityError:
+            # A concurrent order opened the position first; add to it instead
+            position = self._claim(user, stock, quantity)
+            position.purchase_quantity -= quantity
+            position.apply_buy(quantity, price)
+            position.save(update_fields=LEDGER_FIELDS)
+            return position
+
+    def _record(self, user, stock, quantity, price, trade_type) -> Transaction:
+        return Transaction.objects.create(
+            user=user,
+            stock_symbol=stock.ticker,
+            stock_name=stock.name,
+            quantity=quantity,
+            price=price,
+            type=trade_type,
+        )
+
+
+trade_service = TradeExecutionService()
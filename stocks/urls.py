@@ -19,9 +19,10 @@ from django.conf.urls.static import static
 from django.urls import path
 from .views import (
     index, populate_stock_data, stocks, loginView, logoutView, register,
-    buy, sell, transaction_history, portfolio_dashboard,
+    buy, sell, transaction_history, export_transactions, portfolio_dashboard,
     watchlist_view, add_to_watchlist, remove_from_watchlist,
-    get_stock_price_api, update_watchlist_prices_api
+    get_stock_price_api, get_stock_indicators_api, update_watchlist_prices_api,
+    suggest_stocks_api, cancel_order, open_orders_api, batch_orders_api, watchlist_stream
 )
 from .health_views import health_check, readiness_check, liveness_check
 
@@ -34,7 +35,9 @@ urlpatterns = [
     path('register/', register, name='register'),
     path('buy/<int:id>/', buy, name='buy'),
     path('sell/<int:id>/', sell, name='sell'),
+    path('orders/<int:order_id>/cancel/', cancel_order, name='cancel_order'),
     path('transaction_history/', transaction_history, name='transaction_history'),
+    path('transaction_history/export/', export_transactions, name='export_transactions'),
     path('portfolio_dashboard/', portfolio_dashboard, name='portfolio_dashboard'),
     path('watchlist/', watchlist_view, name='watchlist_view'),
     path('add_to_watchlist/<str:stock_symbol>/', add_to_watchlist, name='add_to_watchlist'),
@@ -42,7 +45,12 @@ urlpatterns = [
     
     # API endpoints for real-time data
     path('api/stock/<str:symbol>/price/', get_stock_price_api, name='stock_price_api'),
+    path('api/stock/<str:symbol>/indicators/', get_stock_indicators_api, name='stock_indicators_api'),
+    path('api/stocks/suggest/', suggest_stocks_api, name='suggest_stocks_api'),
+    path('api/orders/', open_orders_api, name='open_orders_api'),
+    path('api/orders/batch/', batch_orders_api, name='batch_orders_api'),
     path('api/watchlist/update-prices/', update_watchlist_prices_api, name='update_watchlist_prices_api'),
+    path('api/watchlist/stream/', watchlist_stream, name='watchlist_stream'),
     
     # Health check endpoints
     path('api/health/', health_check, name='health_check'),
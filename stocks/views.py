@@ -1,22 +1,39 @@
+import asyncio
+import csv
+import hashlib
+import json
 import logging
 from decimal import Decimal
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
+from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import Paginator
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_http_methods, require_POST
 from django.views.decorators.cache import cache_page
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.db import transaction
 from django.utils import timezone
 
-from .models import Stocks, UserInfo, UserStock, Transaction, Watchlist
-from .services import stock_service, portfolio_analyzer
-import threading
-
+from .models import Order, Stocks, UserInfo, UserStock, Transaction, Watchlist
+from .services import StockDataService, stock_service, portfolio_analyzer
+from .indicators import INDICATORS, indicator_service
+from .persistence import price_persister
+from . import search
+from .autocomplete import autocomplete_index
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page
+from .trading import BatchTradeError, TradeError, trade_service
+from .orders import order_manager
+from .outbox import email_outbox
+from .streaming import POLL_OVERLAP, price_broadcaster
 logger = logging.getLogger(__name__)
 #
 
@@ -44,14 +61,14 @@ logger = logging.getLogger(__name__)
 @login_required
 def index(request):
     user = request.user
-    user_stocks = UserStock.objects.select_related('stock').filter(user=user)
+    user_stocks = UserStock.objects.select_related('stock').filter(user=user, purchase_quantity__gt=0)
 
     total_value = 0
     invested = 0
 
     for item in user_stocks:
         stock_value = item.purchase_quantity * item.stock.curr_price
-        invested_value = item.purchase_quantity * item.purchase_price
+        invested_value = item.cost_basis
 
         total_value += stock_value
         invested += invested_value
@@ -64,6 +81,7 @@ def index(request):
         'total_value': total_value,
         'invested': invested,
         'gains': round(gains, 2),
+        'open_orders': Order.objects.select_related('stock').filter(user=user, status='OPEN'),
     }
 
     return render(request, 'index.html', context)
@@ -129,36 +147,23 @@ def populate_stock_data(request):
 
 @login_required
 def stocks(request):
-    q = request.GET.get('q')
-    update_prices = request.GET.get('update_prices', 'false') == 'true'
+    q = request.GET.get('q', '').strip()
     
     if q:
-        stock_list = Stocks.objects.filter(name__icontains=q).order_by('id') 
+        # Count the matches and fetch only the current page of ranked ids and rows
+        paginator = Paginator(search.SearchResults(q), 8)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        stocks_by_id = Stocks.objects.in_bulk(page_obj.object_list)
+        page_obj.object_list = [stocks_by_id[pk] for pk in page_obj.object_list if pk in stocks_by_id]
     else:
-        stock_list = Stocks.objects.all().order_by('id') 
-
-    paginator = Paginator(stock_list, 8)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Optionally update prices for the current page
-    if update_prices:
-        try:
-            for stock in page_obj:
-                stock_data = stock_service.get_stock_data(stock.ticker)
-                if stock_data:
-                    stock.curr_price = Decimal(str(stock_data['current_price']))
-                    stock.volume = stock_data.get('volume', stock.volume)
-                    stock.market_cap = stock_data.get('market_cap', stock.market_cap)
-                    stock.last_updated = timezone.now()
-                    stock.save()
-                    logger.info(f"Updated price for {stock.ticker}: ${stock.curr_price}")
-        except Exception as e:
-            logger.error(f"Error updating stock prices: {str(e)}")
-            messages.warning(request, "Some stock prices could not be updated.")
+        paginator = Paginator(Stocks.objects.all().order_by('id'), 8)
+        page_obj = paginator.get_page(request.GET.get('page'))
     
+    # Prices are kept current by the refresh_prices command; the page only
+    # reads what is stored and shows how old each quote is.
     context = {
         'data': page_obj,
+        'query': q,
         'show_update_button': True,
     }
     return render(request, 'market.html', context)
@@ -205,42 +210,35 @@ def register(request):
             messages.error(request, "PAN card number already registered.")
             return render(request, 'register.html')
 
-        # Create User object
-        user = User(
-            username=username,
-            email=email,
-            first_name=first_name,
-            last_name=last_name
-        )
-        user.set_password(password)
-        user.save()
-
-        # Create UserInfo record
-        user_info = UserInfo(
-            user=user,
-            pancard_number=panCard,
-            address=address,
-            phone_number=phoneNumber,
-            user_image=profile_pic,
-            pancard_image=panCard_Image
-        )
-        user_info.save()
+        with transaction.atomic():
+            # Create User object
+            user = User(
+                username=username,
+                email=email,
+                first_name=first_name,
+                last_name=last_name
+            )
+            user.set_password(password)
+            user.save()
+
+            # Create UserInfo record
+            user_info = UserInfo(
+                user=user,
+                pancard_number=panCard,
+                address=address,
+                phone_number=phoneNumber,
+                user_image=profile_pic,
+                pancard_image=panCard_Image
+            )
+            user_info.save()
+
+            # Confirmation email, sent by the outbox once the account exists
+            email_outbox.enqueue(user.email, "Registration Successful",
+                                 f"Dear {user.username}, welcome to our platform!")
 
         # Auto login the user
         login(request, user)
 
-        # Send confirmation email asynchronously
-        t1 = threading.Thread(
-            target=send_email_async,
-            kwargs={
-                "subject": "Registration Successful",
-                "message": f"Dear {user.username}, welcome to our platform!",
-                "from_email": None,
-                "recipient_list": [user.email],
-            }
-        )
-        t1.start()
-
         messages.success(request, "Registration successful! Welcome to the platform.")
         return redirect('index')
 
@@ -252,210 +250,277 @@ def register(request):
 @require_POST
 def buy(request, id):
     """Handle stock purchase with proper validation and error handling"""
+    stock = get_object_or_404(Stocks.objects.only('id', 'ticker', 'name', 'curr_price'), id=id)
+    user = request.user
+    
+    if request.POST.get('order_type', 'MARKET') != 'MARKET':
+        return _place_order(request, stock, 'BUY')
+    
     try:
-        stock = get_object_or_404(Stocks, id=id)
-        user = request.user
-        
-        # Validate quantity
-        try:
-            purchase_quantity = int(request.POST.get('quantity', 0))
-            if purchase_quantity <= 0:
-                messages.error(request, "Quantity must be a positive number.")
-                return redirect('stocks')
-            
-            if purchase_quantity > 10000:  # Reasonable limit
-                messages.error(request, "Quantity too large. Maximum allowed is 10,000 shares.")
-                return redirect('stocks')
-                
-        except (ValueError, TypeError):
-            messages.error(request, "Invalid quantity provided.")
-            return redirect('stocks')
-        
-        # Get current stock price (update from live data if possible)
-        current_data = stock_service.get_stock_data(stock.ticker)
-        if current_data:
-            purchase_price = Decimal(str(current_data['current_price']))
-            # Update stock price in database
-            stock.curr_price = purchase_price
-            stock.save()
-        else:
-            purchase_price = stock.curr_price
-            logger.warning(f"Could not fetch live price for {stock.ticker}, using stored price")
-        
-        # Calculate total cost
-        total_cost = purchase_price * purchase_quantity
-        
-        with transaction.atomic():
-            # Update or create user stock position
-            user_stock, created = UserStock.objects.get_or_create(
-                user=user,
-                stock=stock,
-                defaults={
-                    'purchase_price': purchase_price,
-                    'purchase_quantity': purchase_quantity
-                }
-            )
-            
-            if not created:
-                # Calculate weighted average price
-                total_quantity = user_stock.purchase_quantity + purchase_quantity
-                total_value = (user_stock.purchase_quantity * user_stock.purchase_price + 
-                             purchase_quantity * purchase_price)
-                user_stock.purchase_price = total_value / total_quantity
-                user_stock.purchase_quantity = total_quantity
-                user_stock.save()
-            
-            # Record transaction
-            Transaction.objects.create(
-                user=user,
-                stock_symbol=stock.ticker,
-                stock_name=stock.name,
-                quantity=purchase_quantity,
-                price=purchase_price,
-                type='BUY'
-            )
-            
-        # Send email notification asynchronously
-        try:
-            email_thread = threading.Thread(
-                target=send_email_async,
-                kwargs={
-                    "subject": "Stock Purchase Confirmation",
-                    "message": f"You successfully purchased {purchase_quantity} shares of {stock.name} at ${purchase_price:.2f} per share. Total: ${total_cost:.2f}",
-                    "from_email": None,
-                    "recipient_list": [user.email],
-                }
-            )
-            email_thread.daemon = True
-            email_thread.start()
-        except Exception as e:
-            logger.error(f"Failed to send email notification: {str(e)}")
-        
-        messages.success(request, f"Successfully purchased {purchase_quantity} shares of {stock.name} for ${total_cost:.2f}")
-        logger.info(f"User {user.username} bought {purchase_quantity} shares of {stock.ticker} at ${purchase_price}")
-        
+        trade, _ = trade_service.buy(user, stock, request.POST.get('quantity'), notify=True)
+    except TradeError as e:
+        messages.error(request, str(e))
+        return redirect('stocks')
     except Exception as e:
-        logger.error(f"Error in buy transaction for user {request.user.username}: {str(e)}")
+        logger.error(f"Error in buy transaction for user {user.username}: {str(e)}")
         messages.error(request, "An error occurred during the purchase. Please try again.")
+        return redirect('index')
     
+    total_cost = trade.price * trade.quantity
+    messages.success(request, f"Successfully purchased {trade.quantity} shares of {stock.name} for ${total_cost:.2f}")
     return redirect('index')
 
 
 
-def  sell(request , id) :
-    stock = get_object_or_404(Stocks, id=id)
+@login_required
+@require_POST
+def sell(request, id):
+    """Handle stock sale; the position is checked and updated atomically"""
+    stock = get_object_or_404(Stocks.objects.only('id', 'ticker', 'name', 'curr_price'), id=id)
     user = request.user
-    sell_quantity = int(request.POST.get('quantity'))
-    userStock  =  UserStock.objects.filter(stock  =  stock ,  user =  user).first()
-
-    if userStock.purchase_quantity <  sell_quantity :
-        messages.error(request, "Can't sell more than you own")
-        return redirect('market')
-
-    userStock.purchase_quantity -= sell_quantity
-    userStock.save()
-
-    Transaction.objects.create(
-        user=user,
-        stock_symbol=stock.ticker,
-        stock_name=stock.name,
-        quantity=sell_quantity,
-        price=stock.curr_price,
-        type='SELL'
-    )
+    
+    if request.POST.get('order_type', 'MARKET') != 'MARKET':
+        return _place_order(request, stock, 'SELL')
+    
+    try:
+        trade, _ = trade_service.sell(user, stock, request.POST.get('quantity'), notify=True)
+    except TradeError as e:
+        messages.error(request, str(e))
+        return redirect('index')
+    except Exception as e:
+        logger.error(f"Error in sell transaction for user {user.username}: {str(e)}")
+        messages.error(request, "An error occurred during the sale. Please try again.")
+        return redirect('index')
+    
+    messages.success(request, f"Successfully sold {trade.quantity} shares of {stock.name}")
+    return redirect('index')
 
-    t1 = threading.Thread(
-        target=send_email_async,
-        kwargs={
-            "subject": "Sell Option executed successfully",
-            "message": f"Your sale of stock {stock.name} was successful",
-            "from_email": None,
-            "recipient_list": [user.email],
-        }
-    )
-    t1.start()
 
+
+
+def _place_order(request, stock, side):
+    """Rest a limit or stop order from the buy/sell forms in the order book"""
+    try:
+        order = order_manager.place(
+            request.user, stock, side, request.POST.get('order_type'),
+            request.POST.get('quantity'), request.POST.get('trigger_price'),
+        )
+    except TradeError as e:
+        messages.error(request, str(e))
+        return redirect('stocks')
+    except Exception as e:
+        logger.error(f"Error placing order for user {request.user.username}: {str(e)}")
+        messages.error(request, "An error occurred while placing the order. Please try again.")
+        return redirect('index')
+    
+    if order.status == 'OPEN':
+        messages.success(request, f"{order.get_order_type_display()} order to {side.lower()} {order.quantity} "
+                                  f"shares of {stock.name} at ${order.trigger_price} placed")
+    elif order.status == 'FILLED':
+        messages.success(request, f"{order.get_order_type_display()} order filled immediately at ${order.fill_price}")
+    else:
+        messages.error(request, f"Order rejected: {order.status_reason}")
     return redirect('index')
 
 
+@login_required
+@require_POST
+def cancel_order(request, order_id):
+    if order_manager.cancel(request.user, order_id):
+        messages.success(request, "Order cancelled")
+    else:
+        messages.error(request, "Order not found or no longer open")
+    return redirect('index')
+
 
+@login_required
+def open_orders_api(request):
+    """The user's resting limit and stop orders"""
+    orders = (Order.objects.filter(user=request.user, status='OPEN')
+              .values('id', 'stock__ticker', 'side', 'order_type', 'quantity', 'trigger_price', 'created_at'))
+    return JsonResponse({
+        'success': True,
+        'orders': [
+            {
+                'id': order['id'],
+                'symbol': order['stock__ticker'],
+                'side': order['side'],
+                'order_type': order['order_type'],
+                'quantity': order['quantity'],
+                'trigger_price': float(order['trigger_price']),
+                'created_at': order['created_at'].isoformat(),
+            }
+            for order in orders
+        ],
+    })
 
-def send_email_async(subject  ,  message  ,  from_email , recipient_list ) :
-    send_mail(subject  =  subject ,  message =  message ,  from_email= from_email , recipient_list = recipient_list )
 
+def _json_leg(result):
+    return {key: float(value) if isinstance(value, Decimal) else value for key, value in result.items()}
+
+
+@login_required
+@require_POST
+def batch_orders_api(request):
+    """
+    Execute a list of market orders in one transaction.
+
+    Body: {"legs": [{"symbol": "AAPL", "side": "BUY", "quantity": 10}, ...]}.
+    Either every leg fills or none does; the response has one result per leg.
+    """
+    try:
+        legs = json.loads(request.body).get('legs')
+    except (ValueError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Body must be a JSON object with a "legs" list'}, status=400)
+    
+    user = request.user
+    try:
+        results = trade_service.execute_batch(user, legs, notify=True)
+    except BatchTradeError as e:
+        return JsonResponse({'success': False, 'error': str(e), 'results': [_json_leg(r) for r in e.results]},
+                            status=400)
+    except TradeError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error in batch orders for user {user.username}: {str(e)}")
+        return JsonResponse({'success': False, 'error': 'An error occurred while executing the orders'}, status=500)
+    
+    return JsonResponse({'success': True, 'results': [_json_leg(r) for r in results]})
+
+
+TRANSACTION_PAGE_SIZE = 50
+TRANSACTION_EXPORT_FIELDS = ['date', 'type', 'stock_symbol', 'stock_name', 'quantity', 'price']
+TRANSACTION_EXPORT_CHUNK = 2000
 
 
 @login_required
 def transaction_history(request):
-    transactions = Transaction.objects.filter(user=request.user).order_by("-date")
+    try:
+        page_size = min(max(int(request.GET.get('page_size', TRANSACTION_PAGE_SIZE)), 1), 200)
+        transactions, next_cursor = keyset_page(
+            Transaction.objects.filter(user=request.user),
+            cursor=request.GET.get('cursor'),
+            page_size=page_size,
+        )
+    except (ValueError, InvalidCursor):
+        return HttpResponseBadRequest("Invalid page")
+    
     context = {
-        "transactions": transactions
+        "transactions": transactions,
+        "next_cursor": next_cursor,
+        "is_first_page": not request.GET.get('cursor'),
+        "page_size": page_size,
     }
     return render(request, "transaction_history.html", context)
 
 
+class _Echo:
+    """File-like object whose write() just returns the value, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def _export_chunk(user, cursor):
+    """One keyset page of export rows as value tuples, plus the cursor for the next page"""
+    transactions, next_cursor = keyset_page(
+        Transaction.objects.filter(user=user).only(*TRANSACTION_EXPORT_FIELDS),
+        cursor=cursor,
+        page_size=TRANSACTION_EXPORT_CHUNK,
+    )
+    return [tuple(getattr(t, field) for field in TRANSACTION_EXPORT_FIELDS) for t in transactions], next_cursor
+
+
+@login_required
+def export_transactions(request):
+    """Stream the user's full transaction history as CSV or NDJSON with constant memory"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return HttpResponseBadRequest("format must be csv or ndjson")
+    
+    if export_format == 'csv':
+        writer = csv.writer(_Echo())
+        header = [writer.writerow(TRANSACTION_EXPORT_FIELDS)]
+        
+        def format_row(row):
+            date, *rest = row
+            return writer.writerow([date.isoformat(), *rest])
+        
+        content_type = 'text/csv'
+    else:
+        header = []
+        
+        def format_row(row):
+            date, *rest = row
+            record = dict(zip(TRANSACTION_EXPORT_FIELDS, [date.isoformat(), *rest]))
+            record['price'] = str(record['price'])
+            return json.dumps(record) + '\n'
+        
+        content_type = 'application/x-ndjson'
+    
+    if isinstance(request, ASGIRequest):
+        # Under ASGI Django drains a sync iterator with sync_to_async(list), holding the
+        # whole history in memory; an async iterator pulls one keyset page at a time
+        user = request.user
+        
+        async def stream():
+            for line in header:
+                yield line
+            cursor = None
+            while True:
+                rows, cursor = await sync_to_async(_export_chunk)(user, cursor)
+                for row in rows:
+                    yield format_row(row)
+                if cursor is None:
+                    break
+    else:
+        rows = (Transaction.objects.filter(user=request.user)
+                .order_by('-date', '-id')
+                .values_list(*TRANSACTION_EXPORT_FIELDS)
+                .iterator(chunk_size=TRANSACTION_EXPORT_CHUNK))
+        
+        def stream():
+            yield from header
+            for row in rows:
+                yield format_row(row)
+    
+    response = StreamingHttpResponse(stream(), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="transactions.{export_format}"'
+    return response
+
+
 
 
 @login_required
 def portfolio_dashboard(request):
     user = request.user
-    transactions = Transaction.objects.filter(user=user)
+
+    # One query over the materialized positions; cost grows with positions held, not trades made
+    positions = UserStock.objects.filter(user=user).select_related('stock').order_by('stock__ticker')
 
     portfolio = {}
-    for t in transactions:
-        if t.stock_symbol not in portfolio:
-            portfolio[t.stock_symbol] = {
-                'stock_name': t.stock_name,
-                'quantity': 0,
-                'invested_value': 0.0,
-                'current_price': 0.0, # This will be updated if live prices are integrated
-            }
-        if t.type == 'BUY':
-            portfolio[t.stock_symbol]['quantity'] += t.quantity
-            portfolio[t.stock_symbol]['invested_value'] += float(t.quantity * t.price)
-        elif t.type == 'SELL':
-            portfolio[t.stock_symbol]['quantity'] -= t.quantity
-            portfolio[t.stock_symbol]['invested_value'] -= float(t.quantity * t.price) # This might need more sophisticated calculation for average cost
-
-    # Remove stocks with zero quantity (if any after buy/sell)
-    portfolio = {symbol: data for symbol, data in portfolio.items() if data['quantity'] > 0}
-
-    # Get current live prices for portfolio stocks
-    for symbol, data in portfolio.items():
-        try:
-            # Get live price data
-            stock_data = stock_service.get_stock_data(symbol)
-            if stock_data:
-                data['current_price'] = stock_data['current_price']
-                data['day_change'] = stock_data.get('day_change', 0)
-                data['day_change_percent'] = stock_data.get('day_change_percent', 0)
-                data['sector'] = stock_data.get('sector', 'N/A')
-                
-                # Update database price
-                stock = Stocks.objects.filter(ticker=symbol).first()
-                if stock:
-                    stock.curr_price = Decimal(str(stock_data['current_price']))
-                    stock.last_updated = timezone.now()
-                    stock.save()
-            else:
-                # Fallback to database price
-                stock = Stocks.objects.filter(ticker=symbol).first()
-                data['current_price'] = float(stock.curr_price) if stock else 0.0
-                data['day_change'] = 0
-                data['day_change_percent'] = 0
-                data['sector'] = stock.sector if stock else 'N/A'
-        except Exception as e:
-            logger.error(f"Error fetching live price for {symbol}: {str(e)}")
-            # Use database price as fallback
-            stock = Stocks.objects.filter(ticker=symbol).first()
-            data['current_price'] = float(stock.curr_price) if stock else 0.0
-            data['day_change'] = 0
-            data['day_change_percent'] = 0
-            data['sector'] = stock.sector if stock else 'N/A'
-            
+    total_realized_pnl = 0.0
+    for position in positions:
+        total_realized_pnl += float(position.realized_pnl)
+        if position.purchase_quantity <= 0:
+            continue
+
+        stock = position.stock
+        data = {
+            'stock_name': stock.name,
+            'quantity': position.purchase_quantity,
+            'invested_value': float(position.cost_basis),
+            'realized_pnl': float(position.realized_pnl),
+            'current_price': float(stock.curr_price),
+            'day_change': float(stock.day_change),
+            'day_change_percent': float(stock.day_change_percent),
+            'sector': stock.sector or 'N/A',
+            'last_updated': stock.last_updated,
+        }
         data['current_value'] = data['quantity'] * data['current_price']
         data['gain_loss'] = data['current_value'] - data['invested_value']
         data['gain_loss_percent'] = (data['gain_loss'] / data['invested_value']) * 100 if data['invested_value'] > 0 else 0
+        portfolio[stock.ticker] = data
 
     total_portfolio_value = sum(item['current_value'] for item in portfolio.values())
     total_invested_capital = sum(item['invested_value'] for item in portfolio.values())
@@ -464,78 +529,51 @@ def portfolio_dashboard(request):
         'portfolio': portfolio,
         'total_portfolio_value': total_portfolio_value,
         'total_invested_capital': total_invested_capital,
+        'total_realized_pnl': total_realized_pnl,
     }
     return render(request, 'portfolio_dashboard.html', context)
 
 
+def _load_watched_stocks(symbols, quotes=None):
+    """
+    Load the stocks behind a watchlist in one query and overlay any fresher
+    cached quotes (or the given ``quotes``); changed rows are queued with the
+    write-behind persister.
+    """
+    stocks_by_ticker = {stock.ticker: stock for stock in Stocks.objects.filter(ticker__in=symbols)}
+    if quotes is None:
+        quotes = stock_service.get_cached_stocks(list(stocks_by_ticker))
+    quotes = {symbol: stock_data for symbol, stock_data in quotes.items() if symbol in stocks_by_ticker}
+    
+    for symbol, stock_data in quotes.items():
+        price_persister.record(stocks_by_ticker[symbol], stock_data)
+    
+    return stocks_by_ticker, quotes
+
+
 @login_required
 def watchlist_view(request):
-    watchlist_items = Watchlist.objects.filter(user=request.user)
+    watchlist_items = list(Watchlist.objects.filter(user=request.user))
+    stocks_by_ticker, quotes = _load_watched_stocks([item.stock_symbol for item in watchlist_items])
     
     # Enhance watchlist items with current prices and additional data
     enhanced_watchlist = []
     for item in watchlist_items:
-        try:
-            # Get the stock from database
-            stock = Stocks.objects.filter(ticker=item.stock_symbol).first()
-            
-            # Get live price data
-            stock_data = stock_service.get_stock_data(item.stock_symbol)
-            
-            if stock_data:
-                # Update stock price in database if we got live data
-                if stock:
-                    stock.curr_price = Decimal(str(stock_data['current_price']))
-                    stock.last_updated = timezone.now()
-                    stock.save()
-                
-                enhanced_item = {
-                    'id': item.id,
-                    'stock_symbol': item.stock_symbol,
-                    'stock_name': item.stock_name,
-                    'current_price': stock_data['current_price'],
-                    'previous_close': stock_data.get('previous_close', stock_data['current_price']),
-                    'day_change': stock_data.get('day_change', 0),
-                    'day_change_percent': stock_data.get('day_change_percent', 0),
-                    'volume': stock_data.get('volume', 0),
-                    'market_cap': stock_data.get('market_cap', 0),
-                    'sector': stock_data.get('sector', 'N/A'),
-                    'source': stock_data.get('source', 'API')
-                }
-            else:
-                # Fallback to stored data if live data is not available
-                enhanced_item = {
-                    'id': item.id,
-                    'stock_symbol': item.stock_symbol,
-                    'stock_name': item.stock_name,
-                    'current_price': float(stock.curr_price) if stock else 0.0,
-                    'previous_close': float(stock.curr_price) if stock else 0.0,
-                    'day_change': 0,
-                    'day_change_percent': 0,
-                    'volume': stock.volume if stock else 0,
-                    'market_cap': stock.market_cap if stock else 0,
-                    'sector': stock.sector if stock else 'N/A',
-                    'source': 'Database (Offline)'
-                }
-            
-            enhanced_watchlist.append(enhanced_item)
-            
-        except Exception as e:
-            logger.error(f"Error fetching data for watchlist item {item.stock_symbol}: {str(e)}")
-            # Add basic item even if there's an error
-            enhanced_watchlist.append({
-                'id': item.id,
-                'stock_symbol': item.stock_symbol,
-                'stock_name': item.stock_name,
-                'current_price': 0.0,
-                'previous_close': 0.0,
-                'day_change': 0,
-                'day_change_percent': 0,
-                'volume': 0,
-                'market_cap': 0,
-                'sector': 'Error',
-                'source': 'Error'
-            })
+        stock = stocks_by_ticker.get(item.stock_symbol)
+        enhanced_watchlist.append({
+            'id': item.id,
+            'stock_symbol': item.stock_symbol,
+            'stock_name': item.stock_name,
+            'current_price': float(stock.curr_price) if stock else 0.0,
+            'previous_close': float(stock.previous_close or stock.curr_price) if stock else 0.0,
+            'day_change': float(stock.day_change) if stock else 0,
+            'day_change_percent': float(stock.day_change_percent) if stock else 0,
+            'volume': stock.volume if stock else 0,
+            'market_cap': stock.market_cap if stock else 0,
+            'sector': stock.sector if stock else 'N/A',
+            'last_updated': stock.last_updated if stock else None,
+            'source': quotes[item.stock_symbol].get('source', 'API') if item.stock_symbol in quotes else 'Database'
+        })
     
     context = {
         "watchlist_items": enhanced_watchlist,
@@ -558,37 +596,80 @@ def remove_from_watchlist(request, stock_symbol):
     return redirect("watchlist_view")
 
 
-@login_required
-def get_stock_price_api(request, symbol):
-    """API endpoint to get real-time stock price data"""
+def _quote_validators(versions):
+    """
+    (ETag, Last-Modified) for a response built from quotes, given one
+    (symbol, last_updated, source) triple per quote it contains.
+    """
+    digest = hashlib.sha1(repr(sorted(versions, key=lambda version: version[0])).encode()).hexdigest()[:20]
+    last_modified = max((updated for _, updated, _ in versions if updated), default=None)
+    return f'W/"{digest}"', last_modified
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Browsers may keep the body but must revalidate on every poll
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _not_modified(request, etag, last_modified):
+    """A 304 response when the client's copy is current, else None"""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    return _set_validators(response, etag, last_modified) if response is not None else None
+
+
+def async_login_required(view):
+    """login_required for async views; the lazy request.user is resolved off the event loop"""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@async_login_required
+async def get_stock_price_api(request, symbol):
+    """
+    API endpoint to get the latest stored stock price data.
+
+    ?live=1 asks the providers for a new quote (bounded by PROVIDER_TIMEOUT)
+    instead of only using what the refresher has cached. Responses carry an
+    ETag and Last-Modified, so a poll that finds no change gets a bodiless 304.
+    """
+    symbol = symbol.upper()
     try:
-        stock_data = stock_service.get_stock_data(symbol.upper())
+        stock = await Stocks.objects.filter(ticker=symbol).afirst()
         
-        if stock_data:
-            # Update database
-            stock = Stocks.objects.filter(ticker=symbol.upper()).first()
-            if stock:
-                stock.curr_price = Decimal(str(stock_data['current_price']))
-                stock.last_updated = timezone.now()
-                stock.save()
+        if stock:
+            if request.GET.get('live') == '1':
+                stock_data = await stock_service.aget_stock_data(symbol)
+            else:
+                # A fresher quote may already be cached by the refresher
+                stock_data = await sync_to_async(stock_service.get_cached_stock_data)(symbol)
+            if stock_data:
+                await sync_to_async(price_persister.record)(stock, stock_data)
             
-            return JsonResponse({
-                'success': True,
-                'symbol': stock_data['symbol'],
-                'current_price': stock_data['current_price'],
-                'previous_close': stock_data.get('previous_close', stock_data['current_price']),
-                'day_change': stock_data.get('day_change', 0),
-                'day_change_percent': stock_data.get('day_change_percent', 0),
-                'volume': stock_data.get('volume', 0),
-                'market_cap': stock_data.get('market_cap', 0),
-                'last_updated': timezone.now().isoformat(),
-                'source': stock_data.get('source', 'API')
-            })
+            source = stock_data.get('source', 'API') if stock_data else 'Database'
+            etag, last_modified = _quote_validators([(symbol, stock.last_updated, source)])
+            not_modified = _not_modified(request, etag, last_modified)
+            if not_modified:
+                return not_modified
+            
+            payload = stock.quote_payload()
+            payload['source'] = source
+            
+            return _set_validators(JsonResponse({'success': True, **payload}), etag, last_modified)
         else:
             return JsonResponse({
                 'success': False,
                 'error': 'Could not fetch stock data',
-                'symbol': symbol.upper()
+                'symbol': symbol
             }, status=404)
             
     except Exception as e:
@@ -596,49 +677,166 @@ def get_stock_price_api(request, symbol):
         return JsonResponse({
             'success': False,
             'error': str(e),
-            'symbol': symbol.upper()
+            'symbol': symbol
         }, status=500)
 
 
 @login_required
-def update_watchlist_prices_api(request):
-    """API endpoint to update all watchlist prices at once"""
+def suggest_stocks_api(request):
+    """Typeahead suggestions for ?q=, served from the in-memory autocomplete index"""
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    
+    return JsonResponse({
+        'success': True,
+        'query': query,
+        'suggestions': autocomplete_index.suggest(query, limit),
+    })
+
+
+def _json_series(values):
+    """Convert an indicator array to a JSON list, with NaN (warm-up bars) as null"""
+    return [None if value != value else round(float(value), 6) for value in values]
+
+
+@login_required
+def get_stock_indicators_api(request, symbol):
+    """
+    API endpoint for technical indicators over stored price history.
+
+    ?indicators=sma,rsi&period=1y&interval=1d; per-indicator parameters are
+    passed as <indicator>_<param>, e.g. sma_window=50 or macd_fast=8.
+    """
+    symbol = symbol.upper()
+    names = [name for name in request.GET.get('indicators', 'sma,ema,rsi').split(',') if name]
+    unknown = [name for name in names if name not in INDICATORS]
+    if not names or unknown:
+        return JsonResponse({
+            'success': False,
+            'error': f"Unknown indicators: {', '.join(unknown)}" if unknown else 'No indicators requested',
+            'available': sorted(INDICATORS),
+            'symbol': symbol
+        }, status=400)
+    
+    period = request.GET.get('period', '1y')
+    interval = request.GET.get('interval', '1d')
+    if period not in StockDataService.HISTORY_PERIODS or interval not in StockDataService.HISTORY_INTERVALS:
+        return JsonResponse({
+            'success': False,
+            'error': 'Unsupported period or interval',
+            'periods': sorted(StockDataService.HISTORY_PERIODS),
+            'intervals': sorted(StockDataService.HISTORY_INTERVALS),
+            'symbol': symbol
+        }, status=400)
+    
+    requested = {
+        name: {
+            param: request.GET[f"{name}_{param}"]
+            for param in INDICATORS[name].defaults if f"{name}_{param}" in request.GET
+        }
+        for name in names
+    }
+    
+    try:
+        result = indicator_service.get_indicators(symbol, requested, period=period, interval=interval)
+    except (KeyError, ValueError) as e:
+        return JsonResponse({'success': False, 'error': str(e), 'symbol': symbol}, status=400)
+    except Exception as e:
+        logger.error(f"Indicator API error for {symbol}: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e), 'symbol': symbol}, status=500)
+    
+    if result is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'No price history available',
+            'symbol': symbol
+        }, status=404)
+    
+    return JsonResponse({
+        'success': True,
+        'symbol': symbol,
+        'timestamps': [int(ts) for ts in result['timestamps']],
+        'indicators': {
+            name: {
+                'params': indicator['params'],
+                'values': {output: _json_series(values) for output, values in indicator['values'].items()},
+            }
+            for name, indicator in result['indicators'].items()
+        },
+    })
+
+
+@async_login_required
+async def update_watchlist_prices_api(request):
+    """
+    API endpoint to return the stored prices for every watchlist item.
+
+    ?live=1 fetches every watched quote from the providers concurrently
+    first; symbols that time out keep their stored price.
+
+    Responses carry an ETag and Last-Modified (304 when nothing changed) and
+    a ``cursor``; passing it back as ?since=<cursor> returns only the quotes
+    updated after that response. A delta with nothing in it hands back the
+    cursor it was given, so an unchanged poll repeats the same URL and the
+    browser's conditional request gets a 304. The window is widened by a few
+    seconds so rows written slightly out of order are not missed; clients
+    should treat a repeated quote as a no-op.
+    """
+    since = None
+    if request.GET.get('since'):
+        try:
+            since = decode_cursor(request.GET['since'])[0]
+        except InvalidCursor as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
     try:
-        watchlist_items = Watchlist.objects.filter(user=request.user)
+        watchlist_items = [item async for item in Watchlist.objects.filter(user=request.user)]
+        symbols = [item.stock_symbol for item in watchlist_items]
+        live_quotes = await stock_service.aget_multiple_stocks(symbols) if request.GET.get('live') == '1' else None
+        stocks_by_ticker, quotes = await sync_to_async(_load_watched_stocks)(symbols, live_quotes)
+        
+        sources = {
+            ticker: quotes[ticker].get('source', 'API') if ticker in quotes else 'Database'
+            for ticker in stocks_by_ticker
+        }
+        etag, last_modified = _quote_validators([
+            (symbol, stocks_by_ticker[symbol].last_updated if symbol in stocks_by_ticker else None, sources.get(symbol))
+            for symbol in symbols
+        ])
+        not_modified = _not_modified(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+        
         updated_prices = []
         errors = []
-        
         for item in watchlist_items:
-            try:
-                stock_data = stock_service.get_stock_data(item.stock_symbol)
-                if stock_data:
-                    # Update database
-                    stock = Stocks.objects.filter(ticker=item.stock_symbol).first()
-                    if stock:
-                        stock.curr_price = Decimal(str(stock_data['current_price']))
-                        stock.last_updated = timezone.now()
-                        stock.save()
-                    
-                    updated_prices.append({
-                        'symbol': stock_data['symbol'],
-                        'current_price': stock_data['current_price'],
-                        'day_change': stock_data.get('day_change', 0),
-                        'day_change_percent': stock_data.get('day_change_percent', 0),
-                        'volume': stock_data.get('volume', 0)
-                    })
-                else:
-                    errors.append(f"Could not fetch data for {item.stock_symbol}")
-            except Exception as e:
-                errors.append(f"Error updating {item.stock_symbol}: {str(e)}")
+            stock = stocks_by_ticker.get(item.stock_symbol)
+            if stock:
+                if since and stock.last_updated and stock.last_updated <= since - POLL_OVERLAP:
+                    continue  # Unchanged since the client's cursor
+                payload = stock.quote_payload()
+                payload['source'] = sources[stock.ticker]
+                updated_prices.append(payload)
+            else:
+                errors.append(f"Could not fetch data for {item.stock_symbol}")
         
-        return JsonResponse({
+        # Delta cursors only carry the response time; the id slot is unused.
+        # An empty delta keeps the old cursor so the next poll's URL is unchanged.
+        now = timezone.now()
+        cursor = request.GET['since'] if since and not updated_prices else encode_cursor(now, 0)
+        return _set_validators(JsonResponse({
             'success': True,
             'updated_count': len(updated_prices),
             'error_count': len(errors),
             'prices': updated_prices,
             'errors': errors,
-            'timestamp': timezone.now().isoformat()
-        })
+            'cursor': cursor,
+            'delta': since is not None,
+            'timestamp': now.isoformat()
+        }), etag, last_modified)
         
     except Exception as e:
         logger.error(f"Watchlist API error: {str(e)}")
@@ -648,3 +846,49 @@ def update_watchlist_prices_api(request):
         }, status=500)
 
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _watched_quotes(user):
+    symbols = list(Watchlist.objects.filter(user=user).values_list('stock_symbol', flat=True))
+    return symbols, [stock.quote_payload() for stock in Stocks.objects.filter(ticker__in=symbols)]
+
+
+@async_login_required
+async def watchlist_stream(request):
+    """
+    Server-Sent Events stream of price changes for the user's watchlist.
+
+    Sends the current quotes once, then a ``prices`` event whenever the shared
+    price broadcaster sees a watched quote change, with keep-alive comments
+    in between. The stream ends after STREAM_MAX_AGE seconds and the browser
+    reconnects.
+    """
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would buffer the whole stream; the page falls back to polling
+        return HttpResponse("Streaming requires an ASGI server", status=503, content_type='text/plain')
+    
+    api_settings = getattr(settings, 'STOCK_API_SETTINGS', {})
+    heartbeat = api_settings.get('STREAM_HEARTBEAT', 15)
+    max_age = api_settings.get('STREAM_MAX_AGE', 300)
+    symbols, initial = await sync_to_async(_watched_quotes)(request.user)
+    
+    async def events():
+        subscription = price_broadcaster.subscribe(symbols)
+        try:
+            yield "retry: 5000\n\n"
+            yield _sse('prices', initial)
+            deadline = asyncio.get_running_loop().time() + max_age
+            while asyncio.get_running_loop().time() < deadline:
+                batch = await subscription.get(timeout=heartbeat)
+                yield _sse('prices', list(batch.values())) if batch else ": keep-alive\n\n"
+        finally:
+            price_broadcaster.unsubscribe(subscription)
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let a proxy buffer the stream
+    return response
+
+
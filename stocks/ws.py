@@ -0,0 +1,172 @@
+"""
+WebSocket market-data hub, served by marketplace/asgi.py at /ws/prices/.
+
+Protocol (JSON text frames):
+
+* client: {"action": "subscribe", "symbols": ["AAPL", ...]}
+          {"action": "unsubscribe", "symbols": ["AAPL", ...]}
+* server: {"type": "prices", "data": {"AAPL": {"p": 101.5, "v": 123}}}
+          {"type": "error", "error": "..."}
+
+Price frames carry, per symbol, only the fields that changed since the last
+frame sent on that connection (the first frame for a symbol has them all):
+p price, pc previous close, c day change, cp day change %, v volume,
+t last updated.
+
+Updates come from the shared price_broadcaster, which coalesces per
+connection: while a slow client is still being sent one frame, newer quotes
+replace older ones and the next frame carries only the latest values.
+"""
+import asyncio
+import json
+import logging
+from http.cookies import SimpleCookie
+from importlib import import_module
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.http.request import split_domain_port, validate_host
+
+from .models import Stocks
+from .streaming import PriceBroadcaster, Subscription, price_broadcaster
+
+logger = logging.getLogger(__name__)
+
+# Compact frame keys -> quote_payload() fields
+FRAME_FIELDS = {
+    'p': 'current_price',
+    'pc': 'previous_close',
+    'c': 'day_change',
+    'cp': 'day_change_percent',
+    'v': 'volume',
+    't': 'last_updated',
+}
+
+
+def _session_user_id(session_key: str) -> Optional[str]:
+    store = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    return store.get(SESSION_KEY)
+
+
+def _load_quotes(symbols):
+    return [stock.quote_payload() for stock in Stocks.objects.filter(ticker__in=symbols)]
+
+
+class MarketDataHub:
+    """ASGI application for price subscriptions over WebSocket"""
+
+    path = '/ws/prices/'
+
+    def __init__(self, broadcaster: PriceBroadcaster, require_login: bool = True,
+                 max_symbols: int = 200, load_quotes=_load_quotes):
+        self.broadcaster = broadcaster
+        self.require_login = require_login
+        self.max_symbols = max_symbols
+        self.load_quotes = load_quotes
+        self.stats = {'connections': 0, 'frames': 0}
+
+    async def __call__(self, scope, receive, send):
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+        if not await self._allowed(scope):
+            await send({'type': 'websocket.close', 'code': 4403})
+            return
+        await send({'type': 'websocket.accept'})
+
+        self.stats['connections'] += 1
+        subscription = self.broadcaster.subscribe(())
+        sent: Dict[str, Dict[str, Any]] = {}  # Last values sent per symbol
+        writer = asyncio.ensure_future(self._write(subscription, sent, send))
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message['type'] == 'websocket.receive':
+                    error = await self._handle(subscription, sent, message.get('text'))
+                    if error:
+                        await send({'type': 'websocket.send', 'text': json.dumps({'type': 'error', 'error': error})})
+        finally:
+            writer.cancel()
+            self.broadcaster.unsubscribe(subscription)
+            self.stats['connections'] -= 1
+
+    async def _allowed(self, scope) -> bool:
+        headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+        # Browsers always send Origin; refuse pages served from other hosts
+        origin = headers.get('origin')
+        if origin:
+            host, _ = split_domain_port(urlsplit(origin).netloc)
+            if not validate_host(host, settings.ALLOWED_HOSTS):
+                return False
+
+        if not self.require_login:
+            return True
+        cookie = SimpleCookie(headers.get('cookie', ''))
+        session = cookie.get(settings.SESSION_COOKIE_NAME)
+        if session is None:
+            return False
+        return await sync_to_async(_session_user_id)(session.value) is not None
+
+    async def _handle(self, subscription: Subscription, sent: Dict[str, Dict[str, Any]],
+                      text: Optional[str]) -> Optional[str]:
+        """Apply one client message; returns an error message for bad input"""
+        try:
+            message = json.loads(text or '')
+            action = message['action']
+            symbols = {str(symbol).upper() for symbol in message['symbols']}
+        except (ValueError, TypeError, KeyError):
+            return 'Expected {"action": "subscribe" | "unsubscribe", "symbols": [...]}'
+
+        if action == 'unsubscribe':
+            self.broadcaster.update_symbols(subscription, remove=symbols)
+            for symbol in symbols:
+                sent.pop(symbol, None)  # A later subscribe starts with a full frame
+            return None
+        if action != 'subscribe':
+            return f'Unknown action: {action}'
+
+        symbols -= subscription.symbols
+        if len(subscription.symbols) + len(symbols) > self.max_symbols:
+            return f'At most {self.max_symbols} symbols per connection'
+        self.broadcaster.update_symbols(subscription, add=symbols)
+
+        # Seed the new symbols from the stored quotes; the writer sends them as
+        # full frames. Loading after subscribing means a change published in
+        # between is either in this load or offered after it.
+        if symbols:
+            quotes = await sync_to_async(self.load_quotes)(list(symbols))
+            if quotes:
+                subscription.offer(quotes)
+        return None
+
+    async def _write(self, subscription: Subscription, sent: Dict[str, Dict[str, Any]], send):
+        while True:
+            batch = await subscription.get(timeout=None)
+            frame = {}
+            for symbol, quote in batch.items():
+                if symbol not in subscription.symbols:
+                    continue
+                values = {key: quote.get(field) for key, field in FRAME_FIELDS.items()}
+                previous = sent.get(symbol)
+                if previous is None:
+                    delta = values
+                else:
+                    delta = {key: value for key, value in values.items() if previous[key] != value}
+                if delta:
+                    frame[symbol] = delta
+                    sent[symbol] = values
+            if frame:
+                self.stats['frames'] += 1
+                await send({'type': 'websocket.send', 'text': json.dumps(
+                    {'type': 'prices', 'data': frame}, separators=(',', ':'))})
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
+
+
+market_data_hub = MarketDataHub(price_broadcaster)